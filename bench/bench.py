@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the hot paths: diode curve lookup, part library loading, IV
+log parsing, model fitting, and layout generation
+
+Each benchmark sets up its data first (synthetic, from synth.py, or the
+board file), then times its hot path a few times and keeps the best, and
+finally runs it once more under tracemalloc for the peak memory it
+allocates. MatrixTraces runs against the recording pcbnew stub in this
+directory, so no KiCad is needed, and nothing touches the network.
+
+Results are compared against the stored baseline, and anything slower or
+bigger than the tolerance is flagged as a regression, which also makes the
+exit status nonzero. Timings only mean something on the machine they were
+made on, so the baseline is never committed: the first run on a machine
+stores its results as the baseline, and --save replaces it. Store one
+before making a change, then compare after.
+
+To run:
+
+cd bench
+python bench.py                 # first run stores a baseline, later ones compare against it
+python bench.py --save          # store a new baseline
+python bench.py -k fit          # only benchmarks with "fit" in the name
+python bench.py --iv-size 4G    # parse a multi-GB IV log
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from typing import Callable, NamedTuple
+
+# Plots must never open a window
+os.environ.setdefault("MPLBACKEND","Agg")
+
+here=os.path.dirname(os.path.abspath(__file__))
+top=os.path.join(here,"..")
+sys.path.append(top)
+sys.path.append(os.path.join(top,"kicad"))
+
+import numpy as np
+
+import synth
+
+boardFile=os.path.join(top,"kicad","Precision23.kicad_pcb")
+baselineFile=os.path.join(here,"baseline.json")
+# Slower or bigger than baseline by more than these fractions is a regression
+timeTolerance=0.25
+memoryTolerance=0.10
+# Differences smaller than these are noise, whatever the ratio
+timeFloor=0.002
+memoryFloor=64<<10
+
+
+class Bench(NamedTuple):
+    """
+    One benchmark
+
+    :param name: Name in reports and the baseline
+    :param setup: Function of the command line arguments that prepares the data,
+                  and returns the function to time. That function may return a
+                  dict of details worth reporting, IE how many fits converged.
+    :param repeat: Number of timed runs, the best is kept
+    :param warmup: Do an untimed run first, so first-call costs like imports and caches don't count
+    """
+    name:str
+    setup:Callable
+    repeat:int
+    warmup:bool
+
+
+benches=[]
+
+
+def bench(name:str,*,repeat:int=5,warmup:bool=True):
+    """
+    Decorator that registers a setup function as a benchmark
+    """
+    def register(setup):
+        benches.append(Bench(name,setup,repeat,warmup))
+        return setup
+    return register
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Swallow the output of the code under test
+    """
+    with contextlib.redirect_stdout(io.StringIO()),warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+@bench("diode_iv_vector")
+def diode_iv_vector(args):
+    import diode
+    V=np.linspace(0,2.04,1_000_000)
+    return lambda:diode.Yellow.Iv(V)
+
+
+@bench("diode_iv_scalar")
+def diode_iv_scalar(args):
+    import diode
+    V=np.linspace(0,2.04,10_000).tolist()
+
+    def run():
+        for v in V:
+            diode.Yellow.Iv(v)
+    return run
+
+
+@bench("diode_vi_vector")
+def diode_vi_vector(args):
+    import diode
+    I=np.linspace(0,0.0298,1_000_000)
+    return lambda:diode.Yellow.Vi(I)
+
+
+@bench("partlib_open")
+def partlib_open(args):
+    import partlib
+    filename=os.path.join(args.scratch,"parts.p23lib")
+    partlib.build(partlib.sources(),filename)
+
+    def run():
+        # A fresh open every time, as a new process would see it
+        lib=partlib.Library(filename)
+        for name in lib.names():
+            lib[name].Vi(0.02)
+        return {"parts":len(lib)}
+    return run
+
+
+@bench("iv_parse",repeat=1,warmup=False)
+def iv_parse(args):
+    import iv
+    filename=os.path.join(args.scratch,"iv.csv")
+    size=synth.iv_log(filename,synth.parse_size(args.iv_size))
+
+    def run():
+        vcmds=iv.read_logs([filename])[0]
+        return {"bytes":size,"lines":sum(len(v) for v in vcmds.values())}
+    return run
+
+
+@bench("spice_curve_fit",repeat=3)
+def spice_curve_fit(args):
+    import spice
+    devices=synth.population(args.devices)
+
+    def run():
+        # The same call spice.py makes, from its default starting guess
+        converged=0
+        with quiet():
+            for xdata,logydata,_ in devices:
+                try:
+                    spice.curve_fit(spice.func,xdata,logydata,p0=(1e-14,1,10),maxfev=1000,full_output=True)
+                    converged+=1
+                except RuntimeError:
+                    pass
+        return {"devices":len(devices),"converged":converged}
+    return run
+
+
+@bench("spice_fit_robust",repeat=3)
+def spice_fit_robust(args):
+    import spice
+    devices=synth.population(args.devices)
+
+    def run():
+        converged=0
+        with quiet():
+            for xdata,logydata,_ in devices:
+                converged+=bool(spice.fit_robust(xdata,logydata)[1].success)
+        return {"devices":len(devices),"converged":converged}
+    return run
+
+
+@bench("spice_dc_solve")
+def spice_dc_solve(args):
+    import spice
+    Vsupply=np.linspace(0,5,1000)[:,None]
+    Rseries=np.linspace(0,1000,1000)[None,:]
+    return lambda:spice.dc_solve(Vsupply,*synth.typicalLED,Rseries=Rseries)
+
+
+@bench("layout_plan")
+def layout_plan(args):
+    import LayoutPlan
+    return lambda:LayoutPlan.layout()
+
+
+@bench("clearance_check")
+def clearance_check(args):
+    import Clearance
+    import LayoutPlan
+    plan=LayoutPlan.layout()
+    return lambda:Clearance.check(plan)
+
+
+@bench("pcbfile_parse",repeat=3)
+def pcbfile_parse(args):
+    import PcbFile
+    return lambda:PcbFile.read(boardFile)
+
+
+@bench("plan_writer_merge",repeat=3)
+def plan_writer_merge(args):
+    import LayoutPlan
+    import PcbFile
+    import PlanWriter
+    plan=LayoutPlan.layout()
+    with open(boardFile,"rt") as inf:
+        text=inf.read()
+    # Merging changes the document, so every run starts from a fresh parse
+    return lambda:PlanWriter.merge(PcbFile.parse(text),plan)
+
+
+def matrix_traces():
+    """
+    MatrixTraces on the stub board, loaded from the board file. Importing it
+    runs the whole layout once, so every timed run is a rerun.
+    """
+    import pcbnew
+    if "MatrixTraces" not in sys.modules:
+        pcbnew.load(boardFile)
+        with quiet():
+            import MatrixTraces
+    return sys.modules["MatrixTraces"],pcbnew
+
+
+def board_calls(pcbnew):
+    """
+    Details of what a run asked of the stub board
+    """
+    calls=dict(pcbnew.calls)
+    pcbnew.calls.clear()
+    return {"board_calls":sum(calls.values()),"added":calls.get("BOARD.Add",0),
+            "removed":calls.get("BOARD.Remove",0),"refreshes":calls.get("Refresh",0)}
+
+
+@bench("matrixtraces_run",repeat=3)
+def matrixtraces_run(args):
+    MatrixTraces,pcbnew=matrix_traces()
+
+    def run():
+        pcbnew.calls.clear()
+        with quiet():
+            MatrixTraces.run()
+        return board_calls(pcbnew)
+    return run
+
+
+@bench("matrixtraces_reconcile",repeat=3)
+def matrixtraces_reconcile(args):
+    MatrixTraces,pcbnew=matrix_traces()
+
+    def run():
+        pcbnew.calls.clear()
+        with quiet():
+            MatrixTraces.reconcile()
+        return board_calls(pcbnew)
+    return run
+
+
+def measure(b:Bench,args,*,memory:bool=True):
+    """
+    Run one benchmark
+
+    :param memory: Also measure peak memory
+    :return: Dict of best and median time in seconds, peak traced memory in bytes, and details
+    """
+    run=b.setup(args)
+    if b.warmup:
+        run()
+    times=[]
+    detail=None
+    for _ in range(max(1,b.repeat if args.repeat is None else args.repeat)):
+        gc.collect()
+        t0=time.perf_counter()
+        detail=run()
+        times.append(time.perf_counter()-t0)
+    peak=None
+    if memory and not args.no_memory:
+        gc.collect()
+        tracemalloc.start()
+        run()
+        peak=tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"time":min(times),"median":float(np.median(times)),"peak":peak,"detail":detail if isinstance(detail,dict) else {}}
+
+
+def compare(name:str,result:dict,baseline:dict):
+    """
+    Compare one result against its baseline
+
+    :return: Tuple of (text,regressed)
+    """
+    base=baseline.get(name)
+    if base is None:
+        return "new",False
+    notes=[]
+    regressed=False
+    ratio=result["time"]/base["time"] if base["time"]>0 else 1.0
+    if ratio>1+timeTolerance and result["time"]-base["time"]>timeFloor:
+        notes.append(f"SLOWER x{ratio:.2f}")
+        regressed=True
+    elif ratio<1-timeTolerance and base["time"]-result["time"]>timeFloor:
+        notes.append(f"faster x{1/ratio:.2f}")
+    if result["peak"] is not None and base.get("peak"):
+        mratio=result["peak"]/base["peak"]
+        if mratio>1+memoryTolerance and result["peak"]-base["peak"]>memoryFloor:
+            notes.append(f"BIGGER x{mratio:.2f}")
+            regressed=True
+        elif mratio<1-memoryTolerance and base["peak"]-result["peak"]>memoryFloor:
+            notes.append(f"smaller x{1/mratio:.2f}")
+    return " ".join(notes) or "ok",regressed
+
+
+def environment(args):
+    """
+    What a baseline was measured on and with
+    """
+    return {"python":platform.python_version(),"numpy":np.__version__,"machine":platform.machine(),
+            "params":{"iv_size":args.iv_size,"devices":args.devices}}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench.py')
+    parser.add_argument('-k', '--keyword', type=str, default=None, help='Only run benchmarks with this in their name')
+    parser.add_argument('-l', '--list', help='List the benchmarks and exit', action="store_true")
+    parser.add_argument('--save', help='Store the results as the new baseline', action="store_true")
+    parser.add_argument('--baseline', type=str, default=baselineFile,
+                        help='Baseline file, made on the first run if missing (default = baseline.json next to this script)')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Also write the results as JSON here')
+    parser.add_argument('-r', '--repeat', type=int, default=None, help='Timed runs of every benchmark')
+    parser.add_argument('--no-memory', help="Don't measure peak memory", action="store_true")
+    parser.add_argument('--iv-size', type=str, default="16M", help='Size of the synthetic IV log (default = 16M)')
+    parser.add_argument('--devices', type=int, default=20, help='Devices in the fitting population (default = 20)')
+    args = parser.parse_args()
+    selected=[b for b in benches if args.keyword is None or args.keyword in b.name]
+    if args.list:
+        for b in selected:
+            print(b.name)
+        return
+    baseline={}
+    if not os.path.exists(args.baseline) and not args.save:
+        print(f"No baseline yet, this run will be stored as the baseline in {args.baseline}")
+        args.save=True
+    if not args.save:
+        with open(args.baseline,"rt") as inf:
+            stored=json.load(inf)
+        baseline=stored["results"]
+        current=environment(args)
+        for key in ("params","python","numpy","machine"):
+            if stored.get(key)!=current[key]:
+                print(f"Baseline was made with {key} {stored.get(key)}, comparisons are not like for like")
+    args.scratch=tempfile.mkdtemp(prefix="bench")
+    results={}
+    regressions=[]
+    try:
+        print(f"{'benchmark':24} {'time':>10} {'baseline':>10} {'peak':>10} {'baseline':>10}  result")
+        for b in selected:
+            result=measure(b,args)
+            text,regressed=compare(b.name,result,baseline)
+            if regressed and "SLOWER" in text:
+                # Timing is noisy on a busy machine, so make sure before calling it a regression
+                result["time"]=min(result["time"],measure(b,args,memory=False)["time"])
+                text,regressed=compare(b.name,result,baseline)
+            results[b.name]=result
+            if regressed:
+                regressions.append(b.name)
+            base=baseline.get(b.name,{})
+
+            def ms(t):
+                return "-" if t is None else f"{t*1000:.1f}ms"
+
+            def mb(n):
+                return "-" if n is None else f"{n/(1<<20):.1f}MB"
+            detail=" ".join(f"{key}={value}" for key,value in result["detail"].items())
+            print(f"{b.name:24} {ms(result['time']):>10} {ms(base.get('time')):>10} "
+                  f"{mb(result['peak']):>10} {mb(base.get('peak')):>10}  {text} {detail}".rstrip())
+    finally:
+        shutil.rmtree(args.scratch,ignore_errors=True)
+    record=dict(environment(args),results=results)
+    if args.output is not None:
+        with open(args.output,"wt") as ouf:
+            json.dump(record,ouf,indent=2)
+            ouf.write("\n")
+    # Benchmarks the baseline doesn't have yet start their baseline with this run
+    new={name:result for name,result in results.items() if name not in baseline}
+    if args.save or new:
+        if os.path.exists(args.baseline):
+            with open(args.baseline,"rt") as inf:
+                stored=json.load(inf)
+            # Saving a subset only replaces those benchmarks, and adding new
+            # ones leaves the record of what the baseline was made with alone
+            record=dict(record if args.save else stored,
+                        results=dict(stored["results"],**(results if args.save else new)))
+        with open(args.baseline,"wt") as ouf:
+            json.dump(record,ouf,indent=2)
+            ouf.write("\n")
+        print(f"Baseline saved to {args.baseline}" if args.save else
+              f"Added {' '.join(new)} to the baseline in {args.baseline}")
+    if regressions and not args.save:
+        print(f"{len(regressions)} regressions: {' '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,439 @@
+"""
+Stand-in for KiCad's pcbnew module, so MatrixTraces runs without KiCad
+
+Only the part of the API this repository uses is here, behaving like the
+real thing as far as MatrixTraces, PolarSelect, and IRDrop.from_board can
+tell. Every call to a method of a board, footprint, pad, track, arc, or via
+is counted in calls, by "CLASS.Method", so a benchmark can report how much
+work it asked of the board as well as how long it took.
+
+The board starts empty. load() fills it from a .kicad_pcb file, with the
+nets, footprints and their pads, and all tracks, arcs, and vias.
+
+import pcbnew
+pcbnew.load("../kicad/Precision23.kicad_pcb")
+import MatrixTraces
+print(pcbnew.calls.most_common(10))
+"""
+
+import functools
+import os
+import sys
+from collections import Counter
+
+# PcbFile lives in kicad/, next to this directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","kicad"))
+import PcbFile
+from PcbIndex import footprint_placement,net_names,pad_layers,reference,rotate
+
+PCB_LAYER_ID_COUNT=60
+DEGREES_T=1
+F_Cu=0
+B_Cu=31
+
+# Calls to the board and its items, by "CLASS.Method"
+calls=Counter()
+
+
+def recorded(cls):
+    """
+    Class decorator that counts every call to a public method of the class,
+    including inherited ones, in calls
+    """
+    methods={}
+    for klass in reversed(cls.__mro__[:-1]):
+        methods.update(vars(klass))
+    for name,method in methods.items():
+        if callable(method) and not name.startswith("_"):
+            def wrap(method,key=f"{cls.__name__}.{name}"):
+                @functools.wraps(method)
+                def counted(*args,**kwargs):
+                    calls[key]+=1
+                    return method(*args,**kwargs)
+                return counted
+            setattr(cls,name,wrap(method))
+    return cls
+
+
+def layer_name(layer:int):
+    """
+    Canonical name of a layer ID
+    """
+    if layer==F_Cu:
+        return "F.Cu"
+    if layer==B_Cu:
+        return "B.Cu"
+    if F_Cu<layer<B_Cu:
+        return f"In{layer}.Cu"
+    return f"User.{layer}"
+
+
+class VECTOR2I:
+    def __init__(self,x:int,y:int):
+        self.x=int(x)
+        self.y=int(y)
+
+    def __eq__(self,other):
+        return self.x==other.x and self.y==other.y
+
+    def __repr__(self):
+        return f"VECTOR2I({self.x},{self.y})"
+
+
+class EDA_ANGLE:
+    def __init__(self,angle:float,unit:int=DEGREES_T):
+        self.angle=float(angle)
+
+    def AsDegrees(self):
+        return self.angle
+
+
+@recorded
+class NETINFO_ITEM:
+    def __init__(self,name:str,code:int):
+        self.name=name
+        self.code=code
+
+    def GetNetCode(self):
+        return self.code
+
+    def GetNetname(self):
+        return self.name
+
+
+@recorded
+class LSET:
+    def __init__(self,layers):
+        self.layers=list(layers)
+
+    def CuStack(self):
+        return [layer for layer in self.layers if F_Cu<=layer<=B_Cu]
+
+
+class BoardItem:
+    """
+    What tracks, arcs, and vias have in common
+    """
+    def __init__(self,board):
+        self.board=board
+        self.start=VECTOR2I(0,0)
+        self.end=VECTOR2I(0,0)
+        self.width=0
+        self.netcode=0
+        self.layer=F_Cu
+
+    def SetStart(self,xy:VECTOR2I):
+        self.start=xy
+
+    def GetStart(self):
+        return self.start
+
+    def SetEnd(self,xy:VECTOR2I):
+        self.end=xy
+
+    def GetEnd(self):
+        return self.end
+
+    def SetWidth(self,width:int):
+        self.width=width
+
+    def GetWidth(self):
+        return self.width
+
+    def SetNetCode(self,code:int):
+        self.netcode=code
+
+    def SetNet(self,net:NETINFO_ITEM):
+        self.netcode=net.GetNetCode()
+
+    def GetNetCode(self):
+        return self.netcode
+
+    def GetNetname(self):
+        return self.board.netnames.get(self.netcode,"")
+
+    def SetLayer(self,layer:int):
+        self.layer=layer
+
+    def GetLayer(self):
+        return self.layer
+
+    def GetLayerName(self):
+        return layer_name(self.layer)
+
+    def IsOnLayer(self,layer:int):
+        return layer==self.layer
+
+    def GetClass(self):
+        return type(self).__name__
+
+
+@recorded
+class PCB_TRACK(BoardItem):
+    pass
+
+
+@recorded
+class PCB_ARC(BoardItem):
+    def __init__(self,board):
+        super().__init__(board)
+        self.mid=VECTOR2I(0,0)
+
+    def SetMid(self,xy:VECTOR2I):
+        self.mid=xy
+
+    def GetMid(self):
+        return self.mid
+
+
+@recorded
+class PCB_VIA(BoardItem):
+    def __init__(self,board):
+        super().__init__(board)
+        self.drill=0
+        self.layers=(F_Cu,B_Cu)
+
+    def SetPosition(self,xy:VECTOR2I):
+        self.start=xy
+        self.end=xy
+
+    def GetPosition(self):
+        return self.start
+
+    def SetDrill(self,drill:int):
+        self.drill=drill
+
+    def GetDrillValue(self):
+        return self.drill
+
+    def SetLayerPair(self,top:int,bottom:int):
+        self.layers=(top,bottom)
+
+    def TopLayer(self):
+        return self.layers[0]
+
+    def BottomLayer(self):
+        return self.layers[1]
+
+    def IsOnLayer(self,layer:int):
+        # Layer IDs here are in stackup order, like KiCad 7
+        return self.layers[0]<=layer<=self.layers[1]
+
+
+@recorded
+class PAD:
+    def __init__(self,footprint,*,number:str,function:str,netcode:int,offset:tuple,size:tuple,
+                 angle:float,layers:list):
+        self.footprint=footprint
+        self.number=number
+        self.function=function
+        self.netcode=netcode
+        self.offset=offset
+        self.size=size
+        self.angle=angle
+        self.layers=layers
+
+    def GetNumber(self):
+        return self.number
+
+    def GetPinFunction(self):
+        return self.function
+
+    def GetNetname(self):
+        return self.footprint.board.netnames.get(self.netcode,"")
+
+    def GetPosition(self):
+        # Pad offsets are stored unrotated, so pads follow their footprint around
+        at=self.footprint.GetPosition()
+        dx,dy=rotate(*self.offset,self.footprint.GetOrientation().AsDegrees())
+        return VECTOR2I(at.x+dx,at.y+dy)
+
+    def GetSize(self):
+        return VECTOR2I(*self.size)
+
+    def GetOrientation(self):
+        return EDA_ANGLE(self.angle+self.footprint.GetOrientation().AsDegrees())
+
+    def GetLayerSet(self):
+        return LSET(self.layers)
+
+
+@recorded
+class FOOTPRINT:
+    def __init__(self,board,ref:str):
+        self.board=board
+        self.ref=ref
+        self.position=VECTOR2I(0,0)
+        self.orientation=EDA_ANGLE(0)
+        self.flipped=False
+        self.pads=[]
+
+    def GetReference(self):
+        return self.ref
+
+    def SetPosition(self,xy:VECTOR2I):
+        self.position=xy
+
+    def GetPosition(self):
+        return self.position
+
+    def SetOrientation(self,angle:EDA_ANGLE):
+        self.orientation=angle
+
+    def GetOrientation(self):
+        return self.orientation
+
+    def IsFlipped(self):
+        return self.flipped
+
+    def SetLayerAndFlip(self,layer:int):
+        self.flipped=(layer==B_Cu)
+
+    def Pads(self):
+        return list(self.pads)
+
+
+@recorded
+class BOARD:
+    def __init__(self):
+        self.nets={}
+        self.netnames={}
+        self.footprints={}
+        # Keyed by id() so removing is as cheap as adding, and kept in insertion order
+        self.tracks={}
+        self.copper=[F_Cu,B_Cu]
+
+    def net(self,name:str,code:int=None):
+        """
+        Net by name, created if the board doesn't have it yet. Not part of the pcbnew API.
+        """
+        if name not in self.nets:
+            code=len(self.nets) if code is None else code
+            self.nets[name]=NETINFO_ITEM(name,code)
+            self.netnames[code]=name
+        return self.nets[name]
+
+    def GetLayerName(self,layer:int):
+        return layer_name(layer)
+
+    def GetLayerID(self,name:str):
+        for layer in range(PCB_LAYER_ID_COUNT):
+            if layer_name(layer)==name:
+                return layer
+        return -1
+
+    def GetEnabledLayers(self):
+        return LSET(self.copper)
+
+    def GetNetsByName(self):
+        return self.nets
+
+    def FindFootprintByReference(self,ref:str):
+        return self.footprints.get(ref)
+
+    def GetFootprints(self):
+        return list(self.footprints.values())
+
+    def GetTracks(self):
+        return list(self.tracks.values())
+
+    def Add(self,item):
+        if isinstance(item,FOOTPRINT):
+            self.footprints[item.ref]=item
+        else:
+            self.tracks[id(item)]=item
+
+    def Remove(self,item):
+        del self.tracks[id(item)]
+
+
+_board=BOARD()
+
+
+def GetBoard():
+    return _board
+
+
+def Refresh():
+    calls["Refresh"]+=1
+
+
+def reset():
+    """
+    Start over with an empty board and no calls counted
+    """
+    global _board
+    _board=BOARD()
+    calls.clear()
+
+
+def vector(xy):
+    """
+    Board file millimeter coordinates as a VECTOR2I in nanometers
+    """
+    return VECTOR2I(round(float(xy[0])*1e6),round(float(xy[1])*1e6))
+
+
+def load(filename:str):
+    """
+    Fill the board from a .kicad_pcb file. Calls made while loading aren't counted.
+
+    :return: The board
+    """
+    doc=PcbFile.read(filename)
+    board=_board
+    board.net("",0)
+    for code,name in net_names(doc).items():
+        board.net(name,code)
+
+    def layer_id(node):
+        return board.GetLayerID(PcbFile.unquote(node))
+    board.copper=sorted(layer_id(layer[1]) for layer in doc.find("layers")[1:]
+                        if PcbFile.unquote(layer[1]).endswith(".Cu"))
+
+    def netcode(node):
+        net=node.find("net")
+        return 0 if net is None else int(net[1])
+    for node in doc.root:
+        if not isinstance(node,PcbFile.SExpr):
+            continue
+        if node.name in ("segment","arc"):
+            item=PCB_TRACK(board) if node.name=="segment" else PCB_ARC(board)
+            item.SetStart(vector(node.value("start")))
+            item.SetEnd(vector(node.value("end")))
+            if node.name=="arc":
+                item.SetMid(vector(node.value("mid")))
+            item.SetWidth(round(float(node.value("width"))*1e6))
+            item.SetLayer(layer_id(node.value("layer")))
+            item.SetNetCode(netcode(node))
+            board.Add(item)
+        elif node.name=="via":
+            item=PCB_VIA(board)
+            item.SetPosition(vector(node.value("at")))
+            item.SetWidth(round(float(node.value("size"))*1e6))
+            item.SetDrill(round(float(node.value("drill"))*1e6))
+            layers=node.find("layers")
+            item.SetLayerPair(layer_id(layers[1]),layer_id(layers[-1]))
+            item.SetNetCode(netcode(node))
+            board.Add(item)
+        elif node.name=="footprint":
+            footprint=FOOTPRINT(board,reference(node))
+            fx,fy,fangle=footprint_placement(node)
+            footprint.SetPosition(vector((fx,fy)))
+            footprint.SetOrientation(EDA_ANGLE(fangle))
+            footprint.flipped=PcbFile.unquote(node.value("layer"))=="B.Cu"
+            for pad in node.findall("pad"):
+                pat=pad.value("at")
+                size=pad.value("size")
+                # The file holds pad angles with the footprint angle included
+                angle=(float(pat[2]) if len(pat)>2 else 0.0)-footprint.GetOrientation().AsDegrees()
+                padlayers=[board.GetLayerID(layer) for layer in pad_layers(pad,[board.GetLayerName(layer) for layer in board.copper])]
+                function=pad.value("pinfunction")
+                footprint.pads.append(PAD(footprint,number=PcbFile.unquote(pad[1]),
+                                          function="" if function is None else PcbFile.unquote(function),
+                                          netcode=netcode(pad),offset=(float(pat[0])*1e6,float(pat[1])*1e6),
+                                          size=(float(size[0])*1e6,float(size[1])*1e6),angle=angle,
+                                          layers=padlayers))
+            board.Add(footprint)
+    calls.clear()
+    return board
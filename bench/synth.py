@@ -0,0 +1,128 @@
+"""
+Synthetic data for the benchmarks, so nothing depends on files that only exist on the bench
+
+IV logs are in the format iv.py reads: the tester sweeps its DAC command
+over every (R,nsamples) setting, and each line holds the summed ADC counts
+of the driver input, output, LED anode and cathode, then the same as volts,
+R, and current. The LED is a spice.py diode model, solved with dc_solve().
+
+Device populations are sets of measured IV points from diode models with
+parameters spread around a typical LED, for exercising the fitters.
+
+Everything is seeded, so the same arguments always make the same data.
+"""
+
+import io
+import os
+import sys
+
+import numpy as np
+
+# spice.py and iv.py live at the top of the repository, one level up from here
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import spice
+
+# ADC and DAC of the tester, counts per volt
+countsPerVolt=1024/5.0
+# Series resistors and sample counts the tester sweeps through
+testerR=(220.0,100.0,50.0)
+testerSamples=(1,16)
+# Diode model (IS,N,RS) of a typical small LED
+typicalLED=(1e-18,2.0,10.0)
+# Distinct sweep blocks in a log. A big log repeats these, which costs the parser
+# the same as fresh data.
+logBlocks=8
+
+
+def parse_size(text:str):
+    """
+    Size with an optional K, M, or G suffix, IE "4G"
+
+    :return: Size in bytes
+    """
+    scale={"K":1<<10,"M":1<<20,"G":1<<30}
+    text=text.strip().upper()
+    if text[-1:] in scale:
+        return int(float(text[:-1])*scale[text[-1]])
+    return int(text)
+
+
+def iv_block(rng:np.random.Generator,*,model=typicalLED,noise:float=0.3):
+    """
+    One full sweep of the tester, all settings
+
+    :param model: Diode (IS,N,RS) of the LED under test
+    :param noise: RMS noise of one ADC sample, counts
+    :return: Text of the log lines
+    """
+    dncmd=np.arange(1024)
+    rows=[]
+    for R in testerR:
+        for nsamples in testerSamples:
+            vcmd=dncmd/countsPerVolt
+            # Driver follows the command with a little gain error, and can't quite reach the rails
+            vin=vcmd
+            vout=np.clip(vcmd*0.998,0,4.95)
+            I,_=spice.dc_solve(vout,*model,Rseries=R)
+            vmid=vout-I*R
+            vbot=np.full(len(dncmd),0.002)
+            sums=[]
+            for v in (vin,vout,vmid,vbot):
+                samples=v[:,None]*countsPerVolt+rng.normal(0,noise,(len(v),nsamples))
+                samples=np.clip(np.round(samples),0,1023)
+                sums+=[samples.sum(axis=1),(samples**2).sum(axis=1)]
+            mean=[s/nsamples/countsPerVolt for s in sums[0::2]]
+            rows.append(np.column_stack([dncmd,np.full(len(dncmd),nsamples),*sums,
+                                         vcmd,*mean,np.full(len(dncmd),R),(mean[1]-mean[2])/R*1000]))
+    out=io.StringIO()
+    np.savetxt(out,np.concatenate(rows),fmt=["%d"]*10+["%.4f"]*7,delimiter=",")
+    return out.getvalue()
+
+
+def iv_log(filename:str,size:int,*,seed:int=0):
+    """
+    Write an IV log of about the given size
+
+    :param size: Size in bytes. The log is whole sweeps, so it ends up a bit bigger.
+    :return: Number of bytes written
+    """
+    rng=np.random.default_rng(seed)
+    blocks=[]
+    written=0
+    i_block=0
+    with open(filename,"wt") as ouf:
+        ouf.write("dncmd,nsamples,dnins,dninss,dnouts,dnoutss,dnmids,dnmidss,dnbots,dnbotss,"
+                  "vcmd,vin,vout,vmid,vbot,R,Ima\n")
+        while written<size:
+            if len(blocks)<logBlocks:
+                blocks.append(iv_block(rng))
+            block=blocks[i_block%logBlocks]
+            ouf.write(block)
+            written+=len(block)
+            i_block+=1
+    return written
+
+
+def population(n:int,*,seed:int=0,npoints:int=40,noise:float=0.02):
+    """
+    Measured IV points of a population of devices
+
+    Each device has log10(IS), N, and log10(RS) spread around typicalLED.
+    Its points are log spaced in current from 50uA to 30mA, with the voltage
+    from the exact inverse of the diode model, and noise added to log10(I).
+
+    :param n: Number of devices
+    :param npoints: Points per device
+    :param noise: RMS noise in log10(I)
+    :return: List of (xdata,logydata,truth) per device, in the units spice.py fits:
+             volts, log10 of mA, and the true (IS,N,RS)
+    """
+    rng=np.random.default_rng(seed)
+    IS,N,RS=typicalLED
+    result=[]
+    for _ in range(n):
+        truth=(IS*10**rng.normal(0,1),N*(1+rng.normal(0,0.1)),RS*(1+rng.normal(0,0.2)))
+        I=np.logspace(np.log10(50e-6),np.log10(30e-3),npoints)
+        V=truth[1]*spice.VT*np.log(I/truth[0]+1)+I*truth[2]
+        result.append((V,np.log10(I*1000)+rng.normal(0,noise,npoints),truth))
+    return result
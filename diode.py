@@ -66,6 +66,34 @@ class Diode:
             self.cd = mcd / 1000.0  # convert mcd to cd
         self.hex = hex
 
+    @classmethod
+    def view(cls, *, VI: np.array, MFRnum: str = None, DKnum: str = None,
+             lam: float, If: float, Vf: float, Ifmax: float, Vfmax: float,
+             cd: float, hex: str = None):
+        """
+        Diode over a curve and ratings already in SI units, IE a part from the
+        part library. Nothing is converted or copied, so VI may be a read-only
+        view.
+
+        :param VI:  Nx2 array, column 0 is voltage in V, column 1 is current in A
+        :param lam: Wavelength, m
+        :param If:  Nominal forward current, A
+        :param Ifmax: Maximum forward current, A
+        :param cd:  Nominal brightness at If, cd
+        """
+        self = cls.__new__(cls)
+        self.MFRnum = MFRnum
+        self.DKnum = DKnum
+        self.VI = VI
+        self.lam = lam
+        self.If = If
+        self.Vf = Vf
+        self.Ifmax = Ifmax
+        self.Vfmax = Vfmax
+        self.cd = cd
+        self.hex = hex
+        return self
+
     def _mb(x0, y0, x1, y1):
         m = (y1 - y0) / (x1 - x0)
         b = y0 - m * x0
@@ -74,26 +102,20 @@ class Diode:
     def Iv(self, V):
         """
         Calculate current given voltage
-        :param V: Voltage across diode in volts
-        :return: Current in amps
+        :param V: Voltage across diode in volts, scalar or array
+        :return: Current in amps, NaN outside the curve
         """
-        for v0, i0, v1, i1 in zip(self.VI[:-1, 0], self.VI[:-1, 1], self.VI[1:, 0], self.VI[1:, 1]):
-            if V >= v0 and V <= v1:
-                t = (V - v0) / (v1 - v0)
-                return i0 * (1 - t) + i1 * t
-        return float('nan')
+        I = np.interp(V, self.VI[:, 0], self.VI[:, 1], left=float('nan'), right=float('nan'))
+        return float(I) if np.ndim(I) == 0 else I
 
     def Vi(self, I):
         """
         Calculate voltage given current
-        :param I: Current through diode in amps
-        :return: Voltage across diode in volts
+        :param I: Current through diode in amps, scalar or array
+        :return: Voltage across diode in volts, NaN outside the curve
         """
-        for v0, i0, v1, i1 in zip(self.VI[:-1, 0], self.VI[:-1, 1], self.VI[1:, 0], self.VI[1:, 1]):
-            if I >= i0 and I <= i1:
-                t = (I - i0) / (i1 - i0)
-                return v0 * (1 - t) + v1 * t
-        return float('nan')
+        V = np.interp(I, self.VI[:, 1], self.VI[:, 0], left=float('nan'), right=float('nan'))
+        return float(V) if np.ndim(V) == 0 else V
 
     def Cdi(self, I):
         """
@@ -234,46 +256,51 @@ RedSideAPDA1806SECK_J3_PRV = Diode(MFRnum='APDA1806SECK/J3-PRV',
 
 Red=RedSideAPDA1806SECK_J3_PRV
 
-WhiteBrandXLED = Diode(VIfn='White BrandX LED Measured.csv')
-White=WhiteBrandXLED
-
-Vcc=5.0
-Rw=White.Rivcc(White.If,Vcc)
-print(f"{Vcc=},{White.If=},{Rw=}")
-
-
-Vcc=3.3
-Rlo=25 #Resistance of gate at low output
-Rhi=25 #Resistance of gate at high output
-Vrr=Vcc
-Vgg=Vcc
-Vyy=Vcc
-
-for i in range(3):
-
-    Rg = 50
-    Vg = Green.Vi(Green.If)
-    Vlo=Rlo*Green.If
-    Vhi=Vcc-Rhi*Green.If
-    Vgg=Vhi-Vlo
-    print(f"mcdgreen={Green.cd*1000:.0f}mcd,Igreen={Green.If*1000:.1f}mA,{Rg=:.1f}R,{Vg=:.3f}V,{Vhi=:.3f}V,{Vlo=:.3f}V,{Vgg=:.3f}V")
-
-    Cdy=Yellow.cd
-    Iy = Yellow.Icd(Cdy)
-    Ry = Yellow.Rivcc(Iy, Vcc)
-    Vy = Yellow.Vi(Iy)
-    Vlo=Rlo*Iy
-    Vhi=Vcc-Rhi*Iy
-    Vyy=Vhi-Vlo
-    print(f"mcdyellow={Cdy*1000:.0f}mcd,Iyellow={Iy*1000:.1f}mA,{Ry=:.1f}R,{Vy=:.3f}V,{Vhi=:.3f}V,{Vlo=:.3f}V,{Vyy=:.3f}V")
-
-    Cdr=Red.cd
-    Ir = Red.Icd(Cdr)
-    Rr = Red.Rivcc(Ir, Vcc)-Rlo-Rhi
-    Vr = Red.Vi(Ir)
-    Vlo=Rlo*Ir
-    Vhi=Vcc-Rhi*Ir
-    Vrr=Vhi-Vlo
-    print(f"mcdred={Cdr*1000:.0f}mcd,Ired={Ir*1000:.1f}mA,{Rr=:.1f}R,{Vr=:.3f}V,{Vhi=:.3f}V,{Vlo=:.3f}V,{Vrr=:.3f}V")
-
-
+def main():
+    # Design calculations. The measured white curve is only needed here, so it is
+    # loaded here rather than on import.
+    WhiteBrandXLED = Diode(VIfn='White BrandX LED Measured.csv')
+    White=WhiteBrandXLED
+
+    Vcc=5.0
+    Rw=White.Rivcc(White.If,Vcc)
+    print(f"{Vcc=},{White.If=},{Rw=}")
+
+
+    Vcc=3.3
+    Rlo=25 #Resistance of gate at low output
+    Rhi=25 #Resistance of gate at high output
+    Vrr=Vcc
+    Vgg=Vcc
+    Vyy=Vcc
+
+    for i in range(3):
+
+        Rg = 50
+        Vg = Green.Vi(Green.If)
+        Vlo=Rlo*Green.If
+        Vhi=Vcc-Rhi*Green.If
+        Vgg=Vhi-Vlo
+        print(f"mcdgreen={Green.cd*1000:.0f}mcd,Igreen={Green.If*1000:.1f}mA,{Rg=:.1f}R,{Vg=:.3f}V,{Vhi=:.3f}V,{Vlo=:.3f}V,{Vgg=:.3f}V")
+
+        Cdy=Yellow.cd
+        Iy = Yellow.Icd(Cdy)
+        Ry = Yellow.Rivcc(Iy, Vcc)
+        Vy = Yellow.Vi(Iy)
+        Vlo=Rlo*Iy
+        Vhi=Vcc-Rhi*Iy
+        Vyy=Vhi-Vlo
+        print(f"mcdyellow={Cdy*1000:.0f}mcd,Iyellow={Iy*1000:.1f}mA,{Ry=:.1f}R,{Vy=:.3f}V,{Vhi=:.3f}V,{Vlo=:.3f}V,{Vyy=:.3f}V")
+
+        Cdr=Red.cd
+        Ir = Red.Icd(Cdr)
+        Rr = Red.Rivcc(Ir, Vcc)-Rlo-Rhi
+        Vr = Red.Vi(Ir)
+        Vlo=Rlo*Ir
+        Vhi=Vcc-Rhi*Ir
+        Vrr=Vhi-Vlo
+        print(f"mcdred={Cdr*1000:.0f}mcd,Ired={Ir*1000:.1f}mA,{Rr=:.1f}R,{Vr=:.3f}V,{Vhi=:.3f}V,{Vlo=:.3f}V,{Vrr=:.3f}V")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Copper clearance check of a LayoutPlan, before anything goes on the board
+
+Every track, arc (split into chords), and via of the plan becomes a capsule:
+a centerline from one point to another with a half-width. Capsules are
+hashed into a grid of square cells, and only pairs sharing a cell, on
+different nets, and on a common layer are measured, so the check is
+roughly linear in the number of items. Each violation is reported with both
+net names and where it is in polar slot coordinates.
+
+To run:
+
+python Clearance.py
+
+MatrixTraces and PlanWriter run the same check on every plan before
+anything is committed, and list what it finds.
+"""
+
+import argparse
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+import LayoutPlan
+from LayoutPlan import mil,centerX,centerY,outerRingRad,ringSpacing
+from PcbIndex import arc_points
+
+# From OSHPark design rule 6mil trace clearance. LayoutPlan.minSpacing adds a mil
+# of tolerance on top of this when spacing the rings, the check uses the real rule.
+oshparkClearance=6
+
+layerBits={"F.Cu":1,"B.Cu":2}
+
+
+class Violation(NamedTuple):
+    """
+    Two pieces of copper on different nets closer than the clearance
+
+    :param net0: Net of one piece
+    :param net1: Net of the other
+    :param kind0: "track", "arc", or "via"
+    :param kind1: Kind of the other piece
+    :param gap: Copper to copper distance in mils, 0 if they touch
+    :param r: Radius of the closest approach in mils
+    :param theta: Azimuth of the closest approach in degrees clockwise from 12:00
+    :param slot: Azimuth slot, 0-59
+    :param m: Azimuth subslot within the slot, in 1.5deg subslots
+    :param i_ring: Ring index, fractional between rings
+    """
+    net0:str
+    net1:str
+    kind0:str
+    kind1:str
+    gap:float
+    r:float
+    theta:float
+    slot:int
+    m:float
+    i_ring:float
+
+
+def capsules(plan:LayoutPlan.Plan):
+    """
+    Capsules of all the copper in a plan, in mils
+
+    :return: Tuple of (x0,y0,x1,y1,hw,layers,net,item,kind,netnames). The first
+             five are float arrays, layers is a bit mask per capsule, net indexes
+             netnames, item numbers the plan item each capsule came from, and
+             kind is a list of the kind of each plan item.
+    """
+    rows=[]
+    kind=[]
+    for item in plan.tracks:
+        rows.append((item.xy0,item.xy1,item.width/2,layerBits[item.layer],item.signame,len(kind)))
+        kind.append("track")
+    for item in plan.arcs:
+        # Chords within a tenth of a mil of the arc
+        points=arc_points(item.xy0,item.xymid,item.xy1,tol=0.1*mil)
+        for xy0,xy1 in zip(points[:-1],points[1:]):
+            rows.append((xy0,xy1,item.width/2,layerBits[item.layer],item.signame,len(kind)))
+        kind.append("arc")
+    for item in plan.vias:
+        rows.append((item.xy,item.xy,item.dia/2,layerBits["F.Cu"]|layerBits["B.Cu"],item.signame,len(kind)))
+        kind.append("via")
+    xy0=np.array([row[0] for row in rows],dtype=float).reshape(-1,2)/mil
+    xy1=np.array([row[1] for row in rows],dtype=float).reshape(-1,2)/mil
+    hw=np.array([row[2] for row in rows],dtype=float)/mil
+    layers=np.array([row[3] for row in rows],dtype=np.int64)
+    netnames,net=np.unique(np.array([row[4] for row in rows],dtype=object).astype(str),return_inverse=True)
+    item=np.array([row[5] for row in rows],dtype=np.int64)
+    return xy0[:,0],xy0[:,1],xy1[:,0],xy1[:,1],hw,layers,net,item,kind,netnames
+
+
+def candidate_pairs(x0,y0,x1,y1,reach,cell:float):
+    """
+    All pairs of capsules that share a grid cell
+
+    :param reach: How far beyond its centerline each capsule needs to be found,
+                  IE half-width plus half the clearance
+    :return: Tuple of (i,j) index arrays with i<j, each pair once
+    """
+    cx0=np.floor((np.minimum(x0,x1)-reach)/cell).astype(np.int64)
+    cx1=np.floor((np.maximum(x0,x1)+reach)/cell).astype(np.int64)
+    cy0=np.floor((np.minimum(y0,y1)-reach)/cell).astype(np.int64)
+    cy1=np.floor((np.maximum(y0,y1)+reach)/cell).astype(np.int64)
+    # One entry per (capsule,cell) the capsule's bounding box covers
+    nx=cx1-cx0+1
+    ny=cy1-cy0+1
+    count=nx*ny
+    owner=np.repeat(np.arange(len(x0)),count)
+    k=np.arange(count.sum())-np.repeat(np.cumsum(count)-count,count)
+    cx=cx0[owner]+k%nx[owner]
+    cy=cy0[owner]+k//nx[owner]
+    key=cx*1000003+cy
+    order=np.lexsort((owner,key))
+    key=key[order]
+    owner=owner[order]
+    starts=np.flatnonzero(np.r_[True,key[1:]!=key[:-1]])
+    ends=np.r_[starts[1:],len(key)]
+    pairs_i=[]
+    pairs_j=[]
+    for start,end in zip(starts,ends):
+        if end-start>1:
+            i,j=np.triu_indices(end-start,1)
+            pairs_i.append(owner[start+i])
+            pairs_j.append(owner[start+j])
+    if not pairs_i:
+        return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=np.int64)
+    pair=np.unique(np.concatenate(pairs_i)*len(x0)+np.concatenate(pairs_j))
+    return pair//len(x0),pair%len(x0)
+
+
+def point_segment(px,py,ax,ay,bx,by):
+    """
+    Nearest point on segments a-b to points p, vectorized
+
+    :return: Tuple of (distance,x,y) of the nearest point
+    """
+    dx=bx-ax
+    dy=by-ay
+    ll=dx*dx+dy*dy
+    with np.errstate(divide='ignore',invalid='ignore'):
+        t=np.where(ll>0,((px-ax)*dx+(py-ay)*dy)/ll,0.0)
+    t=np.clip(t,0,1)
+    x=ax+t*dx
+    y=ay+t*dy
+    return np.hypot(px-x,py-y),x,y
+
+
+def segment_segment(ax,ay,bx,by,cx,cy,dx,dy):
+    """
+    Closest approach of segments a-b and c-d, vectorized
+
+    :return: Tuple of (distance,x,y), where x,y is halfway between the nearest points
+    """
+    best=np.full(len(ax),np.inf)
+    mx=np.zeros(len(ax))
+    my=np.zeros(len(ax))
+    for px,py,s0x,s0y,s1x,s1y in ((ax,ay,cx,cy,dx,dy),(bx,by,cx,cy,dx,dy),
+                                  (cx,cy,ax,ay,bx,by),(dx,dy,ax,ay,bx,by)):
+        dist,x,y=point_segment(px,py,s0x,s0y,s1x,s1y)
+        better=dist<best
+        best=np.where(better,dist,best)
+        mx=np.where(better,(px+x)/2,mx)
+        my=np.where(better,(py+y)/2,my)
+
+    # Segments that properly cross are at distance zero
+    def side(px,py,qx,qy,rx,ry):
+        return np.sign((qx-px)*(ry-py)-(qy-py)*(rx-px))
+    crosses=(side(ax,ay,bx,by,cx,cy)*side(ax,ay,bx,by,dx,dy)<0)&(side(cx,cy,dx,dy,ax,ay)*side(cx,cy,dx,dy,bx,by)<0)
+    best=np.where(crosses,0.0,best)
+    return best,mx,my
+
+
+def check(plan:LayoutPlan.Plan,*,clearance:float=oshparkClearance,cell:float=None):
+    """
+    Check all copper of a plan for clearance between different nets
+
+    :param plan: Plan from LayoutPlan.layout()
+    :param clearance: Minimum copper to copper distance in mils
+    :param cell: Size of hash cell in mils, default is a few ring spacings
+    :return: List of Violation, closest first, one per pair of plan items
+    """
+    x0,y0,x1,y1,hw,layers,net,item,kind,netnames=capsules(plan)
+    if cell is None:
+        cell=4*ringSpacing
+    i,j=candidate_pairs(x0,y0,x1,y1,hw+clearance/2,cell)
+    keep=(net[i]!=net[j])&((layers[i]&layers[j])!=0)
+    i=i[keep]
+    j=j[keep]
+    dist,x,y=segment_segment(x0[i],y0[i],x1[i],y1[i],x0[j],y0[j],x1[j],y1[j])
+    gap=np.maximum(dist-hw[i]-hw[j],0)
+    bad=np.flatnonzero(gap<clearance-1e-6)
+    bad=bad[np.argsort(gap[bad],kind="stable")]
+    # An arc is many chords, so only report the closest approach of each pair of items
+    pair=np.minimum(item[i[bad]],item[j[bad]])*len(kind)+np.maximum(item[i[bad]],item[j[bad]])
+    _,first=np.unique(pair,return_index=True)
+    bad=bad[np.sort(first)]
+    result=[]
+    for k in bad:
+        r=math.hypot(x[k]-centerX,y[k]-centerY)
+        theta=math.degrees(math.atan2(x[k]-centerX,-(y[k]-centerY)))%360
+        slot=int(round(theta/6))%60
+        result.append(Violation(str(netnames[net[i[k]]]),str(netnames[net[j[k]]]),kind[item[i[k]]],kind[item[j[k]]],float(gap[k]),
+                                r,theta,slot,((theta-slot*6+180)%360-180)/1.5,(outerRingRad-r)/ringSpacing))
+    return result
+
+
+def report(violations:list,limit:int=None):
+    """
+    Print violations, one per line
+    """
+    print(f"{len(violations)} clearance violations")
+    for v in violations[:limit]:
+        print(f"{v.net0} ({v.kind0}) to {v.net1} ({v.kind1}): gap {v.gap:.2f}mil "
+              f"at slot {v.slot} m={v.m:+.2f} ring {v.i_ring:.2f} (r={v.r:.1f}mil theta={v.theta:.2f}deg)")
+
+
+def preflight(plan:LayoutPlan.Plan,*,strict:bool=False,limit:int=10):
+    """
+    Check a plan before it is put on the board or written to the file
+
+    :param strict: If True, raise on any violation so nothing gets committed
+    :param limit: Number of violations to list
+    :return: List of Violation
+    """
+    violations=check(plan)
+    if violations:
+        report(violations,limit=limit)
+        if strict:
+            raise ValueError(f"{len(violations)} clearance violations in layout")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Clearance.py')
+    parser.add_argument('-c', '--clearance', type=float, default=oshparkClearance,
+                        help=f'Minimum copper to copper distance in mils (default = {oshparkClearance})')
+    parser.add_argument('-n', '--limit', type=int, default=50, help='Number of violations to list (default = 50)')
+    parser.add_argument('--arc-mode', choices=["arc", "chord", "subslot"], default=LayoutPlan.arcMode,
+                        help=f'How to lay rings (default = {LayoutPlan.arcMode})')
+    args = parser.parse_args()
+    LayoutPlan.arcMode=args.arc_mode
+    report(check(LayoutPlan.layout(place=False),clearance=args.clearance),limit=args.limit)
+
+
+if __name__=="__main__":
+    main()
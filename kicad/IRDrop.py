@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Trace resistance and IR drop of the LED matrix nets
+
+The copper of every net with an LED on it is turned into a resistance
+network: each track (or arc chord) is a resistor from its width, length, and
+the copper thickness, each via is a resistor through its plated barrel, and
+track ends that land inside a pad or via are tied to it. Every LED net is fed
+from the pad of its driver, IE the pad on the net that isn't an LED. The
+network is reduced once to the resistance matrix between the LED pads, so
+solving a drive pattern is just a few small dense matrix products, and the
+whole matrix of 120 LEDs solves in a millisecond or so.
+
+The drive matches the schematic. Anode (eights) nets are switched to the
+supply by a PMOS with on resistance Rhigh. Cathode (ones) nets are sunk by a
+constant current driver (STP08CP05), which holds Iset as long as its output
+is above Vknee, and acts like a resistor Vknee/Iset below that. With a
+constant current sink, the copper doesn't change the current until the drop
+eats the headroom, so the headroom of each LED is reported too.
+
+To run on the board file:
+
+python IRDrop.py Precision23.kicad_pcb
+
+From inside KiCad:
+
+import IRDrop
+network=IRDrop.Network(IRDrop.from_board(board))
+IRDrop.report(network,network.solve())
+"""
+
+import argparse
+import math
+import os
+import sys
+from fnmatch import fnmatchcase
+from typing import NamedTuple
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
+
+import PcbFile
+from PcbIndex import arc_points,capsule,footprint_placement,net_names,pad_capsule,pad_layers,reference
+
+# diode.py lives at the top of the repository, one level up from here
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import diode
+
+# Resistivity of copper at 20C, ohm*mm
+rhoCu=1.72e-5
+# 1oz copper, mm. OSHPark 2 layer default.
+copperThickness=0.0348
+# Via barrel plating, mm
+platingThickness=0.0254
+# FR4 board, mm
+boardThickness=1.6
+# Resistance of a track end to the pad or via it lands in, ohms. Small but not zero,
+# so the network stays well conditioned.
+contactResistance=1e-6
+# Track ends closer than this are the same node, mm
+nodeQuantum=0.001
+
+# Drive defaults, see module docstring
+Vsupply=5.0
+Rhigh=1.0
+Iset=0.020
+Vknee=0.4
+
+
+class Segment(NamedTuple):
+    """
+    Straight piece of track, or one chord of an arc. All lengths in mm.
+    """
+    net:str
+    layer:str
+    x0:float
+    y0:float
+    x1:float
+    y1:float
+    width:float
+
+
+class Via(NamedTuple):
+    """
+    Via, with the copper layers it connects. All lengths in mm.
+    """
+    net:str
+    x:float
+    y:float
+    drill:float
+    size:float
+    layers:tuple
+
+
+class Pad(NamedTuple):
+    """
+    Pad, as a capsule from (x0,y0) to (x1,y1) with half-width hw. All lengths in mm.
+
+    :param function: Pin function, IE "A" or "K" for an LED
+    """
+    ref:str
+    number:str
+    function:str
+    net:str
+    x0:float
+    y0:float
+    x1:float
+    y1:float
+    hw:float
+    layers:tuple
+
+
+class Copper:
+    """
+    Tracks, vias, and pads of the nets of interest, with the thickness of each copper layer
+    """
+    def __init__(self,*,segments:list,vias:list,pads:list,thickness:dict=None):
+        self.segments=segments
+        self.vias=vias
+        self.pads=pads
+        self.thickness={} if thickness is None else thickness
+
+
+def led_nets(pads:list,leds:str):
+    """
+    Nets that have a pad of an LED on them
+    """
+    return set(pad.net for pad in pads if fnmatchcase(pad.ref,leds))
+
+
+def from_file(doc,*,leds:str="D[23]??"):
+    """
+    Copper of the LED nets of a board file parsed by PcbFile
+
+    :param leds: Glob pattern for the references of the LEDs
+    """
+    nets=net_names(doc)
+    layers=[PcbFile.unquote(layer[1]) for layer in doc.find("layers")[1:]]
+    copper=[layer for layer in layers if layer.endswith(".Cu")]
+    segments=[]
+    vias=[]
+    pads=[]
+    thickness={}
+    stackup=doc.find("setup").find("stackup") if doc.find("setup") is not None else None
+    if stackup is not None:
+        for layer in stackup.findall("layer"):
+            name=PcbFile.unquote(layer[1])
+            if name in copper and layer.value("thickness") is not None:
+                thickness[name]=float(layer.value("thickness"))
+    for node in doc.root:
+        if not isinstance(node,PcbFile.SExpr):
+            continue
+        if node.name in ("segment","arc"):
+            net=nets.get(int(node.value("net",0)),"")
+            layer=PcbFile.unquote(node.value("layer"))
+            width=float(node.value("width"))
+            start=tuple(float(v) for v in node.value("start"))
+            end=tuple(float(v) for v in node.value("end"))
+            points=[start,end] if node.name=="segment" else \
+                   arc_points(start,tuple(float(v) for v in node.value("mid")),end)
+            for (x0,y0),(x1,y1) in zip(points[:-1],points[1:]):
+                segments.append(Segment(net,layer,x0,y0,x1,y1,width))
+        elif node.name=="via":
+            at=node.value("at")
+            ends=[PcbFile.unquote(layer) for layer in node.find("layers")[1:]]
+            span=[copper.index(layer) for layer in ends if layer in copper]
+            vias.append(Via(nets.get(int(node.value("net",0)),""),float(at[0]),float(at[1]),
+                            float(node.value("drill")),float(node.value("size")),
+                            tuple(copper[min(span):max(span)+1])))
+        elif node.name=="footprint":
+            at=footprint_placement(node)
+            ref=reference(node)
+            for pad in node.findall("pad"):
+                net=pad.find("net")
+                if net is None:
+                    continue
+                function=pad.value("pinfunction")
+                pads.append(Pad(ref,PcbFile.unquote(pad[1]),"" if function is None else PcbFile.unquote(function),
+                                PcbFile.unquote(net[2]),*pad_capsule(pad,at),tuple(pad_layers(pad,copper))))
+    keep=led_nets(pads,leds)
+    return Copper(segments=[item for item in segments if item.net in keep],
+                  vias=[item for item in vias if item.net in keep],
+                  pads=[item for item in pads if item.net in keep],
+                  thickness=thickness)
+
+
+def from_board(board,*,leds:str="D[23]??"):
+    """
+    Copper of the LED nets of the live pcbnew board
+
+    :param leds: Glob pattern for the references of the LEDs
+    """
+    segments=[]
+    vias=[]
+    pads=[]
+    for track in board.GetTracks():
+        net=track.GetNetname()
+        if track.GetClass()=="PCB_VIA":
+            pos=track.GetPosition()
+            vias.append(Via(net,pos.x/1e6,pos.y/1e6,track.GetDrillValue()/1e6,track.GetWidth()/1e6,
+                            (board.GetLayerName(track.TopLayer()),board.GetLayerName(track.BottomLayer()))))
+            continue
+        start=(track.GetStart().x/1e6,track.GetStart().y/1e6)
+        end=(track.GetEnd().x/1e6,track.GetEnd().y/1e6)
+        if track.GetClass()=="PCB_ARC":
+            points=arc_points(start,(track.GetMid().x/1e6,track.GetMid().y/1e6),end)
+        else:
+            points=[start,end]
+        for (x0,y0),(x1,y1) in zip(points[:-1],points[1:]):
+            segments.append(Segment(net,track.GetLayerName(),x0,y0,x1,y1,track.GetWidth()/1e6))
+    for mod in board.GetFootprints():
+        for pad in mod.Pads():
+            pos=pad.GetPosition()
+            size=pad.GetSize()
+            pads.append(Pad(mod.GetReference(),pad.GetNumber(),pad.GetPinFunction(),pad.GetNetname(),
+                            *capsule(pos.x/1e6,pos.y/1e6,size.x/1e6,size.y/1e6,pad.GetOrientation().AsDegrees()),
+                            tuple(board.GetLayerName(layer) for layer in pad.GetLayerSet().CuStack())))
+    keep=led_nets(pads,leds)
+    return Copper(segments=[item for item in segments if item.net in keep],
+                  vias=[item for item in vias if item.net in keep],
+                  pads=[item for item in pads if item.net in keep])
+
+
+def pin(pad:Pad):
+    """
+    Anode "A" or cathode "K" of an LED pad. Without a pin function, pad 2 is the
+    anode, like the Kingbright footprints.
+    """
+    return pad.function or ("A" if pad.number=="2" else "K")
+
+
+def interp_rows(x,xp,fp):
+    """
+    np.interp of each x[i] on its own row xp[i], all rows sharing fp. Each row of
+    xp must be increasing. Values off the ends are clamped like np.interp.
+    """
+    k=np.clip((xp<x[:,None]).sum(axis=1),1,xp.shape[1]-1)
+    rows=np.arange(len(x))
+    x0=xp[rows,k-1]
+    x1=xp[rows,k]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        t=np.clip(np.where(x1>x0,(x-x0)/(x1-x0),1.0),0,1)
+    return fp[k-1]*(1-t)+fp[k]*t
+
+
+class Result(NamedTuple):
+    """
+    Solution of a drive pattern, one entry per LED in Network.leds order.
+    LEDs that aren't lit have zero current.
+
+    :param I: Current with the copper, A
+    :param I0: Current with perfect copper, A
+    :param error: Brightness error from the copper, I/I0-1
+    :param drop: Voltage lost in the copper of both nets, V
+    :param headroom: Voltage across the sink above Vknee, V. Negative means the sink has dropped out.
+    """
+    I:np.ndarray
+    I0:np.ndarray
+    error:np.ndarray
+    drop:np.ndarray
+    headroom:np.ndarray
+
+
+class Network:
+    """
+    Resistance network of the LED nets, reduced to the resistance matrix between LED pads
+
+    :param copper: Copper from from_file() or from_board()
+    :param leds: Glob pattern for the references of the LEDs
+    :param diodes: Diode curve of all LEDs, or dict of glob pattern to Diode
+    """
+    def __init__(self,copper:Copper,*,leds:str="D[23]??",diodes=diode.Yellow):
+        self.copper=copper
+        netnames=sorted(set(item.net for item in copper.segments+copper.vias+copper.pads))
+        netcode={net:i for i,net in enumerate(netnames)}
+        layernames=sorted(set(item.layer for item in copper.segments)|
+                          set(layer for item in copper.vias+copper.pads for layer in item.layers))
+        layercode={layer:i for i,layer in enumerate(layernames)}
+        thickness=np.array([copper.thickness.get(layer,copperThickness) for layer in layernames])
+
+        # Every place a node can be, as (net,layer,qx,qy). Track ends first, then vias, then pads.
+        seg=copper.segments
+        segnet=np.array([netcode[item.net] for item in seg],dtype=np.int64)
+        seglayer=np.array([layercode[item.layer] for item in seg],dtype=np.int64)
+        segxy=np.array([(item.x0,item.y0,item.x1,item.y1,item.width) for item in seg],dtype=float).reshape(-1,5)
+        places=[np.stack([segnet,seglayer,segxy[:,0],segxy[:,1]],1),np.stack([segnet,seglayer,segxy[:,2],segxy[:,3]],1)]
+        viaplace=[(netcode[item.net],layercode[layer],item.x,item.y,i)
+                  for i,item in enumerate(copper.vias) for layer in item.layers]
+        padplace=[(netcode[item.net],layercode[layer],(item.x0+item.x1)/2,(item.y0+item.y1)/2,i)
+                  for i,item in enumerate(copper.pads) for layer in item.layers]
+        viaplace=np.array(viaplace,dtype=float).reshape(-1,5)
+        padplace=np.array(padplace,dtype=float).reshape(-1,5)
+        places+=[viaplace[:,:4],padplace[:,:4]]
+        places=np.concatenate(places)
+        keys=np.stack([places[:,0].astype(np.int64),places[:,1].astype(np.int64),
+                       np.round(places[:,2]/nodeQuantum).astype(np.int64),
+                       np.round(places[:,3]/nodeQuantum).astype(np.int64)],1)
+        _,node=np.unique(keys,axis=0,return_inverse=True)
+        node=node.reshape(-1)
+        self.n_nodes=node.max()+1 if len(node) else 0
+        nseg=len(seg)
+        end0=node[:nseg]
+        end1=node[nseg:2*nseg]
+        vianode=node[2*nseg:2*nseg+len(viaplace)]
+        padnode=node[2*nseg+len(viaplace):]
+
+        # Resistors: tracks, via barrels, and track ends landing inside vias and pads
+        length=np.hypot(segxy[:,2]-segxy[:,0],segxy[:,3]-segxy[:,1])
+        ra=[end0]
+        rb=[end1]
+        rr=[rhoCu*length/(segxy[:,4]*thickness[seglayer])]
+        via_i=viaplace[:,4].astype(np.int64)
+        barrel=np.array([rhoCu*boardThickness/(math.pi*item.drill*platingThickness) for item in copper.vias])
+        for i in range(len(copper.vias)):
+            # Chain the layers of a via together through its barrel
+            nodes=vianode[via_i==i]
+            ra.append(nodes[:-1])
+            rb.append(nodes[1:])
+            rr.append(np.full(len(nodes)-1,barrel[i]/max(len(nodes)-1,1)))
+        ends=np.concatenate([end0,end1])
+        endplace=np.concatenate([places[:nseg],places[nseg:2*nseg]])
+        viacap=np.array([(item.x,item.y,item.x,item.y,item.size/2) for item in copper.vias]).reshape(-1,5)
+        padcap=np.array([(item.x0,item.y0,item.x1,item.y1,item.hw) for item in copper.pads]).reshape(-1,5)
+        for attach,attachnode,capsules in ((viaplace,vianode,viacap),(padplace,padnode,padcap)):
+            if len(attach)==0 or len(ends)==0:
+                continue
+            capsule=capsules[attach[:,4].astype(np.int64)]
+            for net,layer in set(zip(attach[:,0].astype(np.int64),attach[:,1].astype(np.int64))):
+                here=np.flatnonzero((attach[:,0]==net)&(attach[:,1]==layer))
+                near=np.flatnonzero((endplace[:,0]==net)&(endplace[:,1]==layer))
+                if len(near)==0:
+                    continue
+                px=endplace[near,2][None,:]
+                py=endplace[near,3][None,:]
+                ax,ay,bx,by,hw=[capsule[here,k][:,None] for k in range(5)]
+                dx=bx-ax
+                dy=by-ay
+                ll=dx*dx+dy*dy
+                with np.errstate(divide='ignore',invalid='ignore'):
+                    t=np.clip(np.where(ll>0,((px-ax)*dx+(py-ay)*dy)/ll,0.0),0,1)
+                inside=np.hypot(ax+t*dx-px,ay+t*dy-py)<=hw+nodeQuantum
+                a,b=np.nonzero(inside)
+                ra.append(attachnode[here[a]])
+                rb.append(ends[near[b]])
+                rr.append(np.full(len(a),contactResistance))
+        ra=np.concatenate(ra)
+        rb=np.concatenate(rb)
+        rr=np.concatenate(rr)
+        keep=(ra!=rb)&(rr>0)
+        ra,rb,g=ra[keep],rb[keep],1/np.maximum(rr[keep],contactResistance)
+
+        # LEDs and their pads, and the driver pads that feed each net
+        ledpads={}
+        feeds=np.zeros(self.n_nodes,dtype=bool)
+        padfirst=np.full(len(copper.pads),-1,dtype=np.int64)
+        padfirst[padplace[::-1,4].astype(np.int64)]=padnode[::-1]
+        for i,pad in enumerate(copper.pads):
+            if fnmatchcase(pad.ref,leds):
+                ledpads.setdefault(pad.ref,{})[pin(pad)]=padfirst[i]
+            elif padfirst[i]>=0:
+                feeds[padnode[padplace[:,4]==i]]=True
+        self.leds=sorted(ref for ref,pins in ledpads.items() if "A" in pins and "K" in pins)
+        self.anode=np.array([ledpads[ref]["A"] for ref in self.leds],dtype=np.int64)
+        self.cathode=np.array([ledpads[ref]["K"] for ref in self.leds],dtype=np.int64)
+        padnet={(pad.ref,pin(pad)):pad.net for pad in copper.pads}
+        self.anodenet=[padnet[(ref,"A")] for ref in self.leds]
+        self.cathodenet=[padnet[(ref,"K")] for ref in self.leds]
+        if isinstance(diodes,dict):
+            self.diodes=[next(d for pattern,d in diodes.items() if fnmatchcase(ref,pattern)) for ref in self.leds]
+        else:
+            self.diodes=[diodes]*len(self.leds)
+
+        # Ground the feeds and drop any copper not connected to one
+        G=coo_matrix((np.concatenate([g,g,-g,-g]),
+                      (np.concatenate([ra,rb,ra,rb]),np.concatenate([ra,rb,rb,ra]))),
+                     shape=(self.n_nodes,self.n_nodes)).tocsc()
+        _,component=connected_components(G,directed=False)
+        fed=np.zeros(component.max()+1 if len(component) else 0,dtype=bool)
+        fed[component[feeds]]=True
+        free=np.flatnonzero(fed[component]&~feeds)
+        index=np.full(self.n_nodes,-1,dtype=np.int64)
+        index[free]=np.arange(len(free))
+        # Resistance matrix between LED pads, IE voltage at each pad for one amp out of each pad
+        pins=np.concatenate([self.anode,self.cathode])
+        rows=index[pins]
+        self.connected=(rows[:len(self.leds)]>=0)&(rows[len(self.leds):]>=0)
+        Z=np.zeros((len(pins),len(pins)))
+        live=np.flatnonzero(rows>=0)
+        if len(live):
+            rhs=np.zeros((len(free),len(live)))
+            rhs[rows[live],np.arange(len(live))]=1
+            solution=splu(G[free][:,free].tocsc()).solve(rhs)
+            Z[np.ix_(live,live)]=solution[rows[live]]
+        n=len(self.leds)
+        self.Za=Z[:n,:n]
+        self.Zc=Z[n:,n:]
+
+    def resistance(self):
+        """
+        Copper resistance from the drivers to each LED, alone on its nets
+
+        :return: Tuple of (anode,cathode) arrays of resistance in ohms
+        """
+        return np.diag(self.Za).copy(),np.diag(self.Zc).copy()
+
+    def solve(self,*,frame=None,Vsupply:float=Vsupply,Rhigh:float=Rhigh,Iset:float=Iset,Vknee:float=Vknee,
+              maxit:int=50,tol:float=1e-9):
+        """
+        Currents through the LEDs for a drive pattern
+
+        :param frame: Which multiplex frame each LED is lit in, -1 for not lit. LEDs
+                      share copper drops only with LEDs lit in the same frame. Default
+                      scans the anode nets, IE each frame is one anode net with all of
+                      its LEDs lit, which is how the matrix is driven.
+        :param Vsupply: Supply to the high side switches, V
+        :param Rhigh: On resistance of a high side switch, ohms
+        :param Iset: Current of the constant current sink, A
+        :param Vknee: Lowest sink output voltage that still holds Iset, V
+        :return: Result
+        """
+        n=len(self.leds)
+        if frame is None:
+            _,frame=np.unique(np.array(self.anodenet,dtype=object).astype(str),return_inverse=True)
+        frame=np.asarray(frame).reshape(-1)
+        lit=(frame>=0)&self.connected
+        together=(frame[:,None]==frame[None,:])&lit[:,None]&lit[None,:]
+        # Everything in series with each LED that other LEDs share: the copper of both
+        # nets, and the high side switch when they are on the same anode net
+        anodenet=np.array(self.anodenet,dtype=object)
+        M=(self.Za+self.Zc+Rhigh*(anodenet[:,None]==anodenet[None,:]))*together
+        # Below Vknee the sink looks like this resistor
+        Rknee=Vknee/Iset
+
+        def current(Vavail,Rself):
+            # Where the load line of each LED meets its diode curve, capped at Iset
+            I=np.zeros(n)
+            for d in set(self.diodes):
+                these=np.array([x is d for x in self.diodes])&lit
+                if these.any():
+                    V=d.VI[:,0][None,:]+d.VI[:,1][None,:]*(Rself[these,None]+Rknee)
+                    I[these]=interp_rows(Vavail[these],V,d.VI[:,1])
+            return np.minimum(I,Iset)
+
+        def iterate(M):
+            diag=np.diag(M)
+            I=current(np.full(n,Vsupply),diag)
+            for _ in range(maxit):
+                # Drops from the other LEDs sharing copper are fixed for this pass
+                I_new=current(Vsupply-(M@I-diag*I),diag)
+                done=np.max(np.abs(I_new-I),initial=0)<tol
+                I=I_new
+                if done:
+                    break
+            return I
+
+        # Same drive with perfect copper, to compare against
+        I0=iterate(Rhigh*(anodenet[:,None]==anodenet[None,:])*together)
+        I=iterate(M)
+        drop=((self.Za+self.Zc)*together)@I
+        Vd=np.zeros(n)
+        for d in set(self.diodes):
+            these=np.array([x is d for x in self.diodes])&lit
+            Vd[these]=d.Vi(I[these])
+        Vout=Vsupply-M@I-Vd
+        with np.errstate(divide='ignore',invalid='ignore'):
+            error=np.where(I0>0,I/I0-1,0.0)
+        return Result(I,I0,error,np.where(lit,drop,0.0),np.where(lit,Vout-Vknee,np.nan))
+
+
+def report(network:Network,result:Result,limit:int=10):
+    """
+    Print the copper resistance of each net and the worst LEDs
+    """
+    ra,rc=network.resistance()
+    print(f"{len(network.leds)} LEDs, {int(network.connected.sum())} connected to their drivers")
+    if not network.connected.all():
+        print("Not connected: "+" ".join(ref for ref,ok in zip(network.leds,network.connected) if not ok))
+    if not network.connected.any():
+        return
+    ra,rc=ra[network.connected],rc[network.connected]
+    print(f"Anode copper {np.min(ra):.3f}-{np.max(ra):.3f} ohm, cathode copper {np.min(rc):.3f}-{np.max(rc):.3f} ohm")
+    print(f"Worst brightness error {np.min(result.error)*100:+.2f}%, lowest headroom {np.nanmin(result.headroom):.3f}V")
+    ra,rc=network.resistance()
+    for i in np.argsort(np.nan_to_num(result.headroom,nan=np.inf))[:min(limit,int(network.connected.sum()))]:
+        print(f"{network.leds[i]} {network.anodenet[i].split('/')[-1]}->{network.cathodenet[i].split('/')[-1]}: "
+              f"R={ra[i]+rc[i]:.3f}ohm drop={result.drop[i]*1000:.1f}mV I={result.I[i]*1000:.2f}mA "
+              f"error={result.error[i]*100:+.2f}% headroom={result.headroom[i]:.3f}V")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='IRDrop.py')
+    parser.add_argument('filename', help='Board file to analyze')
+    parser.add_argument('--vsupply', type=float, default=Vsupply, help=f'High side supply, V (default = {Vsupply})')
+    parser.add_argument('--rhigh', type=float, default=Rhigh, help=f'High side switch resistance, ohms (default = {Rhigh})')
+    parser.add_argument('--iset', type=float, default=Iset*1000, help=f'Sink current, mA (default = {Iset*1000:g})')
+    parser.add_argument('--vknee', type=float, default=Vknee, help=f'Sink dropout voltage, V (default = {Vknee})')
+    parser.add_argument('-n', '--limit', type=int, default=10, help='Number of LEDs to list (default = 10)')
+    args = parser.parse_args()
+    network=Network(from_file(PcbFile.read(args.filename)))
+    report(network,network.solve(Vsupply=args.vsupply,Rhigh=args.rhigh,Iset=args.iset/1000,Vknee=args.vknee),
+           limit=args.limit)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,623 @@
+"""
+Pure-Python description of the clock face matrix layout.
+
+Each of the layout functions (place_diodes(), erase_rings(), rings(),
+arcs(), radials(), taps()) adds footprint placements, erasures, tracks,
+arcs, and vias to the current Plan instead of touching a board, so the
+geometry can be generated and inspected anywhere, with no KiCad running.
+A plan is put on a board either live inside pcbnew by MatrixTraces, or
+straight into the .kicad_pcb file by PlanWriter.
+
+All coordinates in a plan are KiCad global coordinates in integer
+nanometers, the same as pcbnew uses internally.
+"""
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+import RunStats
+from RunStats import stats
+
+#Natural board unit is nanometer, but I want things to be placed to the nearest mil
+mil=25400
+inch=1000*mil
+
+#These are all in mils
+centerX=3500
+centerY=3500
+flatDiodeRad=1460
+domeDiodeRad=flatDiodeRad-10
+outerRingRad=1400
+# From OSHPark design rule 6mil trace width
+ringWidth=6
+# From OSHPark design rule 10mil drill size
+viaDrillDia=10
+# From OSHPark design rule 5mil annular ring
+viaAnnular=5
+viaDia=viaDrillDia+viaAnnular*2
+viaRad=viaDia/2
+# From OSHPark design rule 6mil trace clearance. Add one mil for tolerance.
+minSpacing=7
+ringSpacing=math.ceil(viaRad)+minSpacing+ringWidth/2
+outerViaRad=outerRingRad+ringSpacing
+
+handnames=["Second","Third"]
+
+# How arc() lays rings: "arc" for true PCB_ARC objects, "chord" for the fewest
+# straight chords that stay within arcTolerance of the true circle, or "subslot"
+# for one straight segment per 1.5deg subslot. Arcs and chords are always broken
+# wherever a via or trace on the same net lands on the ring, so junctions
+# connect at an endpoint.
+arcMode="arc"
+# Maximum sagitta in chord mode, in mils
+arcTolerance=0.5
+# Longest single PCB_ARC, in degrees. Keeps full rings from becoming a degenerate arc.
+arcMaxSpan=90
+
+
+class Placement(NamedTuple):
+    """
+    Footprint placement
+
+    :param ref: Reference designator of footprint
+    :param xy: Position of footprint origin, kicad global coordinates
+    :param orientation: Orientation in degrees, counterclockwise as kicad measures it
+    :param flipped: True if the footprint belongs on the back side
+    """
+    ref:str
+    xy:tuple
+    orientation:float
+    flipped:bool
+
+
+class Erase(NamedTuple):
+    """
+    Removal of every track and via on a net which lies entirely outside a radius
+
+    :param signame: Signal name
+    :param rlimit: Radius in mils. Items with both ends further than this from center are erased.
+    """
+    signame:str
+    rlimit:float
+
+
+class Track(NamedTuple):
+    """
+    Straight track. Widths are in nanometers like the coordinates.
+    """
+    signame:str
+    xy0:tuple
+    xy1:tuple
+    layer:str
+    width:int
+
+
+class Arc(NamedTuple):
+    """
+    Arc track through xy0, xymid, and xy1
+    """
+    signame:str
+    xy0:tuple
+    xymid:tuple
+    xy1:tuple
+    layer:str
+    width:int
+
+
+class Via(NamedTuple):
+    """
+    Via. Drill and diameter are in nanometers like the coordinates.
+    """
+    signame:str
+    xy:tuple
+    layer0:str
+    layer1:str
+    drill:int
+    dia:int
+
+
+class Plan:
+    """
+    Everything a layout run intends to do to the board, in the order it was generated
+    """
+    def __init__(self):
+        self.placements=[]
+        self.erasures=[]
+        self.tracks=[]
+        self.arcs=[]
+        self.vias=[]
+        # Arcs waiting for lay_arcs(), and the points where vias and traces land on each net
+        self.pending_arcs=[]
+        self.junctions={}
+
+
+# Plan that the layout functions below add to
+plan=Plan()
+
+
+def polar(*,r:int,theta:float):
+    """
+    Calculate position from polar coordinates
+
+    :param i_board: Front (0) or back (1) board. The front board has the hour
+                    and minute hand, the back board has the second and third hand
+    :param r: distance from center of board in mil. Strongly recommended to only use integral mils.
+    :param theta: Azimuth, measured clockwise from straight up (12:00), in degrees. Fractional degrees allowed.
+    :return: A tuple of x and y global coordinates (nanometers right of and below top-left corner of page)
+
+    Note: All coordinates are converted to integer mils before being converted to kicad global coordinates
+    """
+    x=int(centerX+r*np.sin(np.radians(theta)))
+    y=int(centerY-r*np.cos(np.radians(theta)))
+    return (int(x*mil),int(y*mil))
+
+
+def polar_slot(*,slot:int,m:int,i_ring:int):
+    """
+    Calculate position from polar slot coordinates
+
+    :param i_board: Front (0) or back (1) board. The front board has the hour
+                    and minute hand, the back board has the second and third hand
+    :param slot: Azimuth slot number, from 0 to 59. Each LED in each hand is one slot. Must be an integer
+    :param m: Azimuth subslot number, with 4 subslots in each slot, IE a subslot is 1.5deg. Subslot 0 is 
+              the center of the LED, +1 and +2 are clockwise, -1 is counterclockwise. Can use any
+              float number, but [-1,0,1,2] are the most common.
+    :param i_ring: Ring slot number. Outer complete ring is ring 0.
+    :param theta: Azimuth, measured clockwise from straight up (12:00), in degrees. Fractional degrees allowed.
+    :return: A tuple of x and y global coordinates (nanometers right of and below top-left corner of page)
+
+    Note: All coordinates are converted to integer mils before being converted to kicad global coordinates
+    """
+    return polar(r=outerRingRad-i_ring*ringSpacing,theta=1.5*(slot*4+m))
+
+
+def trace(*,signame:str,xy0:tuple,xy1:tuple,layer:str="F.Cu",width:int=6):
+    """
+    Create a trace
+
+    :param signame: Signal name, must exactly match one of the signal names on the board
+    :param xy0: end 0 of trace in kicad global coordinates
+    :param xy1: end 1 of trace in kicad global coordinates
+    :param layer: Layer to draw trace on, must match one of the copper layers
+    :param width: Width of trace in mils
+    """
+    RunStats.log(2,f"Trace {signame} {layer} {xy0}-{xy1}")
+    plan.tracks.append(Track(signame,xy0,xy1,layer,width*mil))
+    plan.junctions.setdefault(signame,[]).extend((xy0,xy1))
+
+
+def arc_track(*,signame:str,xy0:tuple,xymid:tuple,xy1:tuple,layer:str="F.Cu",width:int=6):
+    """
+    Create a true arc track
+
+    :param signame: Signal name, must exactly match one of the signal names on the board
+    :param xy0: end 0 of arc in kicad global coordinates
+    :param xymid: Any point on the arc between the ends, normally the midpoint
+    :param xy1: end 1 of arc in kicad global coordinates
+    :param layer: Layer to draw arc on, must match one of the copper layers
+    :param width: Width of arc in mils
+    """
+    RunStats.log(2,f"Arc {signame} {layer} {xy0}-{xymid}-{xy1}")
+    plan.arcs.append(Arc(signame,xy0,xymid,xy1,layer,width*mil))
+
+
+def signame(*,i_hand:int=None,eights:int='x',ones:int='x'):
+    """
+    Calculate a signal name from hand indexes
+
+    :param i_board: Front (0) or back (1) board. Hour and minute are on front board, second and third on back.
+    :param i_hand:  Front (0) or back (1) of board. Hour and second are front hands, minute and third are back.
+    :param i_boardhand: 
+    :param tens: Tens digit of signal slot. Either tens or ones must be passed, but not both.
+    :param ones: Ones digit of signal slot
+    """
+    return f"/Bottom Board/{handnames[i_hand]} hand/{handnames[i_hand][0]}{eights}{ones}"
+
+
+def trace_polar(*,i_hand:int,eights:int='x',ones:int='x',
+                  r0:int,theta0:float,r1:int,theta1:float,**kwargs):
+    """
+    Create matching traces on both boards
+    
+    :param i_hand: Front (0) or back (1) hands. Hour and Second are front hands, Minute and Third are back.
+    :param eights:   Tens digit of slot
+    :param ones:   Ones digit of slot
+    :param r0:     radius of end 0 in mils
+    :param theta0: azimuth of end 0 in degrees, clockwise from 12:00
+    :param r1:     radius of end 1 in mils
+    :param theta1: azimuth of end 1
+    :param kwargs: Other arguments passed through to trace()
+    """
+    for i_board in range(1):
+        trace(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
+            xy0=polar(r=r0,theta=theta0),
+            xy1=polar(r=r1,theta=theta1),
+            **kwargs)
+
+
+def trace_polarslot(*,i_hand:int,eights:int='x',ones:int='x',
+                    slot0:int,m0:int,i_ring0:int,
+                    slot1:int,m1:int,i_ring1:int,**kwargs):
+    """
+    Create matching traces on both boards using slot coordinates
+
+    :param i_hand: Front (0) or back (1) hands
+    :param eights: eights digit
+    :param ones:   Ones digit
+    :param slot0: Azimuth slot of end 0
+    :param m0: Azimuth subslot of end 0
+    :param i_ring0: Ring of end 0
+    :param slot1: Azimuth slot of end 1
+    :param m1: Azimuth subslot of end 1
+    :param i_ring1: Ring slot of end 1
+    :param kwargs: Other arguments passed through to trace()
+    """
+    for i_board in range(1):
+        trace(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
+              xy0=polar_slot(slot=slot0,m=m0,i_ring=i_ring0),
+              xy1=polar_slot(slot=slot1,m=m1,i_ring=i_ring1),
+              **kwargs)
+
+
+def via(*,signame:str,xy:tuple,layer0:str="F.Cu",layer1:str="B.Cu",drill:int=viaDrillDia,dia:int=viaDia):
+    """
+    Create a via
+
+    :param signame: Signal name, must exactly match one of the signal names on the board
+    :param xy: Location in kicad global coordinates
+    :param layer0: Layer to start on, must match one of the copper layers
+    :param layer1: Layer to end on
+    :param drill: Drill diameter in mils
+    :param dia: Via diameter in mils
+    """
+    RunStats.log(2,f"Via {signame} {xy}")
+    plan.vias.append(Via(signame,xy,layer0,layer1,drill*mil,dia*mil))
+    plan.junctions.setdefault(signame,[]).append(xy)
+
+
+def via_polar(*,i_hand:int,eights:int='x',ones:int='x',
+              r:int,theta:int,**kwargs):
+    """
+    Create matching vias on both boards
+    
+    :param i_hand: Front (0) or back (1) hands. Hour and Second are front hands, Minute and Third are back.
+    :param eights:   eights digit of slot
+    :param ones:   Ones digit of slot
+    :param r:      Distance from center in mils
+    :param theta:  azimuth in degrees, clockwise from 12:00
+    :param kwargs: Other arguments passed through to via()
+    """
+    via(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
+        xy=polar(r=r,theta=theta),
+        **kwargs)
+
+
+def via_polarslot(*,i_hand:int,eights:int='x',ones:int='x',
+                  slot:int,m:int,i_ring:int,
+                  **kwargs):
+    """
+    Create matching traces on both boards using slot coordinates
+
+    :param i_hand: Front (0) or back (1) hands
+    :param eights:   Eights digit
+    :param ones:   Ones digit
+    :param slot: Azimuth slot
+    :param m: Azimuth subslot
+    :param i_ring: Ring index
+    :param kwargs: Other arguments passed through to via()
+    """
+    for i_board in range(1):
+        via(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
+            xy=polar_slot(slot=slot,m=m,i_ring=i_ring),
+            **kwargs)
+
+
+def place_diodes():
+    for i_hand,rad in zip(range(2),(domeDiodeRad,domeDiodeRad)):
+        for i_diode in range(60):
+            modref="D%01d%02d"%(i_hand+2,i_diode)
+            theta=i_diode*6
+            plan.placements.append(Placement(modref,polar(r=rad,theta=theta),-theta+180*i_hand,i_hand==1))
+
+
+def erase_rings():
+    # Each net is erased only outside its own ring. The taps run inward from
+    # the rings into the rest of the circuit and are routed by hand, so the
+    # copper that reaches inside the ring is left alone.
+    for i_hand in range(2):
+        for i in range(8):
+            for this_signame,i_ring in ((signame(i_hand=i_hand,ones  =i),2+8*i_hand+i),
+                                        (signame(i_hand=i_hand,eights=i),1-i_hand)):
+                plan.erasures.append(Erase(this_signame,int(outerRingRad-(i_ring+0.5)*ringSpacing)))
+
+
+def arc(*,i_hand:int,eights:int='x',ones:int='x',
+               i_ring:int,
+               slot0:int=0,m0:int=0,
+               slot1:int=0,m1:int=0,
+               **kwargs):
+    """
+    Create matching arcs on both boards using slot coordinates
+
+    :param i_hand: Front (0) or back (1) hands
+    :param eights:   eights digit
+    :param ones:   Ones digit
+    :param i_ring: Ring index
+    :param slot0: Azimuth slot 0
+    :param m0: Azimuth subslot 0
+    :param slot1: Azimuth slot 1
+    :param m1: Azimuth subslot 1
+    :param kwargs: Other arguments passed through to trace()
+    """
+    # Do everything internally in subslots, since it's easier to iterate.
+    # Even though subslots are conventionally [-1..2], they are unbounded.
+    # Nothing is drawn until lay_arcs(), once all the junctions are known.
+    plan.pending_arcs.append(dict(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
+                             i_ring=i_ring,m0=slot0*4+m0,m1=slot1*4+m1,**kwargs))
+
+
+def lay_arc(*,signame:str,i_ring:int,m0:int,m1:int,**kwargs):
+    """
+    Draw one ring arc according to arcMode
+
+    :param signame: Signal name
+    :param i_ring: Ring index
+    :param m0: Subslot of start of arc, counting from slot 0
+    :param m1: Subslot of end of arc
+    :param kwargs: Other arguments passed through to trace() or arc_track()
+    """
+    if arcMode=="subslot":
+        for m in range(m0,m1):
+            trace(signame=signame,
+                  xy0=polar_slot(slot=0,m=m  ,i_ring=i_ring),
+                  xy1=polar_slot(slot=0,m=m+1,i_ring=i_ring),**kwargs)
+        return
+    r=outerRingRad-i_ring*ringSpacing
+    theta0=1.5*m0
+    theta1=1.5*m1
+    # Break the arc at every junction on this net that sits on the ring, using
+    # the junction's own coordinates so that the ends meet exactly. polar()
+    # truncates to whole mils, which can put a point on the ring up to sqrt(2)
+    # mils off it, so allow a little more than that.
+    breaks=[]
+    for xy in plan.junctions.get(signame,[]):
+        x=xy[0]/mil-centerX
+        y=xy[1]/mil-centerY
+        if abs(math.hypot(x,y)-r)>1.5:
+            continue
+        theta=theta0+(math.degrees(math.atan2(x,-y))-theta0)%360
+        if theta0+0.1<theta<theta1-0.1:
+            breaks.append((theta,xy))
+    breaks.sort(key=lambda b:b[0])
+    points=[(theta0,polar(r=r,theta=theta0))]+breaks+[(theta1,polar(r=r,theta=theta1))]
+    if arcMode=="chord":
+        maxSpan=math.degrees(2*math.acos(1-arcTolerance/r))
+    else:
+        maxSpan=arcMaxSpan
+    for (ta,xya),(tb,xyb) in zip(points[:-1],points[1:]):
+        n=max(1,math.ceil((tb-ta)/maxSpan))
+        xys=[xya]+[polar(r=r,theta=ta+(tb-ta)*i/n) for i in range(1,n)]+[xyb]
+        for i in range(n):
+            if arcMode=="chord":
+                trace(signame=signame,xy0=xys[i],xy1=xys[i+1],**kwargs)
+            else:
+                arc_track(signame=signame,xy0=xys[i],xy1=xys[i+1],
+                          xymid=polar(r=r,theta=ta+(tb-ta)*(i+0.5)/n),**kwargs)
+
+
+def lay_arcs():
+    """
+    Draw all the arcs queued by arc(). Call once all vias and traces that might
+    land on a ring have been created, so the arcs can be broken at them.
+    """
+    for this_arc in plan.pending_arcs:
+        lay_arc(**this_arc)
+    plan.pending_arcs=[]
+    plan.junctions.clear()
+
+
+def rings():
+    """
+    Draw complete rings for each ones position on each hand (total of 20 rings)
+    """
+    for i_hand in range(2):
+        for ones in range(8):
+            arc(i_hand=i_hand,ones=ones,i_ring=i_hand*8+ones+2,m0=0,m1=240)
+
+
+def arcs():
+    """
+    Draw partial rings for each tens position on each hand. Total of 16 arcs, but
+    all 8 of each hand can go in the same ring, so only 2 rings total.
+    """
+    for i_hand in range(2):
+        for eights in range(8):
+            RunStats.log(2,f"Laying arc {signame(i_hand=i_hand,eights=eights)}")
+            dm=-1 if i_hand==1 else 1
+            dslot=7 if eights!=7 else 3
+            arc(i_hand=i_hand,eights=eights,
+                slot0=eights*8,m0=dm,
+                slot1=eights*8+dslot,m1=dm+1,i_ring=1-i_hand)
+
+
+def radial(*,i_hand:int,eights:int='x',ones:int='x',
+             i_ring:int,theta:float,rad_ofs:int,theta_ofs:float):
+    """
+    Create matching radial traces on both boards. Each radial runs from 
+    the appropriate ring to the diode pad. Front side LEDs 
+
+
+    :param i_hand: Front (0) or back (1) hands
+    :param eights:   eights digit
+    :param ones:   Ones digit
+    :param i_ring: Ring index of inner end. All traces end near the diodes.
+    :param kwargs: Other arguments passed through to trace()
+    """
+    ringRad=outerRingRad-(i_ring)*ringSpacing
+    diodeRad=domeDiodeRad
+    if i_hand==0:
+       outerRad=outerViaRad
+    else:
+       outerRad=diodeRad
+    # X0x from ring to inward of center of diode
+    trace_polar(i_hand=i_hand,eights=eights,ones=ones,
+       r0=ringRad,theta0=theta,
+       r1=outerRad+rad_ofs,theta1=theta,layer="B.Cu")
+    # Via at ring
+    via_polar(i_hand=i_hand,eights=eights,ones=ones,
+       r=ringRad,theta=theta)
+    if i_hand==0:
+        # Via at outer end of radial to front side
+        via_polar(i_hand=i_hand,eights=eights,ones=ones,
+          r=outerRad+rad_ofs,theta=theta)
+        # Front-side trace from via to left pad
+        trace_polar(i_hand=i_hand,eights=eights,ones=ones,
+          r0=diodeRad        ,theta0=theta+theta_ofs,
+          r1=outerRad+rad_ofs,theta1=theta          ,layer="F.Cu")
+
+
+def radials():
+    for i_slot in range(60):
+        ones=i_slot%8
+        eights=i_slot//8
+        theta0=i_slot*6
+        theta1=theta0+1.5
+        theta2=theta1+1.5
+        thetam=theta0-1.5
+        i_ring0=2+ones
+        i_ring1=10+ones
+        i_ring2=1
+        i_ringm=0
+        radial(i_hand=0,ones=ones,i_ring=i_ring0,theta=theta0,rad_ofs=0                       ,theta_ofs=-1.2)
+        radial(i_hand=1,ones=ones,i_ring=i_ring1,theta=theta1,rad_ofs=0                       ,theta_ofs= 0  )
+        radial(i_hand=0,eights=eights,i_ring=i_ring2,theta=theta2,rad_ofs=flatDiodeRad-outerViaRad,theta_ofs=-1.5)
+        radial(i_hand=1,eights=eights,i_ring=i_ringm,theta=thetam,rad_ofs=0                       ,theta_ofs= 0  )
+
+
+def tap(*,i_hand:int,eights:int='x',ones:int='x',slot:int,m:int,hasvia:bool=False,layer:str="B.Cu"):
+    """
+    Create a pair of traces inward from rings so that they can join the internal circuitry.
+    Tap positions must be chosen manually (in taps() and draft_taps() below) but are then drawn automatically.
+    
+    :param i_hand:
+    :param eights:
+    :param ones:
+    :param slot:
+    :param m:
+    :param hasvia: If True, draw a new via on the ring connecting the ring to the tap. If false, don't
+                   draw one (because it's there already)
+    """
+    if eights=='x':
+        i_ring=2+8*i_hand+ones
+    else:
+        i_ring=1-i_hand
+    trace_polarslot(i_hand=i_hand,eights=eights,ones=ones,
+                    slot0=slot,m0=m,i_ring0=i_ring,
+                    slot1=slot,m1=m,i_ring1=22    ,layer=layer)
+    if hasvia:
+        via_polarslot(i_hand=i_hand,eights=eights,ones=ones,slot=slot,m=m,i_ring=i_ring)
+
+
+@stats.phase("taps")
+def taps():
+    """
+    Taps that are routed on the board. The trace of a routed tap reaches inside
+    its ring, so erase_rings() keeps it, but the via that joins it to the ring is
+    erased with the ring and has to be drawn again.
+    """
+    via_polarslot(i_hand=0,ones=0,slot= 1,m=-1,i_ring=2)
+
+
+def draft_taps():
+    """
+    Tap positions for the rest of the rings. These aren't final, they still clash
+    with each other and with the rings, so they aren't part of layout(). The old
+    decimal matrix also had taps for ones 8 and 9, which the eights/ones matrix
+    doesn't have.
+    """
+    tap(i_hand=0,ones=0,slot= 1,m=-1,hasvia=True)
+    tap(i_hand=0,ones=1,slot= 0,m= 2,hasvia=True)
+    tap(i_hand=0,ones=2,slot= 0,m= 0,hasvia=True)
+    tap(i_hand=0,ones=3,slot= 0,m=-1,hasvia=True)
+    tap(i_hand=0,ones=4,slot=59,m= 2,hasvia=True)
+    tap(i_hand=0,ones=5,slot=59,m=-1,hasvia=True)
+    tap(i_hand=0,ones=6,slot=58,m= 2,hasvia=True)
+    tap(i_hand=0,ones=7,slot=58,m=-1,hasvia=True)
+    tap(i_hand=1,ones=0,slot=30,m= 1)
+    tap(i_hand=1,ones=1,slot=30,m= 0,hasvia=True)
+    tap(i_hand=1,ones=2,slot=30,m=-1,hasvia=True)
+    tap(i_hand=1,ones=3,slot=29,m= 2,hasvia=True)
+    tap(i_hand=1,ones=4,slot=29,m= 0,hasvia=True)
+    tap(i_hand=1,ones=5,slot=29,m=-1,hasvia=True)
+    tap(i_hand=1,ones=6,slot=28,m= 2,hasvia=True)
+    tap(i_hand=1,ones=7,slot=28,m= 0,hasvia=True)
+    tap(i_hand=0,eights=0,slot= 3,m= 2,hasvia=False)
+
+    tap(i_hand=1,eights=2,slot=27,m=-1,hasvia=False)
+    via_polarslot(i_hand=1,eights=2,i_ring=22,slot=27,m=-1)
+    arc(i_hand=1,eights=2,i_ring=22,slot0=27,m0=-1,slot1=32,m1=-2)
+
+    tap(i_hand=1,eights=3,slot=31,m=-1,hasvia=False)
+
+    tap(i_hand=1,eights=4,slot=40,m=-1,hasvia=False)
+    arc(i_hand=1,eights=4,i_ring=22,slot1=39,m1= 1,slot0=31,m0=0,layer='B.Cu')
+    trace_polarslot(i_hand=1,eights=4,i_ring0=23,slot0=40,m0=-2,i_ring1=22,slot1=40,m1=-1,layer='B.Cu')
+    trace_polarslot(i_hand=1,eights=4,i_ring0=23,slot0=39,m0= 2,i_ring1=22,slot1=39,m1= 1,layer='B.Cu')
+
+    tap(i_hand=0,eights=3,slot=39,m= 2,hasvia=False)
+
+    tap(i_hand=0,eights=4,slot=49,m= 2,hasvia=False)
+    via_polarslot(i_hand=0,eights=4,i_ring=22,slot=49,m=2)
+    arc(i_hand=0,eights=4,i_ring=22,slot0=49,m0= 2,slot1=61,m1=-1)
+
+    tap(i_hand=0,eights=5,slot=56,m= 2,hasvia=False)
+    trace_polarslot(i_hand=0,eights=5,i_ring0=22,slot0=56,m0= 2,i_ring1=23,slot1=56,m1= 2,layer='B.Cu')
+    via_polarslot(i_hand=0,eights=5,i_ring=23,slot=56,m=2)
+    arc(i_hand=0,eights=5,i_ring=23,slot0=56,m0= 2,slot1=60,m1=2)
+
+    tap(i_hand=0,eights=1,slot=10,m= 2,hasvia=False)
+    via_polarslot(i_hand=0,eights=1,i_ring=22,slot=10,m=2)
+    arc(i_hand=0,eights=1,i_ring=22,slot1=10,m1= 2,slot0=2,m0= 0)
+
+    tap(i_hand=1,eights=1,slot=19,m=-1,hasvia=False)
+    via_polarslot(i_hand=1,eights=1,i_ring=22,slot=19,m=-1)
+    arc(i_hand=1,eights=1,i_ring=22,slot0=19,m0=-1,slot1=26,m1= 1)
+    trace_polarslot(i_hand=1,eights=1,i_ring0=22,slot0=26,m0= 1,i_ring1=23,slot1=27,m1=-2)
+    arc(i_hand=1,eights=1,i_ring=23,slot1=31,m1= 0,slot0=26,m0= 1)
+
+    tap(i_hand=1,eights=5,slot=50,m=-1,hasvia=False)
+
+    tap(i_hand=1,eights=0,slot= 9,m=-1,hasvia=False)
+
+    tap(i_hand=1,eights=2,slot=20,m= 2,hasvia=False)
+
+
+def layout(*,place:bool=True):
+    """
+    Generate the whole matrix layout
+
+    :param place: If True, include the diode placements
+    :return: New Plan holding the layout
+    """
+    global plan
+    plan=Plan()
+    if place:
+        with stats.phase("place"):
+            place_diodes()
+    with stats.phase("erase"):
+        erase_rings()
+    with stats.phase("rings"):
+        rings()
+    with stats.phase("arcs"):
+        arcs()
+    with stats.phase("radials"):
+        radials()
+    taps()
+    with stats.phase("lay_arcs"):
+        lay_arcs()
+    stats.count("planned_tracks",len(plan.tracks))
+    stats.count("planned_arcs",len(plan.arcs))
+    stats.count("planned_vias",len(plan.vias))
+    return plan
@@ -5,503 +5,389 @@ import sys
 sys.path.append('/home/jeppesen/workspace/Precision23/kicad')
 import MatrixTraces
 
-Script will always throw an exception before reaching the end,
-either due to a bug or an intentional AssertionError. This keeps
-the module from being properly imported, so it can be rerun
-just by re-doing the import MatrixTraces.
-
-
-
+Importing lays out the whole matrix once. To rerun after the module
+is imported, do MatrixTraces.run(). The geometry itself comes from
+LayoutPlan, this module only puts a plan on the live board. All board
+changes of a run are queued in a BoardSession and only hit the board
+(followed by a single refresh) once the run completes. If anything
+fails, the whole run is rolled back and the board is left as it was.
+Each run ends with a summary of where its time went and what it changed,
+see RunStats for the JSON record and for logging individual items.
+
+To lay out the board file without KiCad running, use PlanWriter instead.
 """
 
 import pcbnew
-import math
 import numpy as np
 
+import Clearance
+import LayoutPlan
+import PolarSelect
+import Reconcile
+from RunStats import stats
+
 # most queries start with a board
 board = pcbnew.GetBoard()
 
-#Natural board unit is nanometer, but I want things to be placed to the nearest mil
-mil=25400
-inch=1000*mil
-
-#These are all in mils
-centerX=3500
-centerY=3500
-flatDiodeRad=1460
-domeDiodeRad=flatDiodeRad-10
-outerRingRad=1400
-# From OSHPark design rule 6mil trace width
-ringWidth=6
-# From OSHPark design rule 10mil drill size
-viaDrillDia=10
-# From OSHPark design rule 5mil annular ring
-viaAnnular=5
-viaDia=viaDrillDia+viaAnnular*2
-viaRad=viaDia/2
-# From OSHPark design rule 6mil trace clearance. Add one mil for tolerance.
-minSpacing=7
-ringSpacing=math.ceil(viaRad)+minSpacing+ringWidth/2
-outerViaRad=outerRingRad+ringSpacing
-print("Ring Spacing: %f"%ringSpacing)
-
-handnames=["Second","Third"]
-
-
-#Ugly hack from https://electronics.stackexchange.com/q/437065
-layertable = {}
-
-numlayers=pcbnew.PCB_LAYER_ID_COUNT
-for i in range(numlayers):
-    name = board.GetLayerName(i)
-    layertable[name]=i
-print(layertable)
-
-
-def polar(*,r:int,theta:float):
-    """
-    Calculate position from polar coordinates
+# If True, a layout with clearance violations is not put on the board at all
+strictClearance=False
+# Where the JSON summary of each run goes, None to print it
+statsFile=None
 
-    :param i_board: Front (0) or back (1) board. The front board has the hour
-                    and minute hand, the back board has the second and third hand
-    :param r: distance from center of board in mil. Strongly recommended to only use integral mils.
-    :param theta: Azimuth, measured clockwise from straight up (12:00), in degrees. Fractional degrees allowed.
-    :return: A VECTOR2I with x and y global coordinates (nanometers right of and below top-left corner of page)
 
-    Note: All coordinates are converted to integer mils before being converted to kicad global coordinates
+class BoardSession:
     """
-    x=int(centerX+r*np.sin(np.radians(theta)))
-    y=int(centerY-r*np.cos(np.radians(theta)))
-    return pcbnew.VECTOR2I(int(x*mil),int(y*mil))
+    Batched access to a board. Net codes and the layer table are looked up
+    once, tracks and vias are queued and only added to, removed from, or
+    changed on the board by commit(), and the view is refreshed once per
+    commit rather than once per ring.
 
+    Use as a context manager: the batch is committed if the block completes,
+    and rolled back if it raises.
+    """
+    def __init__(self,board):
+        self.board=board
+        #Ugly hack from https://electronics.stackexchange.com/q/437065
+        self.layertable={}
+        for i in range(pcbnew.PCB_LAYER_ID_COUNT):
+            self.layertable[board.GetLayerName(i)]=i
+        self.nets=board.GetNetsByName()
+        self.netcodes={}
+        self.pending_add=[]
+        self.pending_remove=[]
+        self.pending_move=[]
+        self.pending_modify=[]
+        self.added=[]
+        self.removed=[]
+        self.moved=[]
+        self.modified=[]
+
+    def net(self,signame:str):
+        """
+        Look up a net by name, cached
+
+        :param signame: Signal name, must exactly match one of the signal names on the board
+        :return: NETINFO_ITEM for the net
+        """
+        if signame not in self.netcodes:
+            stats.count("net_lookups")
+            self.netcodes[signame]=self.nets[signame]
+        else:
+            stats.count("net_cache_hits")
+        return self.netcodes[signame]
+
+    def add(self,item):
+        """
+        Queue a track or via to be added to the board on commit
+        """
+        self.pending_add.append(item)
+
+    def remove(self,item):
+        """
+        Queue a board item to be removed from the board on commit
+        """
+        self.pending_remove.append(item)
+
+    def modify(self,item,*,width:int=None,layer:int=None):
+        """
+        Queue a change to a track or via, applied on commit
+
+        :param width: New width in nanometers, None to leave it
+        :param layer: New layer ID, None to leave it
+        """
+        self.pending_modify.append((item,width,layer))
+
+    def move(self,mod,*,xy:pcbnew.VECTOR2I,orientation:float,flipped:bool):
+        """
+        Queue a footprint placement to be applied on commit
+
+        :param mod: Footprint to place
+        :param xy: Position in kicad global coordinates
+        :param orientation: Orientation in degrees
+        :param flipped: True if the footprint belongs on the back side
+        """
+        self.pending_move.append((mod,xy,orientation,flipped))
+
+    def commit(self):
+        """
+        Apply everything queued to the board and refresh the view once. If
+        any change fails, everything already applied in this commit is undone.
+        """
+        try:
+            with stats.phase("commit"):
+                self.apply_pending()
+        except Exception:
+            self.rollback()
+            raise
+        stats.count("moved",len(self.moved))
+        stats.count("removed",len(self.removed))
+        stats.count("added",len(self.added))
+        stats.count("modified",len(self.modified))
+        self.pending_add=[]
+        self.pending_remove=[]
+        self.pending_move=[]
+        self.pending_modify=[]
+        self.added=[]
+        self.removed=[]
+        self.moved=[]
+        self.modified=[]
+        self.refresh()
+
+    def apply_pending(self):
+        """
+        Make the queued changes to the board, remembering each so it can be undone
+        """
+        for mod,xy,orientation,flipped in self.pending_move:
+            self.moved.append((mod,mod.GetPosition(),mod.GetOrientation(),mod.IsFlipped()))
+            mod.SetPosition(xy)
+            if mod.IsFlipped()!=flipped:
+                mod.SetLayerAndFlip(self.layertable["B.Cu" if flipped else "F.Cu"])
+            mod.SetOrientation(pcbnew.EDA_ANGLE(orientation,pcbnew.DEGREES_T))
+        for item in self.pending_remove:
+            self.board.Remove(item)
+            self.removed.append(item)
+        for item,width,layer in self.pending_modify:
+            self.modified.append((item,item.GetWidth(),item.GetLayer()))
+            if width is not None:
+                item.SetWidth(width)
+            if layer is not None:
+                item.SetLayer(layer)
+        for item in self.pending_add:
+            self.board.Add(item)
+            self.added.append(item)
+
+    def refresh(self):
+        """
+        Redraw the view
+        """
+        stats.count("refreshes")
+        with stats.phase("refresh"):
+            pcbnew.Refresh()
 
-def polar_slot(*,slot:int,m:int,i_ring:int):
+    def rollback(self):
+        """
+        Drop everything queued, and undo anything a failed commit already applied
+        """
+        stats.count("rollbacks")
+        for item in reversed(self.added):
+            self.board.Remove(item)
+        for item,width,layer in reversed(self.modified):
+            item.SetWidth(width)
+            item.SetLayer(layer)
+        for item in reversed(self.removed):
+            self.board.Add(item)
+        for mod,xy,orientation,flipped in reversed(self.moved):
+            if mod.IsFlipped()!=flipped:
+                mod.SetLayerAndFlip(self.layertable["B.Cu" if flipped else "F.Cu"])
+            mod.SetPosition(xy)
+            mod.SetOrientation(orientation)
+        self.pending_add=[]
+        self.pending_remove=[]
+        self.pending_move=[]
+        self.pending_modify=[]
+        self.added=[]
+        self.removed=[]
+        self.moved=[]
+        self.modified=[]
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+session=BoardSession(board)
+layertable=session.layertable
+
+
+def vector(xy:tuple):
     """
-    Calculate position from polar slot coordinates
-
-    :param i_board: Front (0) or back (1) board. The front board has the hour
-                    and minute hand, the back board has the second and third hand
-    :param slot: Azimuth slot number, from 0 to 59. Each LED in each hand is one slot. Must be an integer
-    :param m: Azimuth subslot number, with 4 subslots in each slot, IE a subslot is 1.5deg. Subslot 0 is 
-              the center of the LED, +1 and +2 are clockwise, -1 is counterclockwise. Can use any
-              float number, but [-1,0,1,2] are the most common.
-    :param i_ring: Ring slot number. Outer complete ring is ring 0.
-    :param theta: Azimuth, measured clockwise from straight up (12:00), in degrees. Fractional degrees allowed.
-    :return: A VECTOR2I with x and y global coordinates (nanometers right of and below top-left corner of page)
-
-    Note: All coordinates are converted to integer mils before being converted to kicad global coordinates
+    Convert plan coordinates to a kicad vector
     """
-    return polar(r=outerRingRad-i_ring*ringSpacing,theta=1.5*(slot*4+m))
+    return pcbnew.VECTOR2I(int(xy[0]),int(xy[1]))
 
 
-def trace(*,signame:str,xy0:pcbnew.VECTOR2I,xy1:pcbnew.VECTOR2I,layer:str="F.Cu",width:int=6):
+def erase_mask(selection:PolarSelect.BoardSelection,erasures:list):
     """
-    Create a trace
+    Select every track and via on the erased nets which lies entirely outside
+    the erasure radius. All endpoints on the board are pulled out once and the
+    selection is done on arrays, rather than net by net.
 
-    :param signame: Signal name, must exactly match one of the signal names on the board
-    :param xy0: end 0 of trace in kicad global coordinate vector
-    :param xy1: end 1 of trace in kicad global coordinate vector
-    :param layer: Layer to draw trace on, must match one of the copper layers
-    :param width: Width of trace in mils
-    """
-    print(f"{signame=}")
-    net=board.GetNetsByName()[signame]
-    track=pcbnew.PCB_TRACK(board)
-    track.SetStart(xy0)
-    track.SetEnd  (xy1)          
-    track.SetWidth(width*mil)
-    track.SetNetCode(net.GetNetCode())
-    track.SetLayer(layertable[layer])
-    #track.SetLocked(True)
-    board.Add(track)
-
-
-def signame(*,i_hand:int=None,eights:int='x',ones:int='x'):
+    :param erasures: List of LayoutPlan.Erase
+    :return: Boolean mask over the selection
     """
-    Calculate a signal name from hand indexes
-
-    :param i_board: Front (0) or back (1) board. Hour and minute are on front board, second and third on back.
-    :param i_hand:  Front (0) or back (1) of board. Hour and second are front hands, minute and third are back.
-    :param i_boardhand: 
-    :param tens: Tens digit of signal slot. Either tens or ones must be passed, but not both.
-    :param ones: Ones digit of signal slot
-    """
-    print(f"{i_hand=}")
-    return f"/Bottom Board/{handnames[i_hand]} hand/{handnames[i_hand][0]}{eights}{ones}"
+    mask=np.zeros(len(selection.items),dtype=bool)
+    for rlimit in sorted(set(erasure.rlimit for erasure in erasures)):
+        signames=[erasure.signame for erasure in erasures if erasure.rlimit==rlimit]
+        mask|=selection.select(r0=rlimit,net=signames)
+    return mask
 
 
-def trace_polar(*,i_hand:int,eights:int='x',ones:int='x',
-                  r0:int,theta0:float,r1:int,theta1:float,**kwargs):
+def erase(erasures:list):
     """
-    Create matching traces on both boards
-    
-    :param i_hand: Front (0) or back (1) hands. Hour and Second are front hands, Minute and Third are back.
-    :param eights:   Tens digit of slot
-    :param ones:   Ones digit of slot
-    :param r0:     radius of end 0 in mils
-    :param theta0: azimuth of end 0 in degrees, clockwise from 12:00
-    :param r1:     radius of end 1 in mils
-    :param theta1: azimuth of end 1
-    :param kwargs: Other arguments passed through to trace()
+    Queue removal of everything the erasures of a plan select
+
+    :param erasures: List of LayoutPlan.Erase
     """
-    for i_board in range(1):
-        trace(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
-            xy0=polar(r=r0,theta=theta0),
-            xy1=polar(r=r1,theta=theta1),
-            **kwargs)
+    with stats.phase("select"):
+        selection=PolarSelect.BoardSelection(board)
+        mask=erase_mask(selection,erasures)
+    selection.remove(mask,session)
 
 
-def trace_polarslot(*,i_hand:int,eights:int='x',ones:int='x',
-                    slot0:int,m0:int,i_ring0:int,
-                    slot1:int,m1:int,i_ring1:int,**kwargs):
+def erase_region(**kwargs):
     """
-    Create matching traces on both boards using slot coordinates
-
-    :param i_hand: Front (0) or back (1) hands
-    :param eights: eights digit
-    :param ones:   Ones digit
-    :param slot0: Azimuth slot of end 0
-    :param m0: Azimuth subslot of end 0
-    :param i_ring0: Ring of end 0
-    :param slot1: Azimuth slot of end 1
-    :param m1: Azimuth subslot of end 1
-    :param i_ring1: Ring slot of end 1
-    :param kwargs: Other arguments passed through to trace()
+    Erase every track and via in a region of the face as one batch
+
+    :param kwargs: Region, net, and layer to erase, see PolarSelect.PolarSelection.select()
     """
-    for i_board in range(1):
-        trace(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
-              xy0=polar_slot(slot=slot0,m=m0,i_ring=i_ring0),
-              xy1=polar_slot(slot=slot1,m=m1,i_ring=i_ring1),
-              **kwargs)
+    with session:
+        selection=PolarSelect.BoardSelection(board)
+        selection.remove(selection.select(**kwargs),session)
 
 
-def via(*,signame:str,xy:pcbnew.VECTOR2I,layer0:str="F.Cu",layer1:str="B.Cu",drill:int=viaDrillDia,dia:int=viaDia):
+def apply(plan:LayoutPlan.Plan):
     """
-    Create a via
-
-    :param signame: Signal name, must exactly match one of the signal names on the board
-    :param xy: Location kicad global coordinate vector
-    :param layer0: Layer to start on, must match one of the copper layers
-    :param layer1: Layer to end on
-    :param drill: Drill diameter in mils
-    :param dia: Via diameter in mils
-    """
-    pvia=pcbnew.PCB_VIA(board)
-    pvia.SetLayerPair(layertable[layer0],layertable[layer1])
-    pvia.SetPosition(xy)
-    net=board.GetNetsByName()[signame]
-    pvia.SetNet(net)
-    pvia.SetDrill(drill*mil)
-    pvia.SetWidth(dia*mil)
-    #pvia.SetLocked(True)
-    board.Add(pvia)
-
-
-def via_polar(*,i_hand:int,eights:int='x',ones:int='x',
-              r:int,theta:int,**kwargs):
-    """
-    Create matching vias on both boards
-    
-    :param i_hand: Front (0) or back (1) hands. Hour and Second are front hands, Minute and Third are back.
-    :param eights:   eights digit of slot
-    :param ones:   Ones digit of slot
-    :param r:      Distance from center in mils
-    :param theta:  azimuth in degrees, clockwise from 12:00
-    :param kwargs: Other arguments passed through to via()
+    Queue everything in a plan on the current session
+
+    :param plan: Plan from LayoutPlan.layout()
     """
-    via(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
-        xy=polar(r=r,theta=theta),
-        **kwargs)
+    for placement in plan.placements:
+        mod=board.FindFootprintByReference(placement.ref)
+        session.move(mod,xy=vector(placement.xy),orientation=placement.orientation,flipped=placement.flipped)
+    erase(plan.erasures)
+    with stats.phase("build"):
+        build(plan)
 
 
-def via_polarslot(*,i_hand:int,eights:int='x',ones:int='x',
-                  slot:int,m:int,i_ring:int,
-                  **kwargs):
+def build(plan:LayoutPlan.Plan):
     """
-    Create matching traces on both boards using slot coordinates
-
-    :param i_hand: Front (0) or back (1) hands
-    :param eights:   Eights digit
-    :param ones:   Ones digit
-    :param slot: Azimuth slot
-    :param m: Azimuth subslot
-    :param i_ring: Ring index
-    :param kwargs: Other arguments passed through to via()
+    Create the board items of the tracks, arcs, and vias of a plan and queue them on the current session
     """
-    for i_board in range(1):
-        via(signame=signame(i_hand=i_hand,eights=eights,ones=ones),
-            xy=polar_slot(slot=slot,m=m,i_ring=i_ring),
-            **kwargs)
-
-
-def place_diodes():
-    for i_hand,rad in zip(range(2),(domeDiodeRad,domeDiodeRad)):
-        for i_diode in range(60):
-            modref="D%01d%02d"%(i_hand+2,i_diode)
-            print(modref)
-            mod=board.FindFootprintByReference(modref)
-            #for pad in mod.Pads():
-            #     print("pad {}({}) on {}({}) at {},{} shape {} size {},{}".format(pad.GetPadName(),
-            #        pad.GetNet().GetNetname(),
-            #        mod.GetReference(),
-            #        mod.GetValue(),
-            #        pad.GetPosition().x, pad.GetPosition().y,
-            #        padshapes[pad.GetShape()],
-            #        pad.GetSize().x, pad.GetSize().y
-            #     ))
-            theta=i_diode*6
-            mod.SetPosition(polar(r=rad,theta=theta))
-            if(mod.IsFlipped()!=(i_hand==1)):
-                mod.SetLayerAndFlip(layertable["B.Cu"])
-            mod.SetOrientation(pcbnew.EDA_ANGLE(-theta+180*i_hand,pcbnew.DEGREES_T))
-    pcbnew.Refresh()
-
-
-place_diodes()
-#raise AssertionError("Stop!")
-
-
-def erase_rings():
-    nets=board.GetNetsByName()
-    rlimit=int(outerRingRad-23.1*ringSpacing)
-    for i_hand in range(2):
-        Ps=[signame(i_hand=i_hand,ones  =i) for i in range(8)]
-        Qs=[signame(i_hand=i_hand,eights=i) for i in range(8)]
-        for this_signame in Ps+Qs:
-            print(f"Erasing net {this_signame}:")
-            net=nets[this_signame]
-            for i_track,track in enumerate(board.TracksInNet(net.GetNetCode())):
-                 x0=track.GetStart().x/mil
-                 x1=track.GetEnd  ().x/mil
-                 y0=track.GetStart().y/mil
-                 y1=track.GetEnd  ().y/mil
-                 r0=np.sqrt((x0-centerX)**2+(y0-centerY)**2)
-                 r1=np.sqrt((x1-centerX)**2+(y1-centerY)**2)
-                 print(f"Checking track {i_track}, {r0=},{r1=},{rlimit=}")
-                 if r0>rlimit and r1>rlimit:
-                     board.Remove(track)
-    pcbnew.Refresh()
-
-
-erase_rings()
-#raise AssertionError("Stop!")
-
-def arc(*,i_hand:int,eights:int='x',ones:int='x',
-               i_ring:int,
-               slot0:int=0,m0:int=0,
-               slot1:int=0,m1:int=0,
-               **kwargs):
+    for item in plan.tracks:
+        track=pcbnew.PCB_TRACK(board)
+        track.SetStart(vector(item.xy0))
+        track.SetEnd  (vector(item.xy1))
+        track.SetWidth(item.width)
+        track.SetNetCode(session.net(item.signame).GetNetCode())
+        track.SetLayer(layertable[item.layer])
+        session.add(track)
+    for item in plan.arcs:
+        track=pcbnew.PCB_ARC(board)
+        track.SetStart(vector(item.xy0))
+        track.SetMid  (vector(item.xymid))
+        track.SetEnd  (vector(item.xy1))
+        track.SetWidth(item.width)
+        track.SetNetCode(session.net(item.signame).GetNetCode())
+        track.SetLayer(layertable[item.layer])
+        session.add(track)
+    for item in plan.vias:
+        pvia=pcbnew.PCB_VIA(board)
+        pvia.SetLayerPair(layertable[item.layer0],layertable[item.layer1])
+        pvia.SetPosition(vector(item.xy))
+        pvia.SetNet(session.net(item.signame))
+        pvia.SetDrill(item.drill)
+        pvia.SetWidth(item.dia)
+        session.add(pvia)
+
+
+def board_key(track):
     """
-    Create matching arcs on both boards using slot coordinates
-
-    :param i_hand: Front (0) or back (1) hands
-    :param eights:   eights digit
-    :param ones:   Ones digit
-    :param i_ring: Ring index
-    :param slot0: Azimuth slot 0
-    :param m0: Azimuth subslot 0
-    :param slot1: Azimuth slot 1
-    :param m1: Azimuth subslot 1
-    :param kwargs: Other arguments passed through to trace()
+    Reconcile key of a track, arc, or via on the board
     """
-    # Do everything internally in subslots, since it's easier to iterate.
-    # Even though subslots are conventionally [-1..2], they are unbounded.
-    for m in range(slot0*4+m0,slot1*4+m1):
-        trace_polarslot(i_hand=i_hand,eights=eights,ones=ones,
-             slot0=0,m0=m  ,i_ring0=i_ring,
-             slot1=0,m1=m+1,i_ring1=i_ring,
-             **kwargs)
-
-
-def rings():
+    xy0=(track.GetStart().x,track.GetStart().y)
+    xy1=(track.GetEnd().x,track.GetEnd().y)
+    kind=track.GetClass()
+    if kind=="PCB_VIA":
+        return Reconcile.via_key(track.GetNetname(),board.GetLayerName(track.TopLayer()),
+                                 board.GetLayerName(track.BottomLayer()),xy0,track.GetWidth(),track.GetDrillValue())
+    if kind=="PCB_ARC":
+        return Reconcile.arc_key(track.GetNetname(),track.GetLayerName(),track.GetWidth(),
+                                 xy0,(track.GetMid().x,track.GetMid().y),xy1)
+    return Reconcile.track_key(track.GetNetname(),track.GetLayerName(),track.GetWidth(),xy0,xy1)
+
+
+def placed(placement:LayoutPlan.Placement):
     """
-    Draw complete rings for each ones position on each hand (total of 20 rings)
+    True if a footprint is already where a placement puts it
     """
-    for i_hand in range(2):
-        for ones in range(8):
-            arc(i_hand=i_hand,ones=ones,i_ring=i_hand*8+ones+2,m0=0,m1=240)
-            pcbnew.Refresh()
-
+    mod=board.FindFootprintByReference(placement.ref)
+    return (mod.GetPosition()==vector(placement.xy) and mod.IsFlipped()==placement.flipped and
+            (mod.GetOrientation().AsDegrees()-placement.orientation)%360==0)
 
-rings()
-#raise AssertionError("Stop!")
 
+def reconcile(*,place:bool=True):
+    """
+    Bring the board up to date with the layout as one batch, touching as little
+    as possible: only footprints that moved, only tracks, arcs, and vias that
+    are missing, and only the old ring copper that the layout no longer has.
+    Rerunning without changing the layout does nothing.
 
-def arcs():
+    :param place: If True, include the diode placements
+    :return: Tuple of (added,removed) counts of tracks, arcs, and vias
     """
-    Draw partial rings for each tens position on each hand. Total of 16 arcs, but
-    all 8 of each hand can go in the same ring, so only 2 rings total.
+    stats.reset()
+    plan=LayoutPlan.layout(place=place)
+    check(plan)
+    with session:
+        with stats.phase("select"):
+            selection=PolarSelect.BoardSelection(board)
+            existing=[(board_key(track),track) for track in selection.items]
+            scope=np.flatnonzero(erase_mask(selection,plan.erasures))
+        with stats.phase("reconcile"):
+            todo,stale=Reconcile.reconcile(plan,existing,scope)
+            todo.placements=[placement for placement in todo.placements if not placed(placement)]
+        for item in stale:
+            session.remove(item)
+        for placement in todo.placements:
+            mod=board.FindFootprintByReference(placement.ref)
+            session.move(mod,xy=vector(placement.xy),orientation=placement.orientation,flipped=placement.flipped)
+        with stats.phase("build"):
+            build(todo)
+    added=len(todo.tracks)+len(todo.arcs)+len(todo.vias)
+    print(f"Reconciled: {len(todo.placements)} moved, {added} added, {len(stale)} removed")
+    stats.report(statsFile)
+    return added,len(stale)
+
+
+def check(plan:LayoutPlan.Plan):
     """
-    for i_hand in range(2):
-        for eights in range(8):
-            print(f"Laying arc {signame(i_hand=i_hand,eights=eights)}")
-            dm=-1 if i_hand==1 else 1
-            dslot=7 if eights!=7 else 3
-            arc(i_hand=i_hand,eights=eights,
-                slot0=eights*8,m0=dm,
-                slot1=eights*8+dslot,m1=dm+1,i_ring=1-i_hand)
-            pcbnew.Refresh()
-
-
-arcs()
-#raise AssertionError("Stop!")
+    Clearance check of a plan before it goes on the board
+    """
+    with stats.phase("check"):
+        Clearance.preflight(plan,strict=strictClearance)
 
 
-def radial(*,i_hand:int,eights:int='x',ones:int='x',
-             i_ring:int,theta:float,rad_ofs:int,theta_ofs:float):
+def redraw():
+    """
+    Erase and redraw all of the rings, arcs, and radials as one batch
     """
-    Create matching radial traces on both boards. Each radial runs from 
-    the appropriate ring to the diode pad. Front side LEDs 
+    stats.reset()
+    plan=LayoutPlan.layout(place=False)
+    check(plan)
+    with session:
+        apply(plan)
+    stats.report(statsFile)
 
 
-    :param i_hand: Front (0) or back (1) hands
-    :param eights:   eights digit
-    :param ones:   Ones digit
-    :param i_ring: Ring index of inner end. All traces end near the diodes.
-    :param kwargs: Other arguments passed through to trace()
+def run():
     """
-    ringRad=outerRingRad-(i_ring)*ringSpacing
-    diodeRad=domeDiodeRad
-    if i_hand==0:
-       outerRad=outerViaRad
-    else:
-       outerRad=diodeRad
-    # X0x from ring to inward of center of diode
-    trace_polar(i_hand=i_hand,eights=eights,ones=ones,
-       r0=ringRad,theta0=theta,
-       r1=outerRad+rad_ofs,theta1=theta,layer="B.Cu")
-    # Via at ring
-    via_polar(i_hand=i_hand,eights=eights,ones=ones,
-       r=ringRad,theta=theta)
-    if i_hand==0:
-        # Via at outer end of radial to front side
-        via_polar(i_hand=i_hand,eights=eights,ones=ones,
-          r=outerRad+rad_ofs,theta=theta)
-        # Front-side trace from via to left pad
-        trace_polar(i_hand=i_hand,eights=eights,ones=ones,
-          r0=diodeRad        ,theta0=theta+theta_ofs,
-          r1=outerRad+rad_ofs,theta1=theta          ,layer="F.Cu")
-
-
-def radials():
-    for i_slot in range(60):
-        ones=i_slot%8
-        eights=i_slot//8
-        theta0=i_slot*6
-        theta1=theta0+1.5
-        theta2=theta1+1.5
-        thetam=theta0-1.5
-        i_ring0=2+ones
-        i_ring1=10+ones
-        i_ring2=1
-        i_ringm=0
-        radial(i_hand=0,eights=eights,i_ring=i_ring0,theta=theta0,rad_ofs=0                       ,theta_ofs=-1.2)
-        radial(i_hand=1,eights=eights,i_ring=i_ring1,theta=theta1,rad_ofs=0                       ,theta_ofs= 0  )
-        radial(i_hand=0,ones=ones,i_ring=i_ring2,theta=theta2,rad_ofs=flatDiodeRad-outerViaRad,theta_ofs=-1.5)
-        radial(i_hand=1,ones=ones,i_ring=i_ringm,theta=thetam,rad_ofs=0                       ,theta_ofs= 0  )
-        pcbnew.Refresh()
-
-
-radials()
-raise AssertionError("Stop!")
-
-
-def tap(*,i_hand:int,tens:int='x',ones:int='x',slot:int,m:int,hasvia:bool=False,layer:str="B.Cu"):
+    Place the diodes and redraw all of the rings, arcs, and radials as one batch.
+    Nothing touches the board until the whole layout has been generated, and
+    a failure anywhere rolls the batch back.
     """
-    Create a pair of traces inward from rings so that they can join the internal circuitry.
-    Tap positions must be chosen manually (in taps() below) but are then drawn automatically.
-    
-    :param i_hand:
-    :param tens:
-    :param ones:
-    :param slot:
-    :param m:
-    :param hasvia: If True, draw a new via on the ring connecting the ring to the tap. If false, don't
-                   draw one (because it's there already)
-    """
-    if tens=='x':
-        i_ring=2+10*i_hand+ones
-    else:
-        i_ring=1-i_hand
-    trace_polarslot(i_hand=i_hand,tens=tens,ones=ones,
-                    slot0=slot,m0=m,i_ring0=i_ring,
-                    slot1=slot,m1=m,i_ring1=22    ,layer=layer)
-    if hasvia:
-        via_polarslot(i_hand=i_hand,tens=tens,ones=ones,slot=slot,m=m,i_ring=i_ring)
-
-
-
-def taps():
-    tap(i_hand=0,ones=0,slot= 1,m=-1,hasvia=True)
-    tap(i_hand=0,ones=1,slot= 0,m= 2,hasvia=True)
-    tap(i_hand=0,ones=2,slot= 0,m= 0,hasvia=True)
-    tap(i_hand=0,ones=3,slot= 0,m=-1,hasvia=True)
-    tap(i_hand=0,ones=4,slot=59,m= 2,hasvia=True)
-    tap(i_hand=0,ones=5,slot=59,m=-1,hasvia=True)
-    tap(i_hand=0,ones=6,slot=58,m= 2,hasvia=True)
-    tap(i_hand=0,ones=7,slot=58,m=-1,hasvia=True)
-    tap(i_hand=0,ones=8,slot=57,m= 2,hasvia=True)
-    tap(i_hand=0,ones=9,slot=57,m= 0,hasvia=True)
-    tap(i_hand=1,ones=0,slot=30,m= 1)
-    tap(i_hand=1,ones=1,slot=30,m= 0,hasvia=True)
-    tap(i_hand=1,ones=2,slot=30,m=-1,hasvia=True)
-    tap(i_hand=1,ones=3,slot=29,m= 2,hasvia=True)
-    tap(i_hand=1,ones=4,slot=29,m= 0,hasvia=True)
-    tap(i_hand=1,ones=5,slot=29,m=-1,hasvia=True)
-    tap(i_hand=1,ones=6,slot=28,m= 2,hasvia=True)
-    tap(i_hand=1,ones=7,slot=28,m= 0,hasvia=True)
-    tap(i_hand=1,ones=8,slot=28,m=-1,hasvia=True)
-    tap(i_hand=1,ones=9,slot=27,m= 2,hasvia=True)
-    tap(i_hand=0,tens=0,slot= 3,m= 2,hasvia=False)
-
-    tap(i_hand=1,tens=2,slot=27,m=-1,hasvia=False)
-    via_polarslot(i_hand=1,tens=2,i_ring=22,slot=27,m=-1)
-    arc(i_hand=1,tens=2,i_ring=22,slot0=27,m0=-1,slot1=32,m1=-2)
-
-    tap(i_hand=1,tens=3,slot=31,m=-1,hasvia=False)
-
-    tap(i_hand=1,tens=4,slot=40,m=-1,hasvia=False)
-    arc(i_hand=1,tens=4,i_ring=22,slot1=39,m1= 1,slot0=31,m0=0,layer='B.Cu')
-    trace_polarslot(i_hand=1,tens=4,i_ring0=23,slot0=40,m0=-2,i_ring1=22,slot1=40,m1=-1,layer='B.Cu')
-    trace_polarslot(i_hand=1,tens=4,i_ring0=23,slot0=39,m0= 2,i_ring1=22,slot1=39,m1= 1,layer='B.Cu')
-
-    tap(i_hand=0,tens=3,slot=39,m= 2,hasvia=False)
-
-    tap(i_hand=0,tens=4,slot=49,m= 2,hasvia=False)
-    via_polarslot(i_hand=0,tens=4,i_ring=22,slot=49,m=2)
-    arc(i_hand=0,tens=4,i_ring=22,slot0=49,m0= 2,slot1=61,m1=-1)
-
-    tap(i_hand=0,tens=5,slot=56,m= 2,hasvia=False)
-    trace_polarslot(i_hand=1,tens=5,i_ring0=22,slot0=56,m0= 2,i_ring1=23,slot1=56,m1= 2,layer='B.Cu')
-    via_polarslot(i_hand=0,tens=5,i_ring=23,slot=56,m=2)
-    arc(i_hand=0,tens=5,i_ring=23,slot0=56,m0= 2,slot1=60,m1=2)
-
-    tap(i_hand=0,tens=1,slot=10,m= 2,hasvia=False)
-    via_polarslot(i_hand=0,tens=1,i_ring=22,slot=10,m=2)
-    arc(i_hand=0,tens=1,i_ring=22,slot1=10,m1= 2,slot0=2,m0= 0)
-
-    tap(i_hand=1,tens=1,slot=19,m=-1,hasvia=False)
-    via_polarslot(i_hand=1,tens=1,i_ring=22,slot=19,m=-1)
-    arc(i_hand=1,tens=1,i_ring=22,slot0=19,m0=-1,slot1=26,m1= 1)
-    trace_polarslot(i_hand=1,tens=1,i_ring0=22,slot0=26,m0= 1,i_ring1=23,slot1=27,m1=-2)
-    arc(i_hand=1,tens=1,i_ring=23,slot1=31,m1= 0,slot0=26,m0= 1)
-
-    tap(i_hand=1,tens=5,slot=50,m=-1,hasvia=False)
-
-    tap(i_hand=1,tens=0,slot= 9,m=-1,hasvia=False)
-
-    tap(i_hand=1,tens=2,slot=20,m= 2,hasvia=False)
-    pcbnew.Refresh()
-
-
-taps()
-raise AssertionError("Stop!")
-        
-
-def redraw():
-    erase_rings()
-    draw_rings()
-    draw_radials()
+    stats.reset()
+    plan=LayoutPlan.layout()
+    check(plan)
+    with session:
+        apply(plan)
+    stats.report(statsFile)
 
 
-place_diodes()
+run()
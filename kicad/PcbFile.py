@@ -0,0 +1,199 @@
+"""
+Lossless reader and writer for KiCad S-expression files (.kicad_pcb and friends)
+
+Every list in the file becomes an SExpr, which is a plain Python list of its
+children (atoms as str, sublists as SExpr) that also remembers the whitespace
+in front of each child and in front of its closing paren. Quoted strings are
+kept with their quotes and escapes exactly as written. Writing a tree back
+out therefore reproduces the file byte for byte, and edits to one item only
+change the text of that item.
+
+import PcbFile
+board=PcbFile.read("Precision23.kicad_pcb")
+for segment in board.findall("segment"):
+    print(segment.find("start"))
+"""
+
+import re
+
+# Whitespace, then one token: open paren, close paren, quoted string, or bare atom
+tokenRe=re.compile(r'(\s*)(\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+)')
+
+
+class SExpr(list):
+    """
+    One parenthesized list. Indexing, iteration, and len() work on the children
+    like any list. ws[i] is the whitespace before child i, tail is the whitespace
+    before the closing paren. When children are added without going through
+    append(), ws is padded with a single space when the list is written.
+    """
+    def __init__(self,children=(),ws=None,tail=""):
+        super().__init__(children)
+        self.ws=["" if i==0 else " " for i in range(len(self))] if ws is None else ws
+        self.tail=tail
+
+    @property
+    def name(self):
+        """
+        Head atom of the list, IE "segment" for (segment ...)
+        """
+        return self[0] if len(self)>0 and isinstance(self[0],str) else None
+
+    def append(self,child,ws:str=" "):
+        """
+        Add a child, with the given whitespace in front of it
+        """
+        super().append(child)
+        self.ws.append(ws)
+
+    def find(self,name:str):
+        """
+        First child list with the given head, or None
+        """
+        for child in self:
+            if isinstance(child,SExpr) and child.name==name:
+                return child
+        return None
+
+    def findall(self,name:str):
+        """
+        All child lists with the given head
+        """
+        return [child for child in self if isinstance(child,SExpr) and child.name==name]
+
+    def value(self,name:str,default=None):
+        """
+        Atoms after the head of the first child list with the given head.
+        (width 0.1524) gives "0.1524", (start 1 2) gives ["1","2"].
+        """
+        child=self.find(name)
+        if child is None:
+            return default
+        return child[1] if len(child)==2 else list(child[1:])
+
+    def dump(self,out:list):
+        """
+        Append the text of this list to a list of strings
+        """
+        out.append("(")
+        while len(self.ws)<len(self):
+            self.ws.append(" ")
+        for ws,child in zip(self.ws,self):
+            out.append(ws)
+            if isinstance(child,SExpr):
+                child.dump(out)
+            else:
+                out.append(child)
+        out.append(self.tail)
+        out.append(")")
+
+
+class Document:
+    """
+    Parsed file: the root list plus whatever whitespace surrounds it
+    """
+    def __init__(self,root:SExpr,prefix:str="",suffix:str=""):
+        self.root=root
+        self.prefix=prefix
+        self.suffix=suffix
+
+    def __getattr__(self,name):
+        # Let the document stand in for its root, IE board.findall("segment")
+        return getattr(self.root,name)
+
+    def dumps(self):
+        """
+        Text of the whole file
+        """
+        out=[self.prefix]
+        self.root.dump(out)
+        out.append(self.suffix)
+        return "".join(out)
+
+
+def unquote(atom:str):
+    """
+    Value of a quoted string atom, or the atom itself if not quoted
+    """
+    if len(atom)>=2 and atom[0]=='"' and atom[-1]=='"':
+        return re.sub(r'\\(.)',r'\1',atom[1:-1])
+    return atom
+
+
+def quote(value:str):
+    """
+    Quoted string atom for a value
+    """
+    return '"'+value.replace("\\","\\\\").replace('"','\\"')+'"'
+
+
+def parse(text:str):
+    """
+    Parse the text of an S-expression file
+
+    :param text: Whole file text
+    :return: Document
+    """
+    tokens=tokenRe.findall(text)
+    suffix=text[len(text.rstrip()):]
+    if sum(len(ws)+len(token) for ws,token in tokens)+len(suffix)!=len(text):
+        # Something in the file isn't a token, IE an unterminated string
+        raise ValueError("Not a valid S-expression file")
+    if not tokens or tokens[0][1]!="(":
+        raise ValueError("File doesn't start with a list")
+    stack=[]
+    root=None
+    prefix=tokens[0][0]
+    # This loop runs once per token, so it keeps the current list and its
+    # whitespace in locals and skips SExpr.__init__
+    new=SExpr.__new__
+    add=list.append
+    top=None
+    topws=None
+    for ws,token in tokens:
+        if token=="(":
+            node=new(SExpr)
+            node.ws=[]
+            if top is not None:
+                add(top,node)
+                add(topws,ws)
+            stack.append(node)
+            top=node
+            topws=node.ws
+        elif token==")":
+            if top is None:
+                raise ValueError("Unbalanced close paren")
+            top.tail=ws
+            stack.pop()
+            if stack:
+                top=stack[-1]
+                topws=top.ws
+            else:
+                if root is not None:
+                    raise ValueError("More than one top-level list")
+                root=top
+                top=None
+        else:
+            if top is None:
+                raise ValueError(f"Atom {token} outside of any list")
+            add(top,token)
+            add(topws,ws)
+    if stack:
+        raise ValueError("Unbalanced open paren")
+    return Document(root,prefix=prefix,suffix=suffix)
+
+
+def read(filename:str):
+    """
+    Read and parse an S-expression file
+    """
+    with open(filename,"rt",newline="") as inf:
+        return parse(inf.read())
+
+
+def write(doc:Document,filename:str):
+    """
+    Write a parsed file back out
+    """
+    with open(filename,"wt",newline="") as ouf:
+        ouf.write(doc.dumps())
@@ -0,0 +1,381 @@
+"""
+Spatial index of the copper in a parsed .kicad_pcb file
+
+Tracks, arcs, vias, and pads are all reduced to primitives: a straight
+piece of copper from (x0,y0) to (x1,y1) with a half-width, on a set of
+layers and a net. A via is a zero-length primitive with half-width equal to
+its radius, a pad is a primitive along its long side. Arcs are split into
+chords. Primitives are bucketed into a uniform grid, so a query only looks
+at the handful of cells it touches.
+
+All coordinates are in the board file's millimeters. The net table,
+footprint, and pad parsing here is shared with IRDrop, Preview, PolarSelect,
+and PlanWriter, so every tool reduces a pad the same way.
+
+import PcbFile,PcbIndex
+index=PcbIndex.Index(PcbFile.read("Precision23.kicad_pcb"))
+for i in index.sector(r0=35,r1=36,theta0=0,theta1=6,layer="F.Cu"):
+    print(index.items[i])
+"""
+
+import math
+
+import numpy as np
+
+import PcbFile
+from LayoutPlan import mil,centerX,centerY
+
+SEGMENT=0
+ARC=1
+VIA=2
+PAD=3
+
+# Center of the clock face in board file millimeters
+faceX=centerX*mil/1e6
+faceY=centerY*mil/1e6
+
+
+def rotate(x:float,y:float,angle:float):
+    """
+    Rotate a point the way kicad does: counterclockwise on screen, with y down
+
+    :param angle: Angle in degrees
+    """
+    c=math.cos(math.radians(angle))
+    s=math.sin(math.radians(angle))
+    return x*c+y*s,-x*s+y*c
+
+
+def arc_points(start,mid,end,tol:float=0.005):
+    """
+    Points along an arc through three points, close enough that no chord is
+    further than tol from the arc
+
+    :return: List of (x,y) points from start to end
+    """
+    (ax,ay),(bx,by),(cx,cy)=start,mid,end
+    d=2*(ax*(by-cy)+bx*(cy-ay)+cx*(ay-by))
+    if abs(d)<1e-12:
+        # Collinear, so it's really a segment
+        return [start,end]
+    ux=((ax*ax+ay*ay)*(by-cy)+(bx*bx+by*by)*(cy-ay)+(cx*cx+cy*cy)*(ay-by))/d
+    uy=((ax*ax+ay*ay)*(cx-bx)+(bx*bx+by*by)*(ax-cx)+(cx*cx+cy*cy)*(bx-ax))/d
+    r=math.hypot(ax-ux,ay-uy)
+    t0=math.atan2(ay-uy,ax-ux)
+    tm=math.atan2(by-uy,bx-ux)
+    t1=math.atan2(cy-uy,cx-ux)
+    # Sweep from start to end the way that passes through mid
+    sweep=(t1-t0)%(2*math.pi)
+    if (tm-t0)%(2*math.pi)>sweep:
+        sweep-=2*math.pi
+    step=2*math.acos(max(-1.0,1-tol/r)) if r>tol else math.pi
+    n=max(1,math.ceil(abs(sweep)/step))
+    return [start]+[(ux+r*math.cos(t0+sweep*i/n),uy+r*math.sin(t0+sweep*i/n)) for i in range(1,n)]+[end]
+
+
+def net_names(doc):
+    """
+    Net table of a board file parsed by PcbFile
+
+    :return: Dictionary of net name by net code
+    """
+    return {int(net[1]):PcbFile.unquote(net[2]) for net in doc.findall("net")}
+
+
+def reference(footprint):
+    """
+    Reference designator of a footprint, None if it has none
+    """
+    for child in footprint.findall("property")+footprint.findall("fp_text"):
+        if PcbFile.unquote(child[1]) in ("Reference","reference"):
+            return PcbFile.unquote(child[2])
+    return None
+
+
+def footprint_placement(footprint):
+    """
+    Position and orientation of a footprint
+
+    :return: Tuple of (x,y,angle), mm and degrees
+    """
+    at=footprint.value("at")
+    return float(at[0]),float(at[1]),float(at[2]) if len(at)>2 else 0.0
+
+
+def footprint_point(xy,at:tuple):
+    """
+    Board position of a point given relative to a footprint
+
+    :param at: Placement of the footprint, from footprint_placement()
+    """
+    fx,fy,fangle=at
+    dx,dy=rotate(float(xy[0]),float(xy[1]),fangle)
+    return fx+dx,fy+dy
+
+
+def capsule(x:float,y:float,w:float,h:float,angle:float):
+    """
+    Capsule along the long side of a pad, as wide as its short side
+
+    :return: Tuple of (x0,y0,x1,y1,hw)
+    """
+    if w>=h:
+        ax,ay=rotate((w-h)/2,0,angle)
+        return x-ax,y-ay,x+ax,y+ay,h/2
+    ax,ay=rotate(0,(h-w)/2,angle)
+    return x-ax,y-ay,x+ax,y+ay,w/2
+
+
+def pad_capsule(pad,at:tuple):
+    """
+    Capsule of a pad of a footprint. Pad angles in the file already include
+    the footprint orientation.
+
+    :param at: Placement of the footprint, from footprint_placement()
+    :return: Tuple of (x0,y0,x1,y1,hw) in mm
+    """
+    pat=pad.value("at")
+    size=pad.value("size")
+    x,y=footprint_point(pat,at)
+    return capsule(x,y,float(size[0]),float(size[1]),float(pat[2]) if len(pat)>2 else at[2])
+
+
+def pad_layers(pad,copper:list):
+    """
+    Copper layers of a pad, with *.Cu expanded
+
+    :param copper: Copper layer names of the board
+    """
+    names=[PcbFile.unquote(layer) for layer in (pad.find("layers") or [None])[1:]]
+    return list(copper) if "*.Cu" in names else [layer for layer in copper if layer in names]
+
+
+class Index:
+    """
+    Grid index over the copper of one board
+
+    :param doc: Parsed board file from PcbFile
+    :param cell: Size of a grid cell in mm
+    """
+    def __init__(self,doc,cell:float=1.0):
+        self.cell=cell
+        self.layertable={PcbFile.unquote(layer[1]):int(layer[0]) for layer in doc.find("layers")[1:]}
+        self.nets={name:code for code,name in net_names(doc).items()}
+        self.copper=[layer for layer in self.layertable if layer.endswith(".Cu")]
+        # items[i] is the SExpr of item i, kinds[i] is its kind
+        self.items=[]
+        self.kinds=[]
+        prims=[]
+        for node in doc.root:
+            if not isinstance(node,PcbFile.SExpr):
+                continue
+            if node.name=="segment":
+                self.add_item(prims,node,SEGMENT,[(self.xy(node,"start"),self.xy(node,"end"))],
+                              float(node.value("width"))/2,[PcbFile.unquote(node.value("layer"))],
+                              int(node.value("net",0)))
+            elif node.name=="arc":
+                points=arc_points(self.xy(node,"start"),self.xy(node,"mid"),self.xy(node,"end"))
+                self.add_item(prims,node,ARC,list(zip(points[:-1],points[1:])),
+                              float(node.value("width"))/2,[PcbFile.unquote(node.value("layer"))],
+                              int(node.value("net",0)))
+            elif node.name=="via":
+                xy=self.xy(node,"at")
+                self.add_item(prims,node,VIA,[(xy,xy)],float(node.value("size"))/2,
+                              self.via_layers([PcbFile.unquote(layer) for layer in node.find("layers")[1:]]),
+                              int(node.value("net",0)))
+            elif node.name=="footprint":
+                at=footprint_placement(node)
+                for pad in node.findall("pad"):
+                    self.add_pad(prims,pad,at)
+        columns=list(zip(*prims)) if prims else [()]*8
+        self.x0,self.y0,self.x1,self.y1,self.hw=[np.array(column,dtype=float) for column in columns[:5]]
+        # Masks go straight to integers, since a float can't hold all 64 bits
+        self.layermask,self.net,self.item=[np.array(column,dtype=np.int64) for column in columns[5:]]
+        self.build_grid()
+
+    @staticmethod
+    def xy(node,name:str):
+        at=node.find(name)
+        return float(at[1]),float(at[2])
+
+    def mask(self,layers:list):
+        """
+        Bit mask of a list of layer names, with wildcards like *.Cu expanded
+        """
+        result=0
+        for layer in layers:
+            if layer=="*.Cu":
+                result|=self.mask(self.copper)
+            elif layer in self.layertable:
+                result|=1<<self.layertable[layer]
+        return result
+
+    def via_layers(self,layers:list):
+        """
+        All copper layers spanned by a via from one layer to another
+        """
+        ids=[self.layertable[layer] for layer in layers if layer in self.layertable]
+        return [layer for layer in self.copper if min(ids)<=self.layertable[layer]<=max(ids)]
+
+    def add_item(self,prims:list,node,kind:int,pieces:list,hw:float,layers:list,net:int):
+        i_item=len(self.items)
+        self.items.append(node)
+        self.kinds.append(kind)
+        mask=self.mask(layers)
+        for (x0,y0),(x1,y1) in pieces:
+            prims.append((x0,y0,x1,y1,hw,mask,net,i_item))
+
+    def add_pad(self,prims:list,pad,at:tuple):
+        # Pad becomes a primitive along its long side, as wide as its short side
+        x0,y0,x1,y1,hw=pad_capsule(pad,at)
+        net=pad.find("net")
+        self.add_item(prims,pad,PAD,[((x0,y0),(x1,y1))],hw,[PcbFile.unquote(layer) for layer in (pad.find("layers") or [None])[1:]],
+                      0 if net is None else int(net[1]))
+
+    def build_grid(self):
+        """
+        Bucket every primitive into each grid cell its bounding box touches
+        """
+        cx0=np.floor((np.minimum(self.x0,self.x1)-self.hw)/self.cell).astype(np.int64)
+        cx1=np.floor((np.maximum(self.x0,self.x1)+self.hw)/self.cell).astype(np.int64)
+        cy0=np.floor((np.minimum(self.y0,self.y1)-self.hw)/self.cell).astype(np.int64)
+        cy1=np.floor((np.maximum(self.y0,self.y1)+self.hw)/self.cell).astype(np.int64)
+        grid={}
+        for i in range(len(self.x0)):
+            for cx in range(cx0[i],cx1[i]+1):
+                for cy in range(cy0[i],cy1[i]+1):
+                    grid.setdefault((cx,cy),[]).append(i)
+        self.grid={key:np.array(value,dtype=np.int64) for key,value in grid.items()}
+
+    def candidates(self,x0:float,y0:float,x1:float,y1:float):
+        """
+        Primitives in any grid cell touching a rectangle
+        """
+        cells=[self.grid[(cx,cy)]
+               for cx in range(math.floor(x0/self.cell),math.floor(x1/self.cell)+1)
+               for cy in range(math.floor(y0/self.cell),math.floor(y1/self.cell)+1)
+               if (cx,cy) in self.grid]
+        if not cells:
+            return np.zeros(0,dtype=np.int64)
+        return np.unique(np.concatenate(cells))
+
+    def select(self,prims,net,layer):
+        """
+        Filter primitives by net and layer. A net or layer that isn't on the board
+        matches nothing, the same as a pattern that matches no net in PolarSelect.
+        """
+        if net is not None:
+            prims=prims[self.net[prims]==(self.nets.get(net,-1) if isinstance(net,str) else net)]
+        if layer is not None:
+            prims=prims[(self.layermask[prims]&self.mask([layer]))!=0]
+        return prims
+
+    def result(self,prims):
+        """
+        Items of a set of primitives, each once
+        """
+        return np.unique(self.item[prims])
+
+    def rect(self,x0:float,y0:float,x1:float,y1:float,*,net=None,layer:str=None):
+        """
+        Items whose copper overlaps a rectangle
+
+        :param net: Net name or code to restrict to
+        :param layer: Layer name to restrict to
+        :return: Array of item indexes
+        """
+        prims=self.select(self.candidates(x0,y0,x1,y1),net,layer)
+        px0,py0,px1,py1=self.x0[prims],self.y0[prims],self.x1[prims],self.y1[prims]
+        # Liang-Barsky clip of each centerline against the rectangle
+        dx=px1-px0
+        dy=py1-py0
+        t0=np.zeros(len(prims))
+        t1=np.ones(len(prims))
+        crosses=np.ones(len(prims),dtype=bool)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            for p,q in ((-dx,px0-x0),(dx,x1-px0),(-dy,py0-y0),(dy,y1-py0)):
+                crosses&=~((p==0)&(q<0))
+                t0=np.where(p<0,np.maximum(t0,q/p),t0)
+                t1=np.where(p>0,np.minimum(t1,q/p),t1)
+        crosses&=t0<=t1
+        # Otherwise the nearest approach is at an end of the centerline or a corner of the rectangle
+        dist=np.minimum(np.hypot(np.maximum(np.maximum(x0-px0,px0-x1),0),np.maximum(np.maximum(y0-py0,py0-y1),0)),
+                        np.hypot(np.maximum(np.maximum(x0-px1,px1-x1),0),np.maximum(np.maximum(y0-py1,py1-y1),0)))
+        for x,y in ((x0,y0),(x0,y1),(x1,y0),(x1,y1)):
+            dist=np.minimum(dist,self.distance(prims,x,y))
+        return self.result(prims[crosses|(dist<=self.hw[prims])])
+
+    def distance(self,prims,x,y):
+        """
+        Distance from points to the centerlines of primitives
+        """
+        dx=self.x1[prims]-self.x0[prims]
+        dy=self.y1[prims]-self.y0[prims]
+        ll=dx*dx+dy*dy
+        with np.errstate(divide='ignore',invalid='ignore'):
+            t=np.where(ll>0,((x-self.x0[prims])*dx+(y-self.y0[prims])*dy)/ll,0.0)
+        t=np.clip(t,0,1)
+        return np.hypot(self.x0[prims]+t*dx-x,self.y0[prims]+t*dy-y)
+
+    def radius(self,x:float,y:float,r:float,*,net=None,layer:str=None):
+        """
+        Items whose copper comes within r of a point
+
+        :return: Array of item indexes
+        """
+        prims=self.select(self.candidates(x-r,y-r,x+r,y+r),net,layer)
+        return self.result(prims[self.distance(prims,x,y)-self.hw[prims]<=r])
+
+    def beyond(self,r:float,*,net=None,layer:str=None,center:tuple=(faceX,faceY)):
+        """
+        Items with both ends further than r from a point, the way LayoutPlan.Erase
+        picks what to erase. The ends of an arc are its own ends, not those of its chords.
+
+        :param r: Radius in mm
+        :param center: Default is the center of the face
+        :return: Array of item indexes
+        """
+        cx,cy=center
+        prims=self.select(np.arange(len(self.x0)),net,layer)
+        # The primitives of an item are contiguous, so its first and last hold its ends
+        items,first=np.unique(self.item[prims],return_index=True)
+        last=len(prims)-1-np.unique(self.item[prims][::-1],return_index=True)[1]
+        first,last=prims[first],prims[last]
+        out=(np.hypot(self.x0[first]-cx,self.y0[first]-cy)>r)&(np.hypot(self.x1[last]-cx,self.y1[last]-cy)>r)
+        return items[out]
+
+    def sector(self,*,r0:float,r1:float,theta0:float,theta1:float,net=None,layer:str=None,
+               center:tuple=(faceX,faceY)):
+        """
+        Items with an end or middle inside a polar sector of the clock face
+
+        :param r0: Inner radius in mm
+        :param r1: Outer radius in mm
+        :param theta0: Start azimuth, degrees clockwise from 12:00 like LayoutPlan.polar()
+        :param theta1: End azimuth, clockwise from theta0
+        :param center: Center of the polar coordinates, default is the center of the face
+        :return: Array of item indexes
+        """
+        cx,cy=center
+        # Sectors may cross 12:00 either way, IE 350 to 10 and 350 to 370 are the same sector
+        full=theta1-theta0>=360
+        span=(theta1-theta0)%360
+        if full:
+            box=(cx-r1,cy-r1,cx+r1,cy+r1)
+        else:
+            # Bounding box of the sector from its corners and any axis crossings
+            thetas=[theta0,theta0+span]+[a for a in range(0,360,90) if 0<(a-theta0)%360<span]
+            xs=[cx+r*math.sin(math.radians(t)) for t in thetas for r in (r0,r1)]
+            ys=[cy-r*math.cos(math.radians(t)) for t in thetas for r in (r0,r1)]
+            box=(min(xs),min(ys),max(xs),max(ys))
+        prims=self.select(self.candidates(*box),net,layer)
+        hit=np.zeros(len(prims),dtype=bool)
+        for x,y in ((self.x0[prims],self.y0[prims]),(self.x1[prims],self.y1[prims]),
+                    ((self.x0[prims]+self.x1[prims])/2,(self.y0[prims]+self.y1[prims])/2)):
+            r=np.hypot(x-cx,y-cy)
+            inside=(r>=r0)&(r<=r1)
+            if not full:
+                theta=np.degrees(np.arctan2(x-cx,-(y-cy)))
+                inside&=(theta-theta0)%360<=span
+            hit|=inside
+        return self.result(prims[hit])
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Merge a LayoutPlan straight into a .kicad_pcb file, no KiCad needed.
+
+To run:
+
+python PlanWriter.py Precision23.kicad_pcb
+
+This does the same thing to the file that MatrixTraces.run() does to the
+live board: moves the diodes, erases the old ring tracks and vias, and adds
+the newly planned tracks, arcs, and vias. The file is read and written with
+PcbFile, and what to erase is found with PcbIndex, so everything else in
+the file is passed through untouched.
+"""
+
+import argparse
+import sys
+import uuid
+
+import Clearance
+import LayoutPlan
+import PcbFile
+import PcbIndex
+import Reconcile
+import RunStats
+from RunStats import stats
+from LayoutPlan import mil
+
+# Namespace for the tstamps of generated items, so the same plan always
+# writes the same file
+tstampNamespace=uuid.UUID("6b1f2d1e-5a57-4c0e-9d49-1e0c2a7e5d23")
+
+# Top-level board items a plan draws and erases
+copperNames=("segment","arc","via")
+
+
+def fmt(nm:float):
+    """
+    Format a coordinate in nanometers as millimeters the way kicad writes them
+    """
+    result=f"{nm/1e6:.6f}".rstrip("0").rstrip(".")
+    return "0" if result=="-0" else result
+
+
+def fmt_angle(angle:float):
+    """
+    Format an angle in degrees, normalized to (-180,180]
+    """
+    angle=-((-angle+180)%360-180)
+    return f"{angle:.6f}".rstrip("0").rstrip(".")
+
+
+def tstamp(item):
+    """
+    Deterministic tstamp for a generated item
+    """
+    return str(uuid.uuid5(tstampNamespace,repr(item)))
+
+
+def read_nets(doc):
+    """
+    Read the net table of a board file parsed by PcbFile
+
+    :return: Dictionary of net code by net name
+    """
+    return {name:code for code,name in PcbIndex.net_names(doc).items()}
+
+
+def remove(doc,doomed:list):
+    """
+    Remove top-level items from a board file
+
+    :param doomed: SExprs of the items
+    """
+    doomed=set(id(node) for node in doomed)
+    root=doc.root
+    keep=[i for i,child in enumerate(root) if id(child) not in doomed]
+    root.ws=[root.ws[i] for i in keep]
+    root[:]=[root[i] for i in keep]
+
+
+def erased(doc,plan:LayoutPlan.Plan,nets:dict):
+    """
+    Top-level tracks, arcs, and vias that the erasures of a plan remove
+
+    :return: List of SExprs
+    """
+    index=PcbIndex.Index(doc)
+    result=[]
+    for erasure in plan.erasures:
+        result+=[index.items[i] for i in index.beyond(erasure.rlimit*mil/1e6,net=nets[erasure.signame])
+                 if index.kinds[i]!=PcbIndex.PAD]
+    return result
+
+
+def erase(doc,plan:LayoutPlan.Plan,nets:dict):
+    """
+    Drop the top-level tracks, arcs, and vias the plan erases
+
+    :return: Number of items removed
+    """
+    doomed=erased(doc,plan,nets)
+    remove(doc,doomed)
+    return len(doomed)
+
+
+def node_key(node,netnames:dict):
+    """
+    Reconcile key of a top-level track, arc, or via
+
+    :param netnames: Dictionary of net name by net code
+    """
+    net=netnames.get(int(node.value("net",0)),"")
+
+    def nm(name):
+        return tuple(float(value)*1e6 for value in node.find(name)[1:])
+    if node.name=="via":
+        layers=node.find("layers")
+        return Reconcile.via_key(net,PcbFile.unquote(layers[1]),PcbFile.unquote(layers[-1]),nm("at"),
+                                 nm("size")[0],nm("drill")[0])
+    layer=PcbFile.unquote(node.value("layer"))
+    if node.name=="arc":
+        return Reconcile.arc_key(net,layer,nm("width")[0],nm("start"),nm("mid"),nm("end"))
+    return Reconcile.track_key(net,layer,nm("width")[0],nm("start"),nm("end"))
+
+
+def footprints(doc):
+    """
+    Footprints of a board file parsed by PcbFile
+
+    :return: Dictionary of footprint SExpr by reference designator
+    """
+    return {PcbIndex.reference(footprint):footprint for footprint in doc.findall("footprint")}
+
+
+def at_angle(at):
+    """
+    Angle of an (at x y [angle] [unlocked]) list, 0 if it has none
+    """
+    return float(at[3]) if len(at)>3 and at[3]!="unlocked" else 0.0
+
+
+def set_at(at,x:str,y:str,angle:str):
+    """
+    Rewrite an (at ...) list in place, leaving out a zero angle the way kicad does
+    """
+    rest=[atom for atom in at[3:] if atom=="unlocked"]
+    at[:]=["at",x,y]+([] if angle=="0" else [angle])+rest
+    at.ws=[""]+[" "]*(len(at)-1)
+
+
+def place(footprint,placement:LayoutPlan.Placement):
+    """
+    Move one footprint
+
+    Pad and text angles in the file include the footprint orientation, so
+    they are turned along with it. Flipping a footprint to the other side
+    means mirroring all of its graphics, which is left to KiCad: a footprint
+    on the wrong side is an error.
+
+    :param footprint: SExpr of the footprint in the board file, changed in place
+    """
+    flipped=PcbFile.unquote(footprint.value("layer"))=="B.Cu"
+    if flipped!=placement.flipped:
+        raise ValueError(f"Footprint {placement.ref} is on the wrong side, flip it in KiCad first")
+    at=footprint.find("at")
+    delta=placement.orientation-at_angle(at)
+    set_at(at,fmt(placement.xy[0]),fmt(placement.xy[1]),fmt_angle(placement.orientation))
+    if delta%360!=0:
+        for child in footprint.findall("pad")+footprint.findall("fp_text")+footprint.findall("property"):
+            cat=child.find("at")
+            if cat is None:
+                continue
+            set_at(cat,cat[1],cat[2],fmt_angle(at_angle(cat)+delta))
+
+
+def items(plan:LayoutPlan.Plan,nets:dict):
+    """
+    The tracks, arcs, and vias of a plan as board file items
+
+    :return: List of SExprs
+    """
+    lines=[]
+    for item in plan.tracks:
+        lines.append(f"(segment (start {fmt(item.xy0[0])} {fmt(item.xy0[1])}) "
+                     f"(end {fmt(item.xy1[0])} {fmt(item.xy1[1])}) (width {fmt(item.width)}) "
+                     f'(layer "{item.layer}") (net {nets[item.signame]}) (tstamp {tstamp(item)}))')
+    for item in plan.arcs:
+        lines.append(f"(arc (start {fmt(item.xy0[0])} {fmt(item.xy0[1])}) "
+                     f"(mid {fmt(item.xymid[0])} {fmt(item.xymid[1])}) "
+                     f"(end {fmt(item.xy1[0])} {fmt(item.xy1[1])}) (width {fmt(item.width)}) "
+                     f'(layer "{item.layer}") (net {nets[item.signame]}) (tstamp {tstamp(item)}))')
+    for item in plan.vias:
+        lines.append(f"(via (at {fmt(item.xy[0])} {fmt(item.xy[1])}) (size {fmt(item.dia)}) "
+                     f'(drill {fmt(item.drill)}) (layers "{item.layer0}" "{item.layer1}") '
+                     f"(net {nets[item.signame]}) (tstamp {tstamp(item)}))")
+    # Parsed all at once, as the children of one list
+    return list(PcbFile.parse("(items "+" ".join(lines)+")").root[1:])
+
+
+def place_all(doc,plan:LayoutPlan.Plan):
+    """
+    Move all the footprints of a plan in a board file
+    """
+    refs=footprints(doc)
+    for placement in plan.placements:
+        if placement.ref not in refs:
+            raise KeyError(f"Footprint {placement.ref} not found")
+        place(refs[placement.ref],placement)
+
+
+def insert(doc,plan:LayoutPlan.Plan,nets:dict):
+    """
+    Add the tracks, arcs, and vias of a plan at the end of the board, one per line
+
+    :return: Number of items added
+    """
+    new=items(plan,nets)
+    for node in new:
+        doc.root.append(node,"\n  ")
+    return len(new)
+
+
+def reconcile(doc,plan:LayoutPlan.Plan):
+    """
+    Bring a board file up to date with a plan, touching only what changed. See Reconcile.
+
+    :param doc: Board file parsed by PcbFile, changed in place
+    :param plan: Plan from LayoutPlan.layout()
+    :return: Tuple of (added,removed), counts of tracks, arcs, and vias added and removed
+    """
+    nets=read_nets(doc)
+    netnames={code:name for name,code in nets.items()}
+    place_all(doc,plan)
+    owned=set(id(node) for node in erased(doc,plan,nets))
+    existing=[]
+    scope=[]
+    for node in doc.root:
+        if isinstance(node,PcbFile.SExpr) and node.name in copperNames:
+            if id(node) in owned:
+                scope.append(len(existing))
+            existing.append((node_key(node,netnames),node))
+    todo,stale=Reconcile.reconcile(plan,existing,scope)
+    remove(doc,stale)
+    return insert(doc,todo,nets),len(stale)
+
+
+def merge(doc,plan:LayoutPlan.Plan):
+    """
+    Merge a plan into a board file
+
+    :param doc: Board file parsed by PcbFile, changed in place
+    :param plan: Plan from LayoutPlan.layout()
+    :return: Tuple of (added,removed), counts of tracks, arcs, and vias added and removed
+    """
+    nets=read_nets(doc)
+    place_all(doc,plan)
+    removed=erase(doc,plan,nets)
+    return insert(doc,plan,nets),removed
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='PlanWriter.py')
+    parser.add_argument('filename', help='Board file to lay out')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Write the result here instead of back to the input file')
+    parser.add_argument('-r', '--reconcile', help='Only add missing items and remove stale ones',
+                        action="store_true")
+    parser.add_argument('--no-place', help="Don't move the diodes", action="store_true")
+    parser.add_argument('--arc-mode', choices=["arc", "chord", "subslot"], default=LayoutPlan.arcMode,
+                        help=f'How to lay rings (default = {LayoutPlan.arcMode})')
+    parser.add_argument('--strict', help="Don't write anything if the layout has clearance violations",
+                        action="store_true")
+    parser.add_argument('-v', '--verbose', action="count", default=0,
+                        help='Log each phase, or with -vv each item')
+    parser.add_argument('--stats', type=str, default=None,
+                        help='Write the JSON summary of the run here instead of printing it')
+    args = parser.parse_args()
+    RunStats.verbosity=args.verbose
+    stats.reset()
+    LayoutPlan.arcMode=args.arc_mode
+    plan=LayoutPlan.layout(place=not args.no_place)
+    with stats.phase("check"):
+        try:
+            Clearance.preflight(plan,strict=args.strict)
+        except ValueError as e:
+            sys.exit(f"Nothing written: {e}")
+    with stats.phase("read"):
+        doc=PcbFile.read(args.filename)
+    if args.reconcile:
+        with stats.phase("reconcile"):
+            added,removed=reconcile(doc,plan)
+        print(f"Reconciled: {added} added, {removed} removed")
+    else:
+        with stats.phase("merge"):
+            added,removed=merge(doc,plan)
+        print(f"Merged: {added} added, {removed} removed")
+    stats.count("added",added)
+    stats.count("removed",removed)
+    with stats.phase("write"):
+        PcbFile.write(doc,args.filename if args.output is None else args.output)
+    stats.report(args.stats)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Vectorized selection of tracks and vias by region of the clock face
+
+All track and via endpoints are pulled into NumPy arrays once, then any
+number of selections by radius band, angular sector, net pattern, and
+layer are just array masks. The matching items can then be removed or
+modified as one batch.
+
+From inside KiCad, select on the live board:
+
+import PolarSelect
+selection=PolarSelect.BoardSelection(board)
+selection.remove(selection.select(r0=1000,r1=1200,theta0=90,theta1=180,net="*/Second hand/S?x"),session)
+
+From the command line, select on a parsed board file:
+
+import PcbFile,PolarSelect
+doc=PcbFile.read("Precision23.kicad_pcb")
+selection=PolarSelect.FileSelection(doc)
+selection.remove(selection.select(r0=1000,layer="B.Cu"))
+PcbFile.write(doc,"Precision23.kicad_pcb")
+"""
+
+from fnmatch import fnmatchcase
+
+import numpy as np
+
+import PcbFile
+from LayoutPlan import mil,centerX,centerY
+from PcbIndex import net_names
+
+
+class PolarSelection:
+    """
+    Endpoints of every track and via as arrays, in mils relative to the center
+    of the face. A via has both ends at its position.
+
+    :param items: Board items, one per entry in the arrays
+    :param xy0: N x 2 array of end 0 in kicad global nanometers
+    :param xy1: N x 2 array of end 1
+    :param nets: Net name of each item
+    :param layers: Layer name of each item, or list of layer names for an item on
+                   several, IE a via on every copper layer it spans
+    """
+    def __init__(self,*,items:list,xy0,xy1,nets:list,layers:list):
+        self.items=items
+        x0=np.asarray(xy0,dtype=float).reshape(-1,2)/mil-(centerX,centerY)
+        x1=np.asarray(xy1,dtype=float).reshape(-1,2)/mil-(centerX,centerY)
+        self.r0=np.hypot(x0[:,0],x0[:,1])
+        self.r1=np.hypot(x1[:,0],x1[:,1])
+        # Azimuth measured clockwise from 12:00, like LayoutPlan.polar()
+        self.theta0=np.degrees(np.arctan2(x0[:,0],-x0[:,1]))%360
+        self.theta1=np.degrees(np.arctan2(x1[:,0],-x1[:,1]))%360
+        # Nets and layers as small integers, so matching a pattern only tests each name once
+        self.netnames,self.net=np.unique(np.array(nets,dtype=object).astype(str),return_inverse=True)
+        layers=[[layer] if isinstance(layer,str) else list(layer) for layer in layers]
+        self.layernames=np.unique(np.array([name for names in layers for name in names],dtype=object).astype(str))
+        column={name:i for i,name in enumerate(self.layernames)}
+        # onlayer[i,j] is True if item i is on layer j
+        self.onlayer=np.zeros((len(layers),len(self.layernames)),dtype=bool)
+        self.onlayer[np.repeat(np.arange(len(layers)),[len(names) for names in layers]),
+                     [column[name] for names in layers for name in names]]=True
+
+    def names(self,names,pattern):
+        """
+        Mask of which names match a glob pattern, or any of a list of patterns
+        """
+        patterns=[pattern] if isinstance(pattern,str) else list(pattern)
+        return np.array([any(fnmatchcase(name,p) for p in patterns) for name in names],dtype=bool)
+
+    def select(self,*,r0:float=None,r1:float=None,theta0:float=None,theta1:float=None,
+               net=None,layer=None,ends:str="all"):
+        """
+        Select items by region, net, and layer. Any criterion left as None matches everything.
+
+        :param r0: Inner radius in mils. Ends must be further out than this.
+        :param r1: Outer radius in mils. Ends must be at or inside this.
+        :param theta0: Start azimuth, degrees clockwise from 12:00
+        :param theta1: End azimuth, clockwise from theta0
+        :param net: Glob pattern for the net name, or list of patterns
+        :param layer: Glob pattern for the layer name, or list of patterns. A via
+                      matches any layer it spans.
+        :param ends: "all" if both ends must be in the region, "any" if either may be
+        :return: Boolean mask over the items
+        """
+        inside=[]
+        for r,theta in ((self.r0,self.theta0),(self.r1,self.theta1)):
+            mask=np.ones(len(r),dtype=bool)
+            if r0 is not None:
+                mask&=r>r0
+            if r1 is not None:
+                mask&=r<=r1
+            if theta0 is not None and theta1 is not None and theta1-theta0<360:
+                mask&=(theta-theta0)%360<=(theta1-theta0)%360
+            inside.append(mask)
+        mask=(inside[0]&inside[1]) if ends=="all" else (inside[0]|inside[1])
+        if net is not None:
+            mask&=self.names(self.netnames,net)[self.net]
+        if layer is not None:
+            mask&=self.onlayer[:,self.names(self.layernames,layer)].any(axis=1)
+        return mask
+
+    def selected(self,mask):
+        """
+        Items picked out by a mask
+        """
+        return [self.items[i] for i in np.flatnonzero(mask)]
+
+
+class BoardSelection(PolarSelection):
+    """
+    Selection over the tracks and vias of a live pcbnew board
+    """
+    def __init__(self,board):
+        tracks=list(board.GetTracks())
+        super().__init__(items=tracks,
+                         xy0=[(track.GetStart().x,track.GetStart().y) for track in tracks],
+                         xy1=[(track.GetEnd().x,track.GetEnd().y) for track in tracks],
+                         nets=[track.GetNetname() for track in tracks],
+                         layers=[self.layers(board,track) for track in tracks])
+        self.board=board
+
+    @staticmethod
+    def layers(board,track):
+        """
+        Layer of a track, or all copper layers a via spans. Layer IDs aren't in
+        stackup order from KiCad 8 on, so the via is asked about each copper layer.
+        """
+        if track.GetClass()=="PCB_VIA":
+            return [board.GetLayerName(layer) for layer in board.GetEnabledLayers().CuStack()
+                    if track.IsOnLayer(layer)]
+        return track.GetLayerName()
+
+    def remove(self,mask,session):
+        """
+        Queue removal of the selected items on a BoardSession
+        """
+        for item in self.selected(mask):
+            session.remove(item)
+
+    def set_width(self,mask,width:int,session):
+        """
+        Queue setting the width of the selected items on a BoardSession, in mils
+        """
+        for item in self.selected(mask):
+            session.modify(item,width=width*mil)
+
+    def set_layer(self,mask,layer:str,session):
+        """
+        Queue moving the selected tracks to another layer on a BoardSession
+        """
+        for item in self.selected(mask):
+            session.modify(item,layer=session.layertable[layer])
+
+
+class FileSelection(PolarSelection):
+    """
+    Selection over the segments, arcs, and vias of a board file parsed by PcbFile
+    """
+    def __init__(self,doc):
+        self.doc=doc
+        nets=net_names(doc)
+        # Copper layers in stackup order, for the layers a via spans
+        copper=sorted((int(layer[0]),PcbFile.unquote(layer[1])) for layer in doc.find("layers")[1:]
+                      if PcbFile.unquote(layer[1]).endswith(".Cu"))
+        order=[name for _,name in copper]
+        items=[]
+        xy0=[]
+        xy1=[]
+        netnames=[]
+        layers=[]
+        for node in doc.root:
+            if not isinstance(node,PcbFile.SExpr) or node.name not in ("segment","arc","via"):
+                continue
+            items.append(node)
+            if node.name=="via":
+                at=node.value("at")
+                xy0.append(at[:2])
+                xy1.append(at[:2])
+                ends=[order.index(PcbFile.unquote(layer)) for layer in node.find("layers")[1:]]
+                layers.append(order[min(ends):max(ends)+1])
+            else:
+                xy0.append(node.value("start"))
+                xy1.append(node.value("end"))
+                layers.append(PcbFile.unquote(node.value("layer")))
+            netnames.append(nets.get(int(node.value("net",0)),""))
+        super().__init__(items=items,
+                         xy0=np.array(xy0,dtype=float).reshape(-1,2)*1e6,
+                         xy1=np.array(xy1,dtype=float).reshape(-1,2)*1e6,
+                         nets=netnames,layers=layers)
+
+    def remove(self,mask):
+        """
+        Remove the selected items from the document
+        """
+        doomed=set(id(item) for item in self.selected(mask))
+        root=self.doc.root
+        keep=[i for i,child in enumerate(root) if id(child) not in doomed]
+        ws=[root.ws[i] for i in keep]
+        root[:]=[root[i] for i in keep]
+        root.ws=ws
+
+    def set_width(self,mask,width:int):
+        """
+        Set the width of the selected tracks, in mils
+        """
+        for item in self.selected(mask):
+            node=item.find("width")
+            if node is not None:
+                node[1]=f"{width*mil/1e6:.6f}".rstrip("0").rstrip(".")
+
+    def set_layer(self,mask,layer:str):
+        """
+        Move the selected tracks to another layer
+        """
+        for item in self.selected(mask):
+            node=item.find("layer")
+            if node is not None:
+                node[1]=PcbFile.quote(layer)
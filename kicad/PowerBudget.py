@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Supply current and energy of the LED matrix over a whole day of hand positions
+
+Each of the four hands (Hour, Minute, Second, and Third, a sixtieth of a
+second) has 60 LEDs in the eights/ones matrix of LayoutPlan: the LED in slot
+s is on anode (eights) net s//8 and cathode (ones) net s%8. The matrix is
+scanned one anode net per frame, eight frames, with all four hands scanned
+in step. The drive is the same as IRDrop: a PMOS with on resistance Rhigh
+to the supply on each anode net, and a constant current sink on each
+cathode net, holding Iset while its output stays above Vknee.
+
+Since every LED of a hand has the same diode curve and the only thing
+LEDs share is their high side switch, the current of an LED only depends
+on how many others are lit in the same frame. That is solved once per hand
+for 0-8 lit LEDs, then once per hand position, so stepping through the day
+is just table lookups, done a chunk of steps at a time.
+
+To run:
+
+python PowerBudget.py
+
+python PowerBudget.py --vsupply 3.3 --fill Hour Minute --diode Hour=Red
+"""
+
+import argparse
+import os
+import sys
+from typing import NamedTuple
+
+import numpy as np
+
+import IRDrop
+
+# diode.py lives at the top of the repository, one level up from here
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import diode
+import partlib
+
+hands=("Hour","Minute","Second","Third")
+nSlots=60
+# Frames of the scan, one per anode (eights) net
+nFrames=8
+# Display updates per second. One per Third.
+updateRate=60
+# Steps handled at once, enough to keep numpy busy without a lot of memory
+chunkSteps=1<<18
+
+
+class HandTable(NamedTuple):
+    """
+    Drive of one hand at each of its 60 positions, all in SI units
+
+    :param lit: Number of LEDs lit
+    :param rail: Current of each anode net while its frame is on, 60x8
+    :param led: Power of the LEDs of each frame while it is on, 60x8
+    """
+    lit:np.ndarray
+    rail:np.ndarray
+    led:np.ndarray
+
+
+class Budget(NamedTuple):
+    """
+    Result of a run, all in SI units. Currents are from the supply to the high side switches.
+
+    :param steps: Number of display updates simulated
+    :param rate: Display updates per second
+    :param Vsupply: Supply voltage
+    :param lit_max: Most LEDs lit at once across all hands
+    :param lit_mean: Mean LEDs lit
+    :param I_mean: Mean supply current
+    :param I_step_max: Highest current of one display update, averaged over its scan
+    :param I_peak: Highest current of any one frame, IE what the supply has to deliver instantaneously
+    :param P_mean: Mean supply power
+    :param P_led: Mean power in the LEDs. The rest is dissipated in the switches and sinks.
+    :param energy: Energy over the run, J
+    :param rail_peak: Highest current of each anode net, 4 hands x 8 nets
+    :param rail_mean: Mean current of each anode net, 4 hands x 8 nets
+    :param I: Current of each step averaged over its scan, if asked for
+    """
+    steps:int
+    rate:int
+    Vsupply:float
+    lit_max:int
+    lit_mean:float
+    I_mean:float
+    I_step_max:float
+    I_peak:float
+    P_mean:float
+    P_led:float
+    energy:float
+    rail_peak:np.ndarray
+    rail_mean:np.ndarray
+    I:np.ndarray
+
+
+def led_current(d:diode.Diode,*,Vsupply:float,Rhigh:float,Iset:float,Vknee:float,maxit:int=60):
+    """
+    Current through each LED when 0-8 LEDs are lit on one anode net
+
+    The LEDs on a net share its high side switch, so with n lit, each sees
+    n*Rhigh of it. Where the sink can hold Iset, that is the current, otherwise
+    it is where the load line through the switch and the sink (as the
+    resistor Vknee/Iset) meets the diode curve, found by bisection over all
+    counts at once.
+
+    :param d: Diode curve
+    :return: Tuple of (I,Vf), each an array indexed by number of LEDs lit
+    """
+    n=np.arange(nFrames+1)
+    Rload=n*Rhigh+Vknee/Iset
+
+    def slack(I):
+        return Vsupply-I*Rload-d.Vi(I)
+    lo=np.zeros(len(n))
+    hi=np.full(len(n),min(Iset,d.Ifmax))
+    # Counts that hold the top of the range need no search
+    done=slack(hi)>=0
+    for _ in range(maxit):
+        mid=(lo+hi)/2
+        up=slack(mid)>=0
+        lo=np.where(up,mid,lo)
+        hi=np.where(up,hi,mid)
+    I=np.where(done,hi,lo)
+    I[0]=0.0
+    Vf=np.zeros(len(n))
+    Vf[1:]=d.Vi(I[1:])
+    return I,Vf
+
+
+def lit_span(position:np.ndarray,fill:bool):
+    """
+    Slots lit at each hand position
+
+    :param position: Hand positions, 0-59
+    :param fill: If True, light every slot from 12:00 up to the hand, otherwise just the hand
+    :return: Tuple of (first,end) slot arrays, end exclusive
+    """
+    end=position+1
+    return (np.zeros_like(position) if fill else position),end
+
+
+def hand_table(d:diode.Diode,*,fill:bool=False,Vsupply:float=IRDrop.Vsupply,Rhigh:float=IRDrop.Rhigh,
+               Iset:float=IRDrop.Iset,Vknee:float=IRDrop.Vknee):
+    """
+    Drive of one hand at each of its positions
+
+    :param d: Diode curve of the LEDs of this hand
+    :param fill: Light every slot up to the hand instead of just the hand
+    :return: HandTable
+    """
+    I,Vf=led_current(d,Vsupply=Vsupply,Rhigh=Rhigh,Iset=Iset,Vknee=Vknee)
+    first,end=lit_span(np.arange(nSlots),fill)
+    base=np.arange(nFrames)*8
+    # LEDs lit on each anode net, IE slots 8k to 8k+7 that are within the span
+    count=np.clip(end[:,None]-base[None,:],0,8)-np.clip(first[:,None]-base[None,:],0,8)
+    return HandTable(count.sum(axis=1),count*I[count],count*I[count]*Vf[count])
+
+
+def positions(step:np.ndarray,rate:int):
+    """
+    Positions of the four hands at each display update
+
+    :param step: Display update numbers from midnight
+    :param rate: Display updates per second
+    :return: Array of steps x 4 positions, 0-59, in hands order
+    """
+    second,sub=np.divmod(step,rate)
+    minute=second//60
+    hour=minute//60
+    return np.stack([(hour%12)*5+(minute%60)//12,minute%60,second%60,(sub*60)//rate],axis=1)
+
+
+def simulate(*,hours:float=24,rate:int=updateRate,diodes:dict=None,fill=(),Vsupply:float=IRDrop.Vsupply,
+             Rhigh:float=IRDrop.Rhigh,Iset:float=IRDrop.Iset,Vknee:float=IRDrop.Vknee,keep:bool=False):
+    """
+    Step through the hand positions from midnight
+
+    :param hours: Length of the run
+    :param rate: Display updates per second
+    :param diodes: Dict of Diode by hand name, default is Yellow for every hand
+    :param fill: Names of hands drawn as a filled arc from 12:00 instead of a single LED
+    :param keep: Keep the current of every step in Budget.I
+    :return: Budget
+    """
+    diodes=dict(diodes or {})
+    tables=[hand_table(diodes.get(name,diode.Yellow),fill=name in fill,Vsupply=Vsupply,Rhigh=Rhigh,
+                       Iset=Iset,Vknee=Vknee) for name in hands]
+    rail=np.stack([table.rail for table in tables])
+    # Only the totals of each position are needed for the lit count and LED power
+    led=np.stack([table.led.sum(axis=1) for table in tables])/nFrames
+    lit=np.stack([table.lit for table in tables])
+    steps=int(round(hours*3600*rate))
+    I=np.zeros(steps) if keep else None
+    lit_max=0
+    lit_sum=0
+    I_sum=0.0
+    I_step_max=0.0
+    I_peak=0.0
+    P_led=0.0
+    # How often each hand sits at each position, for the per net figures
+    visits=np.zeros((len(hands),nSlots),dtype=np.int64)
+    for start in range(0,steps,chunkSteps):
+        pos=positions(np.arange(start,min(start+chunkSteps,steps)),rate)
+        frames=rail[0][pos[:,0]]
+        nlit=lit[0][pos[:,0]]
+        for i_hand in range(len(hands)):
+            if i_hand>0:
+                frames+=rail[i_hand][pos[:,i_hand]]
+                nlit+=lit[i_hand][pos[:,i_hand]]
+            P_led+=float(led[i_hand][pos[:,i_hand]].sum())
+            visits[i_hand]+=np.bincount(pos[:,i_hand],minlength=nSlots)
+        I_step=frames.mean(axis=1)
+        lit_max=max(lit_max,int(nlit.max()))
+        lit_sum+=int(nlit.sum())
+        I_sum+=float(I_step.sum())
+        I_step_max=max(I_step_max,float(I_step.max()))
+        I_peak=max(I_peak,float(frames.max()))
+        if keep:
+            I[start:start+len(I_step)]=I_step
+    seen=visits>0
+    rail_peak=np.where(seen[:,:,None],rail,0).max(axis=1)
+    rail_mean=np.einsum("hp,hpk->hk",visits,rail)/nFrames/max(steps,1)
+    I_mean=I_sum/max(steps,1)
+    return Budget(steps,rate,Vsupply,lit_max,lit_sum/max(steps,1),I_mean,I_step_max,I_peak,
+                  I_mean*Vsupply,P_led/max(steps,1),I_sum*Vsupply/rate,rail_peak,rail_mean,I)
+
+
+def report(budget:Budget):
+    """
+    Print the figures that size the supply
+    """
+    hours=budget.steps/budget.rate/3600
+    print(f"{budget.steps} updates at {budget.rate}/s over {hours:g}h, {budget.lit_mean:.2f} LEDs lit on average, "
+          f"{budget.lit_max} at most")
+    print(f"Supply current: mean {budget.I_mean*1000:.2f}mA, worst update {budget.I_step_max*1000:.2f}mA, "
+          f"peak frame {budget.I_peak*1000:.2f}mA")
+    print(f"Power: mean {budget.P_mean*1000:.1f}mW from {budget.Vsupply:g}V, "
+          f"{budget.P_led*1000:.1f}mW in the LEDs and {(budget.P_mean-budget.P_led)*1000:.1f}mW in the drivers")
+    print(f"Energy: {budget.energy:.1f}J = {budget.energy/3600:.4f}Wh = "
+          f"{budget.energy/budget.Vsupply/3.6:.2f}mAh at {budget.Vsupply:g}V")
+    for name,peak,mean in zip(hands,budget.rail_peak,budget.rail_mean):
+        print(f"{name:6} anode nets peak/mean mA: "+" ".join(f"{p*1000:.1f}/{m*1000:.2f}" for p,m in zip(peak,mean)))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='PowerBudget.py')
+    parser.add_argument('--hours', type=float, default=24, help='Length of the run from midnight (default = 24)')
+    parser.add_argument('--rate', type=int, default=updateRate,
+                        help=f'Display updates per second (default = {updateRate})')
+    parser.add_argument('--fill', nargs='*', choices=hands, default=[],
+                        help='Hands drawn as a filled arc from 12:00 instead of a single LED')
+    parser.add_argument('--diode', nargs='*', default=[], metavar='HAND=NAME',
+                        help='Diode curve of a hand, any Diode in diode.py or part in the part library (default = Yellow)')
+    parser.add_argument('--vsupply', type=float, default=IRDrop.Vsupply,
+                        help=f'High side supply, V (default = {IRDrop.Vsupply})')
+    parser.add_argument('--rhigh', type=float, default=IRDrop.Rhigh,
+                        help=f'High side switch resistance, ohms (default = {IRDrop.Rhigh})')
+    parser.add_argument('--iset', type=float, default=IRDrop.Iset*1000,
+                        help=f'Sink current, mA (default = {IRDrop.Iset*1000:g})')
+    parser.add_argument('--vknee', type=float, default=IRDrop.Vknee,
+                        help=f'Sink dropout voltage, V (default = {IRDrop.Vknee})')
+    args = parser.parse_args()
+    diodes={}
+    for spec in args.diode:
+        name,part=spec.split("=")
+        d=getattr(diode,part,None)
+        if not isinstance(d,diode.Diode):
+            try:
+                d=partlib.library()[part]
+            except (FileNotFoundError,KeyError):
+                d=None
+        if name not in hands or not isinstance(d,diode.Diode):
+            parser.error(f"Bad --diode {spec}")
+        diodes[name]=d
+    report(simulate(hours=args.hours,rate=args.rate,diodes=diodes,fill=args.fill,Vsupply=args.vsupply,
+                    Rhigh=args.rhigh,Iset=args.iset/1000,Vknee=args.vknee))
+
+
+if __name__=="__main__":
+    main()
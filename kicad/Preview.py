@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Headless raster preview of the clock face copper, and pixel diffs between revisions
+
+Tracks, arcs, vias, and pads are all capsules, so each layer is drawn by
+stamping a disk of the capsule's half-width at closely spaced points along
+its centerline, all as flat index arrays into the image with no per-pixel
+Python. Each pixel remembers which net covers it, colored by a hash of the
+net name so the same net is the same color in every picture. A pixel
+covered by copper of more than one net is a short, and is marked as such
+whatever order the copper was drawn in. Courtyards and the board edge are
+drawn over the copper as thin gray outlines.
+
+Either side of a comparison can be a board file or "plan", which is the
+board file with the plan LayoutPlan generates merged in by PlanWriter, as
+it would be written. So to see what a layout change will do before writing
+it:
+
+python Preview.py Precision23.kicad_pcb plan -o review
+
+writes review_a_F.Cu.png and review_a_B.Cu.png from the file,
+review_b_F.Cu.png and review_b_B.Cu.png from the file with the plan merged
+in, and review_diff_F.Cu.png and review_diff_B.Cu.png, where copper only in
+the first is red, only in the second is green, on a different net is
+yellow, newly shorted is magenta, and unchanged is gray. Zones are not
+drawn.
+"""
+
+import argparse
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import LayoutPlan
+import PcbFile
+import PlanWriter
+from PcbIndex import arc_points,footprint_placement,footprint_point,net_names,pad_capsule,pad_layers
+
+layers=("F.Cu","B.Cu")
+# Graphic layers whose lines are drawn as outlines on each copper layer
+outlineLayers={"F.Cu":("F.CrtYd","Edge.Cuts"),"B.Cu":("B.CrtYd","Edge.Cuts")}
+# Millimeters to mils
+mm=1e6/LayoutPlan.mil
+# Largest number of pixel writes done at once, to bound memory
+chunk=1<<22
+# Board a plan is merged into when neither side of a comparison is a board file
+defaultBoard=os.path.join(os.path.dirname(os.path.abspath(__file__)),"Precision23.kicad_pcb")
+
+outlineColor=(160,160,160)
+sameColor=(70,70,70)
+removedColor=(255,40,40)
+addedColor=(40,255,40)
+changedColor=(255,255,0)
+shortColor=(255,0,255)
+
+
+def net_code(name:str):
+    """
+    Code of a net that stays the same between renders, never 0 (which is bare board)
+    """
+    return zlib.crc32(name.encode())|1
+
+
+def net_colors(codes):
+    """
+    Bright color for each net code, by spreading the hash around the hue circle
+
+    :return: N x 3 uint8 array
+    """
+    hue=(np.asarray(codes,dtype=np.int64)%3600)/600.0
+    sector=np.floor(hue).astype(int)
+    f=hue-sector
+    lo=np.full(len(hue),0.3)
+    hi=np.ones(len(hue))
+    up=0.3+0.7*f
+    down=1-0.7*f
+    # HSV to RGB at full value and 70% saturation, one row of (R,G,B) per sector
+    table=[(hi,up,lo),(down,hi,lo),(lo,hi,up),(lo,down,hi),(up,lo,hi),(hi,lo,down)]
+    rgb=np.zeros((len(hue),3))
+    for i,channels in enumerate(table):
+        here=sector==i
+        rgb[here]=np.stack(channels,1)[here]
+    return (rgb*255).astype(np.uint8)
+
+
+class Raster:
+    """
+    Net of every pixel of each copper layer, plus outlines
+
+    :param x0: Left edge in mils, kicad global coordinates
+    :param y0: Top edge in mils
+    :param x1: Right edge in mils
+    :param y1: Bottom edge in mils
+    :param scale: Pixels per mil
+    """
+    def __init__(self,*,x0:float=0,y0:float=0,x1:float=7000,y1:float=7000,scale:float=1.0):
+        self.x0=x0
+        self.y0=y0
+        self.scale=scale
+        self.width=int(np.ceil((x1-x0)*scale))
+        self.height=int(np.ceil((y1-y0)*scale))
+        # Each pixel is an index into netnames, 0 for bare board. nets holds the
+        # highest index drawn on a pixel and low the lowest, so where they differ
+        # the pixel is shorted, no matter which was drawn last.
+        self.netnames=[""]
+        self.netindex={}
+        self.nets={layer:np.zeros(self.height*self.width,dtype=np.uint16) for layer in layers}
+        self.low={layer:np.full(self.height*self.width,np.iinfo(np.uint16).max,dtype=np.uint16) for layer in layers}
+        self.outlines={layer:np.zeros(self.height*self.width,dtype=bool) for layer in layers}
+        self.disks={}
+
+    def disk(self,r:int):
+        """
+        Flat index offsets of every pixel within r pixels of a center pixel
+        """
+        if r not in self.disks:
+            dy,dx=np.mgrid[-r:r+1,-r:r+1]
+            inside=dx*dx+dy*dy<=r*r+r
+            self.disks[r]=(dy[inside],dx[inside])
+        return self.disks[r]
+
+    def stamp(self,x0,y0,x1,y1,hw):
+        """
+        Pixels covered by capsules
+
+        :param x0: Array of end 0 x in mils, and so on for y0, x1, y1
+        :param hw: Array of half-widths in mils
+        :return: Iterator of (pixels,owner) in chunks, flat indexes into a layer
+                 array and the index of the capsule covering each
+        """
+        s=self.scale
+        px0=(np.asarray(x0,dtype=float)-self.x0)*s
+        py0=(np.asarray(y0,dtype=float)-self.y0)*s
+        px1=(np.asarray(x1,dtype=float)-self.x0)*s
+        py1=(np.asarray(y1,dtype=float)-self.y0)*s
+        r=np.maximum(np.round(np.asarray(hw,dtype=float)*s),0).astype(np.int64)
+        # Points along each centerline no more than a pixel apart
+        n=np.ceil(np.hypot(px1-px0,py1-py0)).astype(np.int64)+1
+        owner=np.repeat(np.arange(len(n)),n)
+        t=(np.arange(n.sum())-np.repeat(np.cumsum(n)-n,n))/np.maximum(np.repeat(n,n)-1,1)
+        px=np.round(px0[owner]+t*(px1-px0)[owner]).astype(np.int64)
+        py=np.round(py0[owner]+t*(py1-py0)[owner]).astype(np.int64)
+        pr=r[owner]
+        for radius in np.unique(pr):
+            these=np.flatnonzero(pr==radius)
+            dy,dx=self.disk(int(radius))
+            step=max(1,chunk//len(dx))
+            for start in range(0,len(these),step):
+                i=these[start:start+step]
+                x=px[i][:,None]+dx[None,:]
+                y=py[i][:,None]+dy[None,:]
+                ok=(x>=0)&(x<self.width)&(y>=0)&(y<self.height)
+                yield (y*self.width+x)[ok],np.broadcast_to(owner[i][:,None],x.shape)[ok]
+
+    def copper(self,layer:str,x0,y0,x1,y1,hw,nets:list):
+        """
+        Draw copper capsules on a layer, in mils, each on the net of the same index in nets
+        """
+        if len(nets):
+            for net in nets:
+                if net not in self.netindex:
+                    self.netindex[net]=len(self.netnames)
+                    self.netnames.append(net)
+            value=np.array([self.netindex[net] for net in nets],dtype=np.uint16)
+            for pixels,owner in self.stamp(x0,y0,x1,y1,hw):
+                np.maximum.at(self.nets[layer],pixels,value[owner])
+                np.minimum.at(self.low[layer],pixels,value[owner])
+
+    def outline(self,layer:str,x0,y0,x1,y1):
+        """
+        Draw thin outline lines on a layer, in mils
+        """
+        if len(x0):
+            for pixels,_ in self.stamp(x0,y0,x1,y1,np.zeros(len(x0))):
+                self.outlines[layer][pixels]=True
+
+    def shorts(self,layer:str):
+        """
+        Mask of the pixels of a layer covered by more than one net
+        """
+        return (self.nets[layer]!=0)&(self.low[layer]!=self.nets[layer])
+
+    def codes(self):
+        """
+        Net code of each index into netnames, which is the same for the same net in any raster
+        """
+        return np.array([0]+[net_code(net) for net in self.netnames[1:]],dtype=np.uint32)
+
+    def indexed(self,layer:str):
+        """
+        Picture of a layer as palette indexes, which is a quarter the size of RGB
+        and what write_png() writes fastest
+
+        :return: Tuple of (pixels,palette), a height x width array of indexes and an
+                 N x 3 uint8 array of colors
+        """
+        palette=np.concatenate([net_colors(self.codes()),[outlineColor]]).astype(np.uint8)
+        palette[0]=0
+        dtype=np.uint8 if len(palette)<=256 else np.uint16
+        pixels=self.nets[layer].astype(dtype)
+        pixels[self.outlines[layer]]=len(palette)-1
+        return pixels.reshape(self.height,self.width),palette
+
+    def image(self,layer:str):
+        """
+        Colored picture of a layer
+
+        :return: Height x width x 3 uint8 array
+        """
+        pixels,palette=self.indexed(layer)
+        return palette[pixels]
+
+
+def render_file(doc,raster:Raster):
+    """
+    Draw the tracks, arcs, vias, pads, courtyards, and board edge of a board file parsed by PcbFile
+    """
+    nets=net_names(doc)
+    copper={layer:[] for layer in layers}
+    lines={layer:[] for layer in layers}
+
+    def line(layer,start,end):
+        for side,drawn in outlineLayers.items():
+            if layer in drawn:
+                lines[side].append(start+end)
+
+    def graphic(node,place):
+        # Outline of one graphic item, with points moved by place()
+        layer=PcbFile.unquote(node.value("layer","")) if node.find("layer") is not None else ""
+        if not any(layer in drawn for drawn in outlineLayers.values()):
+            return
+        if node.name in ("gr_line","fp_line"):
+            line(layer,place(node.value("start")),place(node.value("end")))
+        elif node.name in ("gr_arc","fp_arc"):
+            points=arc_points(place(node.value("start")),place(node.value("mid")),place(node.value("end")),tol=0.01)
+            for start,end in zip(points[:-1],points[1:]):
+                line(layer,start,end)
+        elif node.name in ("gr_rect","fp_rect"):
+            (ax,ay),(bx,by)=[tuple(float(v) for v in node.value(name)) for name in ("start","end")]
+            corners=[place(corner) for corner in ((ax,ay),(bx,ay),(bx,by),(ax,by))]
+            for i in range(4):
+                line(layer,corners[i],corners[(i+1)%4])
+        elif node.name in ("gr_circle","fp_circle"):
+            (cx,cy),(ex,ey)=place(node.value("center")),place(node.value("end"))
+            r=np.hypot(ex-cx,ey-cy)
+            theta=np.linspace(0,2*np.pi,65)
+            points=list(zip(cx+r*np.cos(theta),cy+r*np.sin(theta)))
+            for start,end in zip(points[:-1],points[1:]):
+                line(layer,start,end)
+
+    def board_point(xy):
+        return (float(xy[0]),float(xy[1]))
+
+    for node in doc.root:
+        if not isinstance(node,PcbFile.SExpr):
+            continue
+        if node.name in ("segment","arc"):
+            layer=PcbFile.unquote(node.value("layer"))
+            if layer not in copper:
+                continue
+            start=board_point(node.value("start"))
+            end=board_point(node.value("end"))
+            points=[start,end] if node.name=="segment" else arc_points(start,board_point(node.value("mid")),end,tol=0.005)
+            net=nets.get(int(node.value("net",0)),"")
+            for (ax,ay),(bx,by) in zip(points[:-1],points[1:]):
+                copper[layer].append((ax,ay,bx,by,float(node.value("width"))/2,net))
+        elif node.name=="via":
+            x,y=board_point(node.value("at"))
+            net=nets.get(int(node.value("net",0)),"")
+            for layer in layers:
+                copper[layer].append((x,y,x,y,float(node.value("size"))/2,net))
+        elif node.name=="footprint":
+            at=footprint_placement(node)
+
+            def place(xy,at=at):
+                return footprint_point(xy,at)
+
+            for child in node:
+                if not isinstance(child,PcbFile.SExpr):
+                    continue
+                if child.name=="pad":
+                    net=child.find("net")
+                    net="" if net is None else PcbFile.unquote(net[2])
+                    x0,y0,x1,y1,hw=pad_capsule(child,at)
+                    for layer in pad_layers(child,layers):
+                        copper[layer].append((x0,y0,x1,y1,hw,net))
+                else:
+                    graphic(child,place)
+        elif node.name and node.name.startswith("gr_"):
+            graphic(node,board_point)
+    for layer in layers:
+        if copper[layer]:
+            x0,y0,x1,y1,hw,net=zip(*copper[layer])
+            raster.copper(layer,np.array(x0)*mm,np.array(y0)*mm,np.array(x1)*mm,np.array(y1)*mm,
+                          np.array(hw)*mm,net)
+        if lines[layer]:
+            x0,y0,x1,y1=np.array(lines[layer]).T*mm
+            raster.outline(layer,x0,y0,x1,y1)
+    return raster
+
+
+def diff(a:Raster,b:Raster,layer:str):
+    """
+    Picture of what changed on a layer between two rasters of the same area
+
+    A pixel is compared by the set of nets on it, so copper of different nets
+    overlapping the same way on both sides is unchanged, whichever was drawn
+    last. A pixel that is shorted in the second raster and wasn't shorted the
+    same way in the first counts as shorted, not as added or changed.
+
+    :return: Tuple of (pixels,palette,counts), the picture as in Raster.indexed(),
+             and counts of the removed, added, changed, and shorted pixels
+    """
+    def nets(raster):
+        # Lowest and highest net code on each pixel, the same whatever order they were drawn in
+        codes=raster.codes()
+        hi=codes[raster.nets[layer]]
+        lo=np.where(raster.shorts(layer),codes[np.minimum(raster.low[layer],len(codes)-1)],hi)
+        return np.minimum(lo,hi),np.maximum(lo,hi)
+    loa,na=nets(a)
+    lob,nb=nets(b)
+    differ=(loa!=lob)|(na!=nb)
+    shorted=b.shorts(layer)&differ
+    removed=(na!=0)&(nb==0)
+    added=(na==0)&(nb!=0)&~shorted
+    changed=(na!=0)&(nb!=0)&differ&~shorted
+    palette=np.array([(0,0,0),sameColor,outlineColor,removedColor,addedColor,changedColor,shortColor],
+                     dtype=np.uint8)
+    pixels=(na!=0).astype(np.uint8)
+    pixels[b.outlines[layer]]=2
+    pixels[removed]=3
+    pixels[added]=4
+    pixels[changed]=5
+    pixels[shorted]=6
+    counts={"removed":int(removed.sum()),"added":int(added.sum()),"changed":int(changed.sum()),
+            "shorted":int(shorted.sum())}
+    return pixels.reshape(a.height,a.width),palette,counts
+
+
+def write_png(filename:str,pixels,palette=None,level:int=1):
+    """
+    Write an image as a PNG, with nothing but zlib
+
+    :param pixels: Height x width x 3 uint8 array of RGB, or height x width array
+                   of indexes into palette
+    :param palette: N x 3 uint8 array of colors, at most 256, if pixels are indexes
+    :param level: zlib compression level. The pictures are mostly bare board, so
+                  fast compression is still small.
+    """
+    if palette is not None and len(palette)>256:
+        pixels,palette=palette[pixels],None
+    height,width=pixels.shape[:2]
+    channels=1 if palette is not None else 3
+    # Filter type 0 (none) in front of every row
+    rows=np.zeros((height,width*channels+1),dtype=np.uint8)
+    rows[:,1:]=pixels.reshape(height,width*channels)
+
+    def chunk(kind:bytes,data:bytes):
+        return struct.pack(">I",len(data))+kind+data+struct.pack(">I",zlib.crc32(kind+data))
+
+    with open(filename,"wb") as ouf:
+        ouf.write(b"\x89PNG\r\n\x1a\n")
+        ouf.write(chunk(b"IHDR",struct.pack(">IIBBBBB",width,height,8,3 if palette is not None else 2,0,0,0)))
+        if palette is not None:
+            ouf.write(chunk(b"PLTE",np.asarray(palette,dtype=np.uint8).tobytes()))
+        ouf.write(chunk(b"IDAT",zlib.compress(rows.tobytes(),level)))
+        ouf.write(chunk(b"IEND",b""))
+
+
+def render(source:str,*,board:str=defaultBoard,**kwargs):
+    """
+    Raster of a board file, or if source is "plan", of a board file with the
+    generated plan merged in
+
+    :param board: Board file the plan is merged into
+    :param kwargs: Area and scale, see Raster
+    """
+    raster=Raster(**kwargs)
+    if source=="plan":
+        doc=PcbFile.read(board)
+        PlanWriter.merge(doc,LayoutPlan.layout())
+        return render_file(doc,raster)
+    return render_file(PcbFile.read(source),raster)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Preview.py')
+    parser.add_argument('a', help='Board file, or "plan" for the board file with the generated layout merged in')
+    parser.add_argument('b', nargs='?', default=None, help='Second revision to compare against the first')
+    parser.add_argument('-o', '--output', type=str, default='preview', help='Prefix of the PNG files (default = preview)')
+    parser.add_argument('-s', '--scale', type=float, default=1.0, help='Pixels per mil (default = 1)')
+    parser.add_argument('--area', type=float, nargs=4, default=[0,0,7000,7000], metavar=('X0','Y0','X1','Y1'),
+                        help='Area to draw in mils (default = 0 0 7000 7000)')
+    args = parser.parse_args()
+    area=dict(zip(("x0","y0","x1","y1"),args.area),scale=args.scale)
+    sources=[args.a] if args.b is None else [args.a,args.b]
+    # The plan goes into the board file being compared against, if there is one
+    board=([source for source in sources if source!="plan"] or [defaultBoard])[0]
+    rasters=[render(source,board=board,**area) for source in sources]
+    for name,raster in zip(("a","b"),rasters):
+        for layer in layers:
+            write_png(f"{args.output}_{name}_{layer}.png",*raster.indexed(layer))
+    if len(rasters)==2:
+        for layer in layers:
+            pixels,palette,counts=diff(rasters[0],rasters[1],layer)
+            write_png(f"{args.output}_diff_{layer}.png",pixels,palette)
+            print(f"{layer}: {counts['removed']} pixels removed, {counts['added']} added, "
+                  f"{counts['changed']} changed net, {counts['shorted']} shorted")
+
+
+if __name__=="__main__":
+    main()
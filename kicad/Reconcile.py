@@ -0,0 +1,97 @@
+"""
+Match a LayoutPlan against what is already on the board
+
+Every track, arc, and via gets a key from its kind, net, layer, size, and
+endpoints quantized to a small grid, with the ends of tracks and arcs in
+either order. Planned items whose key is already on the board are left
+alone, only the missing ones are added, and only existing items inside the
+plan's erasures that the plan no longer wants are removed. Running the same
+plan twice therefore changes nothing the second time, and a small change to
+the layout only touches the items it affects.
+
+The keys are built from plain values, so the same matching works on the
+live board (MatrixTraces.reconcile()) and on the board file
+(PlanWriter --reconcile).
+"""
+
+import LayoutPlan
+
+# Grid that endpoints and sizes are snapped to before comparing, in nanometers.
+# Coarse enough to absorb the rounding of millimeters in the board file, fine
+# enough that distinct plan points (always whole mils) never collide.
+quantum=1000
+
+
+def q(value:float):
+    """
+    Snap a length in nanometers to the matching grid
+    """
+    return int(round(value/quantum))
+
+
+def qxy(xy:tuple):
+    return (q(xy[0]),q(xy[1]))
+
+
+def track_key(signame:str,layer:str,width:float,xy0:tuple,xy1:tuple):
+    """
+    Key of a straight track, with lengths in nanometers
+    """
+    return ("track",signame,layer,q(width))+tuple(sorted((qxy(xy0),qxy(xy1))))
+
+
+def arc_key(signame:str,layer:str,width:float,xy0:tuple,xymid:tuple,xy1:tuple):
+    """
+    Key of an arc track, with lengths in nanometers
+    """
+    return ("arc",signame,layer,q(width),qxy(xymid))+tuple(sorted((qxy(xy0),qxy(xy1))))
+
+
+def via_key(signame:str,layer0:str,layer1:str,xy:tuple,dia:float,drill:float):
+    """
+    Key of a via, with lengths in nanometers
+    """
+    return ("via",signame)+tuple(sorted((layer0,layer1)))+(qxy(xy),q(dia),q(drill))
+
+
+def planned(plan:LayoutPlan.Plan):
+    """
+    Keys of everything a plan draws
+
+    :return: List of (key,item) for the tracks, arcs, and vias of the plan
+    """
+    result=[(track_key(item.signame,item.layer,item.width,item.xy0,item.xy1),item) for item in plan.tracks]
+    result+=[(arc_key(item.signame,item.layer,item.width,item.xy0,item.xymid,item.xy1),item) for item in plan.arcs]
+    result+=[(via_key(item.signame,item.layer0,item.layer1,item.xy,item.dia,item.drill),item) for item in plan.vias]
+    return result
+
+
+def reconcile(plan:LayoutPlan.Plan,existing:list,scope):
+    """
+    Work out the smallest change that makes the board match a plan
+
+    :param plan: Plan from LayoutPlan.layout()
+    :param existing: List of (key,item) for every track, arc, and via on the board
+    :param scope: Container of the indexes into existing of items the plan owns,
+                  IE the ones its erasures would remove. Only these can be stale.
+    :return: Tuple of (todo,stale). todo is a Plan with the placements of the
+             original and only the missing tracks, arcs, and vias. stale is a
+             list of the existing items to remove.
+    """
+    onboard={}
+    for i,(key,item) in enumerate(existing):
+        onboard.setdefault(key,[]).append(i)
+    matched=set()
+    todo=LayoutPlan.Plan()
+    todo.placements=list(plan.placements)
+    for key,item in planned(plan):
+        if onboard.get(key):
+            matched.add(onboard[key].pop())
+        elif isinstance(item,LayoutPlan.Track):
+            todo.tracks.append(item)
+        elif isinstance(item,LayoutPlan.Arc):
+            todo.arcs.append(item)
+        else:
+            todo.vias.append(item)
+    stale=[existing[i][1] for i in sorted(scope) if i not in matched]
+    return todo,stale
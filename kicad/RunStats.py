@@ -0,0 +1,96 @@
+"""
+Timing, counts, and logging of layout runs
+
+Each phase of a run (place, erase, rings, arcs, radials, taps, and on the
+board side building items, committing them, and refreshing) is timed with
+stats.phase(), and everything worth counting (items added and removed, net
+lookups, refreshes) goes through stats.count(). At the end of a run,
+stats.report() prints a one line summary and a JSON record that scripts can
+pick out by its "RUNSTATS " prefix, or writes the JSON to a file.
+
+Chatter about individual items only comes out when verbosity is raised:
+
+import RunStats
+RunStats.verbosity=2
+MatrixTraces.run()
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# 0 is the summary only, 1 adds a line per phase, 2 adds a line per item
+verbosity=0
+
+
+def log(level:int,message:str):
+    """
+    Print a message if the verbosity is at least level
+    """
+    if verbosity>=level:
+        print(message,file=sys.stderr)
+
+
+class Stats:
+    """
+    Wall clock time of each phase and counts of events, for one run
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Start a new run
+        """
+        self.started=time.perf_counter()
+        self.phases={}
+        self.counts={}
+
+    @contextmanager
+    def phase(self,name:str):
+        """
+        Time the enclosed block. Time for a phase entered more than once adds up.
+        """
+        t0=time.perf_counter()
+        try:
+            yield
+        finally:
+            dt=time.perf_counter()-t0
+            self.phases[name]=self.phases.get(name,0.0)+dt
+            log(1,f"{name}: {dt*1000:.1f}ms")
+
+    def count(self,name:str,n:int=1):
+        """
+        Add to a counter
+        """
+        self.counts[name]=self.counts.get(name,0)+n
+
+    def summary(self):
+        """
+        Everything recorded so far, as plain values
+
+        :return: Dict with total seconds, seconds per phase, and counts
+        """
+        return {"total":time.perf_counter()-self.started,
+                "phases":dict(self.phases),
+                "counts":dict(self.counts)}
+
+    def report(self,filename:str=None):
+        """
+        Print the summary of the run, and its JSON record either to stdout or to a file
+        """
+        summary=self.summary()
+        phases=" ".join(f"{name}={dt*1000:.1f}ms" for name,dt in summary["phases"].items())
+        counts=" ".join(f"{name}={n}" for name,n in summary["counts"].items())
+        print(f"Run took {summary['total']*1000:.1f}ms: {phases} {counts}")
+        if filename is None:
+            print("RUNSTATS "+json.dumps(summary))
+        else:
+            with open(filename,"wt") as ouf:
+                json.dump(summary,ouf,indent=2)
+        return summary
+
+
+# Stats of the current run
+stats=Stats()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Compiled library of LED parts, memory mapped so it loads instantly
+
+Building the library gathers every part in one place: the Diode objects
+defined in diode.py, the curves digitized with Engauge (.dig files in
+kicad/), and any measured CSV curves named on the command line. The
+library file is a small header, a table of one fixed size record per part
+(names, part numbers, wavelength, brightness, nominal and maximum
+operating point, color, and where its curve is), then every curve in one
+contiguous buffer of (V,I) pairs. Everything is stored in SI units, the
+same as inside a Diode.
+
+Opening the library maps the file, so nothing is read until it is used,
+and every process on the machine shares the same pages. The Diodes it
+hands out are views whose curves point straight into the mapping.
+
+To build:
+
+python partlib.py
+
+To use:
+
+import partlib
+Yellow = partlib.library()["Yellow"]
+"""
+
+import argparse
+import glob
+import os
+import struct
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import diode
+
+# Magic, format version, part count, offset of the table, offset of the curves
+headerFormat = "<8sIIQQ"
+magic = b"P23PARTS"
+version = 1
+# Table and curves start on these boundaries, so every array in the file is aligned
+alignment = 64
+recordType = np.dtype([("name", "S48"), ("MFRnum", "S32"), ("DKnum", "S32"), ("hex", "S8"),
+                       ("lam", "<f8"), ("If", "<f8"), ("Vf", "<f8"), ("Ifmax", "<f8"), ("Vfmax", "<f8"),
+                       ("cd", "<f8"), ("start", "<i8"), ("count", "<i8")])
+
+here = os.path.dirname(os.path.abspath(__file__))
+defaultLibrary = os.path.join(here, "parts.p23lib")
+digDir = os.path.join(here, "kicad")
+
+
+def align(offset: int):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def read_dig(filename: str):
+    """
+    Read the digitized curve of an Engauge document
+
+    The three axis points give the mapping from screen to graph coordinates,
+    which is applied to the points of the first curve. Graph X is volts and
+    graph Y is mA, as on a datasheet.
+
+    A diode's current never falls as its voltage rises. The points are put
+    in order of voltage, and any point whose current dips below that of a
+    point before it, which is digitizing jitter, is dropped. The points that
+    are kept are the (V,I) pairs as digitized.
+
+    :return: Nx2 array of (V,I), I in A, both increasing
+    """
+    root = ET.parse(filename).getroot()
+    coords = root.find("CoordSystem/Coords").attrib
+    logx = coords.get("ScaleXThetaString") == "Log"
+    logy = coords.get("ScaleYRadiusString") == "Log"
+    name = curve_name(root)
+    screen = []
+    graph = []
+    curve = []
+    for point in root.iter("Point"):
+        xy = point.find("PositionScreen")
+        xy = [float(xy.get("X")), float(xy.get("Y"))]
+        if point.get("IsAxisPoint") == "True":
+            gxy = point.find("PositionGraph")
+            gx, gy = float(gxy.get("X")), float(gxy.get("Y"))
+            screen.append(xy + [1.0])
+            graph.append([np.log10(gx) if logx else gx, np.log10(gy) if logy else gy])
+        elif point.get("Identifier").split("\t")[0] == name:
+            curve.append((int(point.get("Ordinal")), xy))
+    transform = np.linalg.solve(np.array(screen), np.array(graph))
+    curve.sort()
+    VI = np.array([xy + [1.0] for _, xy in curve]) @ transform
+    if logx:
+        VI[:, 0] = 10.0 ** VI[:, 0]
+    if logy:
+        VI[:, 1] = 10.0 ** VI[:, 1]
+    VI[:, 1] /= 1000.0
+    VI = VI[np.argsort(VI[:, 0], kind="stable")]
+    return VI[VI[:, 1] >= np.maximum.accumulate(VI[:, 1])]
+
+
+def curve_name(root):
+    """
+    Name of the first curve of an Engauge document that isn't the axes
+    """
+    for curve in root.iter("Curve"):
+        if curve.get("CurveName") != "Axes":
+            return curve.get("CurveName")
+    return None
+
+
+def part(name: str, d: diode.Diode):
+    """
+    Library entry for a Diode
+    """
+    return dict(name=name, MFRnum=d.MFRnum or "", DKnum=d.DKnum or "", hex=d.hex or "", lam=d.lam, If=d.If,
+                Vf=d.Vf, Ifmax=d.Ifmax, Vfmax=d.Vfmax, cd=d.cd, VI=np.asarray(d.VI, dtype=float))
+
+
+def sources(*, dig=None, csv=()):
+    """
+    Every part to go in the library
+
+    Parts defined in diode.py are named for the shortest name they have
+    there, IE "Yellow". Digitized and CSV curves are named for their file,
+    and take the part numbers and ratings of the diode.py part whose
+    manufacturer number is in the file name, or failing that, whose short
+    name is the first word of the file name, if there is one.
+
+    :param dig: Engauge files, default is all of them in kicad/
+    :param csv: Measured curve files in the format Diode(VIfn=...) reads
+    :return: List of dicts of record fields plus VI
+    """
+    names = {}
+    for name, value in vars(diode).items():
+        if isinstance(value, diode.Diode):
+            names.setdefault(id(value), []).append(name)
+    parts = []
+    known = {}
+    for name, value in vars(diode).items():
+        if isinstance(value, diode.Diode) and name == min(names[id(value)], key=len):
+            parts.append(part(name, value))
+            known[name] = value
+    if dig is None:
+        dig = sorted(glob.glob(os.path.join(digDir, "*.dig")))
+    curves = [(filename, read_dig(filename)) for filename in dig]
+    curves += [(filename, diode.Diode(VIfn=filename).VI) for filename in csv]
+    for filename, VI in curves:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        match = [d for d in known.values() if d.MFRnum and d.MFRnum.replace("/", "-") in name]
+        match = match or [d for short, d in known.items() if name.split()[0] == short]
+        if match:
+            entry = part(name, match[0])
+            entry["VI"] = VI
+        else:
+            entry = dict(name=name, MFRnum="", DKnum="", hex="", lam=float('nan'), If=np.max(VI[:, 1]),
+                         Vf=np.max(VI[:, 0]), Ifmax=np.max(VI[:, 1]), Vfmax=np.max(VI[:, 0]),
+                         cd=float('nan'), VI=VI)
+        parts.append(entry)
+    return parts
+
+
+def check_curve(name: str, VI):
+    """
+    Make sure a curve can be interpolated both ways, as Diode.Iv() and Diode.Vi() do
+
+    :raises ValueError: If V or I ever decreases
+    """
+    VI = np.asarray(VI, dtype=float).reshape(-1, 2)
+    for column, quantity in ((0, "voltage"), (1, "current")):
+        if np.any(np.diff(VI[:, column]) < 0):
+            raise ValueError(f"Curve of {name} has decreasing {quantity}, so it can't be interpolated")
+
+
+def build(parts: list, filename: str = defaultLibrary):
+    """
+    Write a library file
+
+    :param parts: Parts from sources()
+    :raises ValueError: If a curve isn't monotonic, or a name doesn't fit its field
+    """
+    for entry in parts:
+        check_curve(entry["name"], entry["VI"])
+    table = np.zeros(len(parts), dtype=recordType)
+    start = 0
+    for record, entry in zip(table, parts):
+        for field in recordType.names:
+            if field in ("start", "count"):
+                continue
+            value = entry[field]
+            if isinstance(value, str):
+                value = value.encode()
+                if len(value) > recordType[field].itemsize:
+                    raise ValueError(f"{field} {value!r} of {entry['name']} is too long for the library")
+            record[field] = value
+        record["start"] = start
+        record["count"] = len(entry["VI"])
+        start += len(entry["VI"])
+    curves = np.concatenate([np.asarray(entry["VI"], dtype="<f8").reshape(-1, 2) for entry in parts]) \
+        if parts else np.zeros((0, 2), dtype="<f8")
+    tableOffset = align(struct.calcsize(headerFormat))
+    curveOffset = align(tableOffset + table.nbytes)
+    # Write to the side and rename, so a process mapping the old library never sees a partial file
+    temp = filename + ".tmp"
+    with open(temp, "wb") as ouf:
+        ouf.write(struct.pack(headerFormat, magic, version, len(parts), tableOffset, curveOffset))
+        ouf.write(b"\0" * (tableOffset - ouf.tell()))
+        ouf.write(table.tobytes())
+        ouf.write(b"\0" * (curveOffset - ouf.tell()))
+        ouf.write(curves.tobytes())
+    os.replace(temp, filename)
+
+
+class Library:
+    """
+    Memory mapped part library. Index by part name or manufacturer number to get a Diode.
+
+    :param filename: Library file from build()
+    """
+    def __init__(self, filename: str = defaultLibrary):
+        self.filename = filename
+        self.data = np.memmap(filename, dtype=np.uint8, mode="r")
+        head = struct.calcsize(headerFormat)
+        if len(self.data) < head:
+            raise ValueError(f"{filename} is not a part library")
+        fileMagic, fileVersion, count, tableOffset, curveOffset = struct.unpack(headerFormat, self.data[:head])
+        if fileMagic != magic:
+            raise ValueError(f"{filename} is not a part library")
+        if fileVersion != version:
+            raise ValueError(f"{filename} is library version {fileVersion}, expected {version}. Rebuild it.")
+        self.table = self.data[tableOffset:tableOffset + count * recordType.itemsize].view(recordType)
+        self.curves = self.data[curveOffset:].view("<f8").reshape(-1, 2)
+        # Part names win over manufacturer numbers, when the two clash
+        self.index = {}
+        for i, MFRnum in enumerate(self.table["MFRnum"].tolist()):
+            self.index.setdefault(MFRnum.decode(), i)
+        for i, name in enumerate(self.table["name"].tolist()):
+            self.index[name.decode()] = i
+        self.index.pop("", None)
+        self.diodes = {}
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, name: str):
+        return name in self.index
+
+    def names(self):
+        """
+        Names of all parts, in library order
+        """
+        return [name.decode() for name in self.table["name"].tolist()]
+
+    def __getitem__(self, name: str):
+        """
+        Diode of a part. Its curve is a read-only view into the library.
+
+        :param name: Part name or manufacturer number
+        """
+        i = self.index[name]
+        if i not in self.diodes:
+            record = self.table[i]
+            self.diodes[i] = diode.Diode.view(VI=self.curves[record["start"]:record["start"] + record["count"]],
+                                              MFRnum=record["MFRnum"].decode() or None,
+                                              DKnum=record["DKnum"].decode() or None,
+                                              lam=float(record["lam"]), If=float(record["If"]), Vf=float(record["Vf"]),
+                                              Ifmax=float(record["Ifmax"]), Vfmax=float(record["Vfmax"]),
+                                              cd=float(record["cd"]), hex=record["hex"].decode() or None)
+        return self.diodes[i]
+
+
+_libraries = {}
+
+
+def library(filename: str = defaultLibrary):
+    """
+    The library in a file, opened once per process
+    """
+    if filename not in _libraries:
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"No part library at {filename}, build it with python partlib.py")
+        _libraries[filename] = Library(filename)
+    return _libraries[filename]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='partlib.py')
+    parser.add_argument('-o', '--output', type=str, default=defaultLibrary,
+                        help='Library file to write (default = parts.p23lib next to this script)')
+    parser.add_argument('--csv', nargs='*', default=[], help='Measured curve CSV files to add, V and mA')
+    parser.add_argument('-l', '--list', help='List the parts in the library instead of building it',
+                        action="store_true")
+    args = parser.parse_args()
+    if not args.list:
+        parts = sources(csv=args.csv)
+        build(parts, args.output)
+        print(f"Wrote {len(parts)} parts to {args.output}")
+    lib = Library(args.output)
+    for name in lib.names():
+        d = lib[name]
+        print(f"{name:40} {d.MFRnum or '':20} {d.DKnum or '':14} {d.lam * 1e9:4.0f}nm {d.cd * 1000:5.0f}mcd "
+              f"If={d.If * 1000:.1f}mA Vf={d.Vf:.2f}V {len(d.VI)} points")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,251 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import argparse
-from scipy.optimize import curve_fit
-from scipy.special import lambertw
+import os
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import curve_fit, least_squares
+from scipy.special import lambertw, wrightomega
+
+# Thermal voltage used by all of the diode models, V
+VT = 26e-3
+
+# Bounds for the robust fit, in the (log10(IS), N, log10(RS)) space that func_log() uses
+robust_lo = np.array([-24.0, 0.5, -3.0])
+robust_hi = np.array([ -3.0, 10.0, 4.0])
 
 
 def func(VS, IS, N, RS):
     # Define model for diode (see wikipedia article)
-    VT = 26e-3
     w = lambertw((IS * RS / (N * VT)) * np.exp((VS + IS * RS) / (N * VT)))
     Current = np.log10((IS * ((w * N * VT / (RS * IS)) - 1) * 1000))
     return Current.real
 
 
+def func_log(VS, logIS, N, logRS):
+    """
+    Same model as func(), but with IS and RS given as log10 and evaluated
+    through the Wright omega function, so W(exp(x)) never has to form exp(x).
+    Broadcasts over all arguments, so a whole grid of parameters can be
+    evaluated at once.
+
+    :param VS: Voltage across diode and series resistance, V
+    :param logIS: log10 of saturation current in A
+    :param N: Emission coefficient
+    :param logRS: log10 of ohmic resistance in ohms
+    :return: log10 of current in mA
+    """
+    IS = 10.0 ** logIS
+    RS = 10.0 ** logRS
+    w = wrightomega(np.log(IS * RS / (N * VT)) + (VS + IS * RS) / (N * VT)).real
+    Current = w * N * VT / RS - IS
+    # Current can round to zero or below far below the knee. Clamp it so the
+    # residual is huge but finite, rather than poisoning the solver with nan.
+    return np.log10(np.maximum(Current * 1000, 1e-300))
+
+
+def fit_robust(xdata, logydata, *, maxit=1000, ngrid=(15, 7, 9), nrefine=3, poor=0.25):
+    """
+    Fit the diode model without needing a starting guess.
+
+    A deterministic grid of starting points covering the bounds is scored in
+    a single vectorized evaluation of func_log(), then the best of them is
+    refined with the bounded least-squares solver. The next best are only
+    refined if that fails or leaves a poor fit.
+
+    :param xdata: Voltages, V
+    :param logydata: log10 of currents in mA
+    :param maxit: Maximum number of function evaluations for each refinement
+    :param ngrid: Number of grid points in log10(IS), N, and log10(RS)
+    :param nrefine: Most grid points to refine
+    :param poor: RMS residual in log10(I) above which a fit is poor
+    :return: Tuple of (popt,result). popt is (IS,N,RS) in linear units, result
+             is the scipy.optimize.OptimizeResult of the winning refinement,
+             with nfev counting every evaluation including the grid.
+    """
+    keep = np.isfinite(logydata)
+    xdata = xdata[keep]
+    logydata = logydata[keep]
+    # Stay a little inside the bounds so the solver can move both ways
+    margin = 0.05 * (robust_hi - robust_lo)
+    axes = [np.linspace(lo, hi, n) for lo, hi, n in zip(robust_lo + margin, robust_hi - margin, ngrid)]
+    grid = np.stack([g.ravel() for g in np.meshgrid(*axes, indexing='ij')], axis=1)
+    pred = func_log(xdata[None, :], grid[:, 0:1], grid[:, 1:2], grid[:, 2:3])
+    sse = np.sum((pred - logydata[None, :]) ** 2, axis=1)
+    sse[~np.isfinite(sse)] = np.inf
+    best = None
+    nfev = grid.shape[0]
+    for i_start in np.argsort(sse)[:nrefine]:
+        result = least_squares(lambda p: func_log(xdata, *p) - logydata, grid[i_start],
+                               bounds=(robust_lo, robust_hi), max_nfev=maxit)
+        nfev += result.nfev
+        if best is None or result.cost < best.cost:
+            best = result
+        if best.success and np.sqrt(2 * best.cost / len(xdata)) <= poor:
+            break
+    best.nfev = nfev
+    popt = np.array([10.0 ** best.x[0], best.x[1], 10.0 ** best.x[2]])
+    return popt, best
+
+
+def _bootstrap_chunk(xdata, logydata, x0, nfits, seed, maxit):
+    """
+    Refit nfits resampled copies of the data, warm-started from x0. Runs in
+    a worker process, so it has to be a module-level function.
+
+    :return: nfits x 3 array of (log10(IS),N,log10(RS)), nan where a refit failed
+    """
+    rng = np.random.default_rng(seed)
+    out = np.full((nfits, 3), np.nan)
+    for i_fit in range(nfits):
+        pick = rng.integers(0, len(xdata), len(xdata))
+        x = xdata[pick]
+        y = logydata[pick]
+        result = least_squares(lambda p: func_log(x, *p) - y, x0,
+                               bounds=(robust_lo, robust_hi), max_nfev=maxit)
+        if result.success:
+            out[i_fit] = result.x
+    return out
+
+
+def bootstrap(xdata, logydata, popt, *, nboot=1000, seed=0, workers=None, maxit=1000, ci=95.0):
+    """
+    Bootstrap confidence intervals for a fit.
+
+    Each resample draws the data points with replacement and refits from the
+    nominal fit popt. The refits are split into one chunk per worker and run
+    in a process pool, each chunk with its own independent seed spawned from
+    seed, so results are repeatable for a given seed and worker count.
+
+    :param xdata: Voltages, V
+    :param logydata: log10 of currents in mA
+    :param popt: Nominal fit (IS,N,RS) in linear units
+    :param nboot: Number of bootstrap refits
+    :param seed: Seed for the resampling
+    :param workers: Number of worker processes, default is one per CPU
+    :param maxit: Maximum number of function evaluations for each refit
+    :param ci: Width of the confidence interval in percent
+    :raises RuntimeError: If no refit succeeded
+    :return: Tuple of (lo,hi,corr,samples). lo and hi are the percentile
+             interval of (IS,N,RS) in linear units, corr is the 3x3 correlation
+             matrix of (log10(IS),N,log10(RS)), NaN for any parameter that
+             was the same in every refit, and samples holds all successful
+             refits in that same log space.
+    """
+    keep = np.isfinite(logydata)
+    xdata = xdata[keep]
+    logydata = logydata[keep]
+    # A fit outside the bounds, IE with a negative IS or RS, has no log. Start
+    # those parameters from the middle of the bounds instead.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x0 = np.array([np.log10(popt[0]), popt[1], np.log10(popt[2])], dtype=float)
+    x0 = np.clip(np.where(np.isfinite(x0), x0, (robust_lo + robust_hi) / 2), robust_lo, robust_hi)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, nboot))
+    counts = [nboot // workers + (1 if i < nboot % workers else 0) for i in range(workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = pool.map(_bootstrap_chunk, [xdata] * workers, [logydata] * workers, [x0] * workers,
+                          counts, seeds, [maxit] * workers)
+        samples = np.concatenate(list(chunks))
+    samples = samples[np.all(np.isfinite(samples), axis=1)]
+    if len(samples) == 0:
+        raise RuntimeError(f"None of the {nboot} bootstrap refits succeeded")
+    lo, hi = np.percentile(samples, [50 - ci / 2, 50 + ci / 2], axis=0)
+    # A parameter that comes out the same in every refit, IE held at a bound, has no
+    # spread and so no correlation. np.corrcoef() would warn and make the whole matrix NaN.
+    vary = np.ptp(samples, axis=0) > 0
+    corr = np.full((3, 3), np.nan)
+    if np.any(vary):
+        corr[np.ix_(vary, vary)] = np.corrcoef(samples[:, vary], rowvar=False)
+    lo = np.array([10.0 ** lo[0], lo[1], 10.0 ** lo[2]])
+    hi = np.array([10.0 ** hi[0], hi[1], 10.0 ** hi[2]])
+    return lo, hi, corr, samples
+
+
+def bootstrap_report(args, xdata, logydata, popt):
+    """
+    Print the bootstrap intervals requested on the command line, if any
+    """
+    if args.bootstrap is None:
+        return
+    try:
+        lo, hi, corr, samples = bootstrap(xdata, logydata, popt, nboot=args.bootstrap, seed=args.seed,
+                                          workers=args.workers, maxit=args.maxit, ci=args.ci)
+    except RuntimeError as e:
+        print(f"Error - {e}")
+        return
+    print(f"\nBootstrap: {len(samples)} of {args.bootstrap} refits succeeded, {args.ci:g}% intervals")
+    for name, p, l, h in zip(("IS", "N", "RS"), popt, lo, hi):
+        print(f"{name} = {p:.6g} [{l:.6g}, {h:.6g}]")
+    print("Correlation of (log10(IS), N, log10(RS))")
+    for row in corr:
+        print(" ".join(f"{c:7.4f}" for c in row))
+    for name, spread in zip(("log10(IS)", "N", "log10(RS)"), np.ptp(samples, axis=0)):
+        if spread == 0:
+            print(f"{name} is the same in every refit, so it has no spread and no correlation")
+
+
+def dc_solve(Vsupply, IS, N, RS, *, Rseries=0.0, Rdrive=0.0):
+    """
+    Solve DC operating points of a diode in series with a resistor, driven
+    from a supply through a driver with nonzero output resistance.
+
+    All series resistances lump together with the diode's own RS, so the
+    current has the same closed-form Lambert W solution as func(). Every
+    argument broadcasts, so a whole array of supplies, resistors, and drivers
+    (or fitted devices) is solved in one call.
+
+    :param Vsupply: Supply voltage, V
+    :param IS: Saturation current, A
+    :param N: Emission coefficient
+    :param RS: Ohmic resistance of the diode, ohms
+    :param Rseries: External series resistance, ohms
+    :param Rdrive: Output resistance of the driver, ohms
+    :return: Tuple of (I,Vd). I is current in A, Vd is voltage across the
+             diode terminals (including its RS) in V.
+    """
+    Vsupply, IS, N, RS, Rseries, Rdrive = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                                                (Vsupply, IS, N, RS, Rseries, Rdrive)])
+    Rtot = RS + Rseries + Rdrive
+    nvt = N * VT
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = wrightomega(np.log(IS * Rtot / nvt) + (Vsupply + IS * Rtot) / nvt).real
+        I = np.where(Rtot > 0, w * nvt / Rtot - IS, IS * np.expm1(Vsupply / nvt))
+    Vd = Vsupply - I * (Rseries + Rdrive)
+    return I, Vd
+
+
+def model_card(name, IS, N, RS):
+    """
+    Format fitted parameters as a SPICE diode .model card
+
+    :param name: Model name
+    :return: String with the .model line
+    """
+    return f".model {name} D(IS={IS:.6g} N={N:.6g} RS={RS:.6g})"
+
+
+def dc_report(args, IS, N, RS):
+    """
+    Print the .model card and DC sweep requested on the command line, if any
+    """
+    if args.model is not None:
+        print(model_card(args.model, IS, N, RS))
+    if args.sweep is not None:
+        vMin, vMax, nSteps = args.sweep
+        Vsupply = np.linspace(vMin, vMax, int(nSteps))
+        Rseries = np.array(args.rseries)
+        I, Vd = dc_solve(Vsupply[:, None], IS, N, RS, Rseries=Rseries[None, :], Rdrive=args.rdrive)
+        print("Vsupply/V," + ",".join(f"I(R={r:g})/mA,Vd(R={r:g})/V" for r in Rseries))
+        for i_v, v in enumerate(Vsupply):
+            print(f"{v:.4f}," + ",".join(f"{i * 1000:.4f},{vd:.4f}" for i, vd in zip(I[i_v], Vd[i_v])))
+
+
 def plot(xdata, ydata, nPoints, IS, N, RS):
     # generate a points to plot
     vMin = xdata[0]
-    vMax = xdata[len(xdata) - 1],
+    vMax = xdata[len(xdata) - 1]
     vRange = vMax - vMin
     vMin = vMin - 0.1 * vRange
     vMax = vMax + 0.1 * vRange
@@ -53,6 +282,23 @@ def main():
                         help='Initial guess at ohmic resistance (default = 10 ohm)')
     parser.add_argument('-m', '--maxit', type=int, default=1000, help='Maximum number of iterations (default = 1000)')
     parser.add_argument('-n', '--npoints', type=int, default=250, help='Number of points in plot (default = 250)')
+    parser.add_argument('-r', '--robust', help='Bounded multi-start fit, no starting guess needed',
+                        action="store_true")
+    parser.add_argument('--model', type=str, default=None,
+                        help='Print a SPICE .model card with this name for the fitted parameters')
+    parser.add_argument('--sweep', type=float, nargs=3, default=None, metavar=('VMIN', 'VMAX', 'NSTEPS'),
+                        help='Solve DC operating points over this supply sweep with the fitted parameters')
+    parser.add_argument('--rseries', type=float, nargs='+', default=[0.0],
+                        help='Series resistance(s) for --sweep (default = 0 ohm)')
+    parser.add_argument('--rdrive', type=float, default=0.0,
+                        help='Driver output resistance for --sweep (default = 0 ohm)')
+    parser.add_argument('-b', '--bootstrap', type=int, default=None, metavar='NBOOT',
+                        help='Bootstrap confidence intervals from this many resampled refits')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for bootstrap resampling (default = 0)')
+    parser.add_argument('--ci', type=float, default=95.0,
+                        help='Width of the bootstrap confidence intervals in percent (default = 95)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of bootstrap worker processes (default = one per CPU)')
     parser.add_argument('-s', '--save', help='Save fit parameters to file', action="store_true")
     parser.add_argument('-f', '--fitfile', type=str, default="", nargs='?',
                         help='Load fit parameters from specified file')
@@ -67,7 +313,7 @@ def main():
             line=line.strip()
             parts=line.split(",")
             xdata.append(float(parts[0]))
-            ydata.append(float(parts[0]))
+            ydata.append(float(parts[1]))
     #xdata, ydata = np.loadtxt(args.filename, unpack=True)
     xdata=np.array(xdata)
     ydata=np.array(ydata)
@@ -103,6 +349,7 @@ def main():
             print("I/O error({0}): {1}".format(e.errno, e.strerror))
 
     if args.plot:
+        dc_report(args, params['IS'], params['N'], params['RS'])
         try:
             # Plot data and initial guess
             print("Plotting characteristic with following parameters" +
@@ -111,6 +358,25 @@ def main():
         except:
             print("Plotting error")
             exit()
+    elif args.robust:
+        # Multi-start bounded fit. Initial guess and fit file are not used.
+        popt, result = fit_robust(xdata, logydata, maxit=args.maxit)
+        print("Robust fit " + ("converged" if result.success else "stopped") + " in " + str(result.nfev) +
+              " evaluations with the following parameters")
+        printString = "IS = " + str(popt[0]) + "\nN = " + str(popt[1]) + "\nRS = " + str(popt[2])
+        print(printString)
+        if args.save:
+            print("\nWriting fit parameters to file")
+            outFile = args.filename.split('.')[0] + ".fit"
+            try:
+                fh = open(outFile, "w")
+                fh.write(printString)
+                fh.close()
+            except IOError as e:
+                print("I/O error({0}): {1}".format(e.errno, e.strerror))
+        bootstrap_report(args, xdata, logydata, popt)
+        dc_report(args, popt[0], popt[1], popt[2])
+        plot(xdata, ydata, args.npoints, popt[0], popt[1], popt[2])
     else:
         # Perform non-linear least squares fit
         try:
@@ -134,6 +400,9 @@ def main():
                 except IOError as e:
                     print("I/O error({0}): {1}".format(e.errno, e.strerror))
 
+            bootstrap_report(args, xdata, logydata, popt)
+            dc_report(args, popt[0], popt[1], popt[2])
+
             # generate a plot of the fit
             plot(xdata, ydata, args.npoints, popt[0], popt[1], popt[2])
 